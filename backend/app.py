@@ -1,16 +1,36 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, g, current_app
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import (
-    JWTManager, create_access_token, jwt_required, get_jwt_identity,
+    JWTManager, create_access_token, verify_jwt_in_request, get_jwt_identity,
     set_access_cookies, unset_jwt_cookies
 )
-import joblib
-import numpy as np
 import os
-from datetime import timedelta, datetime
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import wraps
+from datetime import timedelta, datetime, timezone
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
 from remedies_data import remedies_data
+from inference import InferenceExecutor, InferenceTimeout, MicroBatcher, BatcherBusy
+from model_registry import ModelRegistry
+from skin_worker_pool import SkinPoolClient, PoolBusy, PoolError
+from skin_cache import SkinResultCache, SKIN_CACHE_SIZE
+from migrations import upgrade as upgrade_database, backfill_prediction_symptoms
+from symptom_encoding import (SymptomVocabulary, SYMPTOM_MASK_BITS, SYMPTOM_NAME_LENGTH, MASK_OVERFLOW,
+                              encode_mask, decode_mask)
+from write_behind import WriteBehindQueue
+from password_hashing import PasswordHasher, HasherBusy, default_threads
+from places_client import PlacesClient, PlacesError, PLACES_BASE_URL
+from doctor_directory import DoctorDirectory
+from sos_dispatcher import SOSDispatcher, SMSChannel, EmailChannel, LogChannel
+from metrics import registry, span, record, current_timings, server_timing
 from dotenv import load_dotenv
 # from skin_model_loader import SkinDiseaseModel
 from werkzeug.utils import secure_filename
@@ -33,9 +53,85 @@ app.config['JWT_ACCESS_COOKIE_PATH'] = '/'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
 app.config['JWT_COOKIE_SAMESITE'] = 'None' if os.environ.get('FLASK_ENV') == 'production' else 'Lax'
 
+# Request timing (metrics.py): named spans of each request are sent back in a
+# Server-Timing header and, with per-route latency and status counts, kept for /metrics
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    current_timings.set({})
+
+@app.after_request
+def record_request_timing(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    total = time.perf_counter() - start
+    # The URL rule, not the path, so /history/<int:id> is one series
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    response.headers['Server-Timing'] = server_timing(current_timings.get() or {}, total)
+    current_timings.set(None)
+    registry.observe('healix_http_request_duration_seconds', total, route=route, method=request.method)
+    registry.inc('healix_http_requests_total', route=route, method=request.method, status=response.status_code)
+    if response.status_code >= 500:
+        registry.inc('healix_http_errors_total', route=route, method=request.method, status=response.status_code)
+    return response
+
+def jwt_required(**options):
+    # flask_jwt_extended's jwt_required, with the token check timed as the 'auth' span
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            with span('auth'):
+                verify_jwt_in_request(**options)
+            return current_app.ensure_sync(fn)(*args, **kwargs)
+        return decorator
+    return wrapper
+
+class TimedJSONProvider(DefaultJSONProvider):
+    # Every jsonify() response is timed as the 'serialize' span
+    def response(self, *args, **kwargs):
+        with span('serialize'):
+            return super().response(*args, **kwargs)
+
+app.json = TimedJSONProvider(app)
+
+# Every SQL statement is timed as the 'db' span and every session commit (flush
+# included) as 'commit'; outside a request (write-behind thread) they only feed /metrics
+# The start time lives on the statement's execution context, so a statement that raises
+# (and never reaches after_cursor_execute) leaves nothing behind on the connection
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.healix_query_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'healix_query_start', None)
+    if start is not None:
+        record('db', time.perf_counter() - start)
+
+@event.listens_for(Session, 'before_commit')
+def start_commit_timer(session):
+    session.info['commit_start'] = time.perf_counter()
+
+@event.listens_for(Session, 'after_commit')
+def record_commit_time(session):
+    start = session.info.pop('commit_start', None)
+    if start is not None:
+        record('commit', time.perf_counter() - start)
+
 # Extensions
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
+# Password hashing on a bounded pool with a configurable cost, see password_hashing.py
+hash_threads = int(os.environ.get('AUTH_HASH_THREADS', default_threads(int(os.environ.get('WEB_CONCURRENCY', 1)))))
+password_hasher = PasswordHasher(
+    bcrypt,
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', 12)),
+    max_workers=hash_threads,
+    max_pending=int(os.environ.get('AUTH_HASH_MAX_PENDING', 2 * hash_threads)),
+    queue_timeout=float(os.environ.get('AUTH_HASH_QUEUE_MS', 2000)) / 1000
+)
 jwt = JWTManager(app)
 
 # CORS Configuration
@@ -55,7 +151,23 @@ class Prediction(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     disease = db.Column(db.String(100), nullable=False)
     date = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
-    symptoms = db.Column(db.Text, nullable=False) # Storing as comma-separated string
+    # Symptoms as submitted, comma-separated; reads use symptom_mask (symptom_encoding.py)
+    symptoms = db.deferred(db.Column(db.Text, nullable=False))
+    symptom_mask = db.Column(db.BigInteger)
+    # One user's rows newest first, for the keyset-paginated history (history_page)
+    __table_args__ = (db.Index('ix_prediction_user_date', user_id, date.desc(), id.desc()),)
+
+class Symptom(db.Model):
+    # Permanent symptom ids: bit positions of Prediction.symptom_mask
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(SYMPTOM_NAME_LENGTH), nullable=False, unique=True)
+
+prediction_symptom = db.Table(
+    'prediction_symptom',
+    db.Column('prediction_id', db.Integer, db.ForeignKey('prediction.id'), primary_key=True),
+    db.Column('symptom_id', db.Integer, db.ForeignKey('symptom.id'), primary_key=True),
+    db.Index('ix_prediction_symptom_symptom', 'symptom_id', 'prediction_id')
+)
 
 class DietPlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -63,6 +175,7 @@ class DietPlan(db.Model):
     date = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     plan_data = db.Column(db.Text, nullable=False) # JSON string of the plan
     goal = db.Column(db.String(50), nullable=False)
+    __table_args__ = (db.Index('ix_diet_plan_user_date', user_id, date.desc(), id.desc()),)
 
 class ExerciseLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -71,6 +184,7 @@ class ExerciseLog(db.Model):
     exercise_type = db.Column(db.String(100), nullable=False)
     duration_minutes = db.Column(db.Integer, nullable=False)
     calories_burnt = db.Column(db.Integer, nullable=False)
+    __table_args__ = (db.Index('ix_exercise_log_user_date', user_id, date.desc(), id.desc()),)
 
 class UserProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -89,6 +203,21 @@ class SkinAnalysisLog(db.Model):
     condition_name = db.Column(db.String(100), nullable=False)
     probability = db.Column(db.Float, nullable=False)
     image_path = db.Column(db.String(200)) # Optional: store path if we were saving images
+    from_cache = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    __table_args__ = (db.Index('ix_skin_analysis_log_user_date', user_id, date.desc(), id.desc()),)
+
+class Doctor(db.Model):
+    # Offline provider directory (doctor_directory.py), imported from CSV
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    specialty = db.Column(db.String(100), nullable=False) # normalized: lower case, single spaces
+    address = db.Column(db.String(300), nullable=False, default='')
+    city = db.Column(db.String(100), nullable=False, default='') # normalized like specialty
+    phone = db.Column(db.String(40))
+    lat = db.Column(db.Float, nullable=False)
+    lng = db.Column(db.Float, nullable=False)
+    hours = db.Column(db.String(200))
+    rating = db.Column(db.Float)
 
 class EmergencyContact(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -97,13 +226,38 @@ class EmergencyContact(db.Model):
     phone = db.Column(db.String(20), nullable=False)
     email = db.Column(db.String(120))
 
+class SosEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    deliveries = db.Column(db.Integer, nullable=False, default=0) # alerts queued
+
+class SosDelivery(db.Model):
+    # One row per delivery attempt of an SOS alert (sos_dispatcher.py)
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('sos_event.id'), nullable=False, index=True)
+    contact_id = db.Column(db.Integer) # no foreign key: the contact may be deleted later
+    channel = db.Column(db.String(10), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    attempt = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(10), nullable=False) # sent / failed
+    error = db.Column(db.String(500))
+    latency_ms = db.Column(db.Float)
+    date = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
 # ... (Load models section)
 
 # ... (Auth routes)
 
 @app.route('/', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'message': 'Healix Backend is running!'})
+    return jsonify({
+        'status': 'healthy',
+        'message': 'Healix Backend is running!',
+        'model_version': model_registry.version
+    })
 
 @app.route('/generate-diet', methods=['POST'])
 @jwt_required()
@@ -187,32 +341,248 @@ def generate_diet():
     import json
     try:
         current_user_id = get_jwt_identity()
-        new_plan = DietPlan(
-            user_id=int(current_user_id),
-            plan_data=json.dumps(plan),
-            goal=goal
-        )
-        db.session.add(new_plan)
-        db.session.commit()
+        audit_writer.put(('diet', {
+            'user_id': int(current_user_id),
+            'date': utc_now(),
+            'plan_data': json.dumps(plan),
+            'goal': goal
+        }))
     except Exception as e:
         print(f"Error saving diet plan: {e}")
         
     return jsonify(plan)
-try:
-    models = joblib.load('models/disease_prediction_models.pkl')
-    symptoms_list = joblib.load('models/symptoms_list.pkl')
+# Run the models concurrently on a pool shared by all requests; models that miss
+# the deadline are dropped from the vote. INFERENCE_THREADS=0 runs them in sequence.
+inference_executor = None
+if int(os.environ.get('INFERENCE_THREADS', 4)) > 0:
+    inference_executor = InferenceExecutor(
+        int(os.environ.get('INFERENCE_THREADS', 4)),
+        float(os.environ.get('INFERENCE_DEADLINE_MS', 1000)) / 1000
+    )
+
+def configure_ensemble(ensemble):
+    # Cascade mode: only escalate to the other models when the first one is unsure
+    # (thresholds picked with evaluate_cascade.py)
+    if os.environ.get('PREDICT_MODE', 'full') == 'cascade':
+        ensemble.set_cascade(
+            os.environ.get('CASCADE_ORDER', 'SVC,NaiveBayes,RandomForest').split(','),
+            float(os.environ.get('CASCADE_MIN_CONFIDENCE', 0.7)),
+            float(os.environ.get('CASCADE_MIN_MARGIN', 0.2))
+        )
+    ensemble.executor = inference_executor
+
+# Versioned models with hot reload: each worker polls models/versions/ and swaps in
+# newer versions once they pass a smoke test. Flat NumPy kernels (export_numpy_models.py)
+# are used instead of the sklearn pickle when present, USE_NUMPY_KERNELS=0 turns that off.
+model_registry = ModelRegistry(
+    'models',
+    configure=configure_ensemble,
+    poll_interval=float(os.environ.get('MODEL_POLL_SECONDS', 30)),
+    use_kernels=os.environ.get('USE_NUMPY_KERNELS', '1') == '1',
+    pinned_version=os.environ.get('MODEL_VERSION')
+)
+if model_registry.load_initial():
     print("Models loaded successfully.")
-except Exception as e:
-    print(f"Error loading models: {e}")
-    models = None
-    symptoms_list = []
 
-# Initialize Skin Model
-skin_model = SkinDiseaseModel()
+@app.before_request
+def start_model_watcher():
+    # Started lazily so that preloaded gunicorn workers each get their own watcher thread
+    model_registry.start_watching()
 
-# Initialize DB
-with app.app_context():
+# Initialize Skin Model (disabled along with the TensorFlow import above, /predict-skin returns a mock)
+# skin_model = SkinDiseaseModel()
+# SKIN_MODEL=1 enables it. SKIN_BACKEND picks keras (needs TensorFlow) or an export from
+# export_skin_model.py served by onnx (onnxruntime) / tflite (ai-edge-litert), see
+# skin_model_loader.py. Concurrent requests are grouped into one forward pass of up to
+# SKIN_MAX_BATCH images, waiting at most SKIN_MAX_WAIT_MS.
+# With SKIN_POOL_WORKERS > 0 the model runs instead in a separate pool of that many
+# processes (skin_worker_pool.py, started by gunicorn.conf.py) and web workers only decode.
+SKIN_MODEL_ENABLED = os.environ.get('SKIN_MODEL') == '1'
+SKIN_TIMEOUT = float(os.environ.get('SKIN_TIMEOUT_MS', 10000)) / 1000
+SKIN_POOL_ENABLED = int(os.environ.get('SKIN_POOL_WORKERS', 0)) > 0
+skin_pool = SkinPoolClient(slots=int(os.environ.get('SKIN_POOL_SLOTS', 8))) if SKIN_POOL_ENABLED else None
+# Repeat uploads (same bytes, or a near-identical re-encode) are answered from
+# skin_cache.py without inference; SKIN_CACHE_SIZE=0 turns the cache off
+skin_cache = SkinResultCache() if SKIN_CACHE_SIZE > 0 else None
+skin_model = None
+skin_batcher = None
+skin_model_lock = threading.Lock()
+
+def get_skin_model():
+    # Loaded on first use in each worker: TensorFlow state does not survive a fork
+    global skin_model, skin_batcher
+    with skin_model_lock:
+        if skin_model is None:
+            from skin_model_loader import SkinDiseaseModel
+            skin_model = SkinDiseaseModel()
+            skin_batcher = MicroBatcher(
+                skin_model.predict_batch,
+                max_batch_size=int(os.environ.get('SKIN_MAX_BATCH', 16)),
+                max_wait=float(os.environ.get('SKIN_MAX_WAIT_MS', 5)) / 1000
+            )
+    return skin_model, skin_batcher
+
+def skin_model_version():
+    # Cached results are only reused for the model version that produced them
+    from skin_model_loader import model_version
+    return model_version()
+
+# Per-process caches of the symptom and doctor tables. The vocabulary reloads itself
+# when it meets a name or id it has not seen.
+symptom_vocabulary = SymptomVocabulary(db, Symptom)
+doctor_directory = DoctorDirectory(db, Doctor)
+
+def prepare_database():
+    # Creates and upgrades the schema, seeds the symptom vocabulary and backfills symptom
+    # masks. Not run on import, where every web worker would race the others: gunicorn
+    # runs it once before starting workers (on_starting in gunicorn.conf.py), and
+    # `python migrations.py` runs it on its own. Call inside an app context.
     db.create_all()
+    upgrade_database(db)
+    symptom_vocabulary.reload()
+    if model_registry.current:
+        symptom_vocabulary.add(model_registry.current.symptoms_list)
+        backfill_prediction_symptoms(db, Prediction, prediction_symptom, symptom_vocabulary)
+    doctor_directory.reload()
+
+# Built before gunicorn forks (preload), so workers share one copy of the index. On a
+# database that prepare_database() has not set up yet it stays empty until it has.
+with app.app_context():
+    if db.inspect(db.engine).has_table(Doctor.__tablename__):
+        doctor_directory.reload()
+
+def utc_now():
+    # Row timestamps are set when the request is handled, not when the write-behind
+    # queue flushes; UTC, like SQLite's CURRENT_TIMESTAMP default
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def valid_symptom_list(symptoms):
+    # Every submitted name is stored in the symptom table (symptom_encoding.py)
+    return isinstance(symptoms, list) and all(
+        isinstance(name, str) and len(name) <= SYMPTOM_NAME_LENGTH for name in symptoms
+    )
+
+def prediction_records(user_id, diseases, symptom_sets):
+    # Rows for insert_predictions(), with the symptoms encoded against the vocabulary
+    date = utc_now()
+    return [{
+        'user_id': user_id,
+        'disease': disease,
+        'date': date,
+        'symptoms': ",".join(symptoms),
+        'symptom_ids': symptom_vocabulary.encode(symptoms)
+    } for disease, symptoms in zip(diseases, symptom_sets)]
+
+def insert_predictions(records):
+    # Prediction rows with their symptom mask and prediction_symptom links; caller commits
+    predictions = [
+        Prediction(user_id=entry['user_id'], disease=entry['disease'], date=entry['date'],
+                   symptoms=entry['symptoms'], symptom_mask=encode_mask(entry['symptom_ids']))
+        for entry in records
+    ]
+    db.session.add_all(predictions)
+    db.session.flush()  # assigns the ids, one multi-row INSERT ... RETURNING where supported
+    links = [{'prediction_id': prediction.id, 'symptom_id': symptom_id}
+             for prediction, entry in zip(predictions, records) for symptom_id in entry['symptom_ids']]
+    if links:
+        db.session.execute(prediction_symptom.insert(), links)
+    return predictions
+
+def add_predictions(user_id, diseases, symptom_sets):
+    return insert_predictions(prediction_records(user_id, diseases, symptom_sets))
+
+def write_audit_records(batch):
+    # One transaction per flush of the write-behind queue, one bulk INSERT per table
+    with app.app_context():
+        try:
+            predictions = [row for kind, row in batch if kind == 'prediction']
+            if predictions:
+                insert_predictions(predictions)
+            for kind, model in (('skin', SkinAnalysisLog), ('diet', DietPlan), ('sos', SosDelivery)):
+                rows = [row for row_kind, row in batch if row_kind == kind]
+                if rows:
+                    db.session.execute(db.insert(model), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+# Prediction, skin analysis and diet plan rows are written behind the response, in batches
+# of up to AUDIT_FLUSH_ROWS or after AUDIT_FLUSH_MS (write_behind.py). AUDIT_WRITE_MODE=sync
+# writes them before responding instead, for tests that read their own writes.
+audit_writer = WriteBehindQueue(
+    write_audit_records,
+    max_batch=int(os.environ.get('AUDIT_FLUSH_ROWS', 500)),
+    max_delay=float(os.environ.get('AUDIT_FLUSH_MS', 200)) / 1000,
+    max_queue=int(os.environ.get('AUDIT_MAX_QUEUE', 10000)),
+    mode=os.environ.get('AUDIT_WRITE_MODE', 'async'),
+    # Locked or unreachable database: keep the rows and retry
+    is_transient=lambda error: isinstance(error, OperationalError)
+)
+
+# SOS alerts go out on their own pool, SOS_THREADS per worker process (sos_dispatcher.py);
+# delivery attempts are stored through the write-behind queue
+def sos_channels():
+    channels = []
+    if os.environ.get('SOS_SMS_URL'):
+        channels.append(SMSChannel(
+            os.environ['SOS_SMS_URL'],
+            token=os.environ.get('SOS_SMS_TOKEN'),
+            timeout=float(os.environ.get('SOS_SMS_TIMEOUT_MS', 3000)) / 1000,
+            retries=int(os.environ.get('SOS_SMS_RETRIES', 2))
+        ))
+    if os.environ.get('SOS_SMTP_HOST'):
+        channels.append(EmailChannel(
+            os.environ['SOS_SMTP_HOST'],
+            port=int(os.environ.get('SOS_SMTP_PORT', 25)),
+            sender=os.environ.get('SOS_EMAIL_FROM', 'sos@healix.app'),
+            username=os.environ.get('SOS_SMTP_USER'),
+            password=os.environ.get('SOS_SMTP_PASSWORD'),
+            starttls=os.environ.get('SOS_SMTP_STARTTLS') == '1',
+            timeout=float(os.environ.get('SOS_EMAIL_TIMEOUT_MS', 5000)) / 1000,
+            retries=int(os.environ.get('SOS_EMAIL_RETRIES', 2))
+        ))
+    return channels or [LogChannel()]
+
+sos_dispatcher = SOSDispatcher(
+    sos_channels(),
+    record=lambda attempt: audit_writer.put(('sos', dict(attempt, date=utc_now()))),
+    max_workers=int(os.environ.get('SOS_THREADS', 16)),
+    first_delivery_target=float(os.environ.get('SOS_FIRST_DELIVERY_TARGET_MS', 1000)) / 1000
+)
+
+def prediction_symptoms(predictions):
+    # Symptom names per prediction, decoded from symptom_mask through the cached vocabulary.
+    # Masks too wide to store (MASK_OVERFLOW) are read from prediction_symptom in one query,
+    # and rows the backfill has not reached yet (NULL) from the submitted text. Every
+    # submitted name is in the vocabulary, but decoded names come in vocabulary order,
+    # each once, not in the order they were submitted.
+    linked = {}
+    overflow = [prediction.id for prediction in predictions if prediction.symptom_mask == MASK_OVERFLOW]
+    if overflow:
+        rows = db.session.execute(
+            db.select(prediction_symptom.c.prediction_id, prediction_symptom.c.symptom_id)
+            .where(prediction_symptom.c.prediction_id.in_(overflow))
+            .order_by(prediction_symptom.c.symptom_id)
+        )
+        for prediction_id, symptom_id in rows:
+            linked.setdefault(prediction_id, []).append(symptom_id)
+
+    names = []
+    for prediction in predictions:
+        if prediction.symptom_mask is None:
+            names.append(prediction.symptoms.split(',') if prediction.symptoms else [])
+        elif prediction.symptom_mask == MASK_OVERFLOW:
+            names.append(symptom_vocabulary.names_for(linked.get(prediction.id, [])))
+        else:
+            names.append(symptom_vocabulary.names_for(decode_mask(prediction.symptom_mask)))
+    return names
+
+def auth_busy():
+    # Password hashing pool saturated (login burst): fail fast, the client retries
+    response = jsonify({'error': 'Too many sign-in attempts right now, try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 # Auth Routes
 @app.route('/auth/register', methods=['POST'])
@@ -227,7 +597,10 @@ def register():
     if User.query.filter_by(username=username).first():
         return jsonify({'error': 'Username already exists'}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(password)
+    except (HasherBusy, FutureTimeoutError):
+        return auth_busy()
     new_user = User(username=username, password=hashed_password)
     db.session.add(new_user)
     db.session.commit()
@@ -251,8 +624,19 @@ def login():
 
     if user:
         print(f"User found: {user.username}")
-        if bcrypt.check_password_hash(user.password, password):
+        try:
+            matches = password_hasher.check(user.password, password)
+        except (HasherBusy, FutureTimeoutError):
+            return auth_busy()
+        if matches:
             print("Password match!")
+            if password_hasher.needs_rehash(user.password):
+                # BCRYPT_ROUNDS changed since this hash was made; upgrade it while we have the password
+                try:
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
+                except (HasherBusy, FutureTimeoutError):
+                    pass  # try again on a later login
             access_token = create_access_token(identity=str(user.id))
             resp = jsonify({'message': 'Login successful', 'username': user.username})
             set_access_cookies(resp, access_token)
@@ -280,44 +664,29 @@ def get_current_user():
 @app.route('/symptoms', methods=['GET'])
 @jwt_required()
 def get_symptoms():
-    return jsonify({'symptoms': symptoms_list})
+    active = model_registry.current
+    return jsonify({'symptoms': active.symptoms_list if active else []})
 
 @app.route('/predict', methods=['POST'])
 @jwt_required()
 def predict():
-    if not models:
+    # Hold on to one model version for the whole request, even if a reload happens meanwhile
+    active = model_registry.current
+    if not active:
         return jsonify({'error': 'Models not loaded'}), 500
         
-    data = request.json
+    data = request.json or {}
     user_symptoms = data.get('symptoms', [])
-    
-    # Create input vector
-    input_vector = [0] * len(symptoms_list)
-    for symptom in user_symptoms:
-        if symptom in symptoms_list:
-            index = symptoms_list.index(symptom)
-            input_vector[index] = 1
-            
-    input_vector = np.array([input_vector])
-    
-    results = {}
-    for name, model in models.items():
-        prediction = model.predict(input_vector)[0]
-        # Get probability if available
-        if hasattr(model, 'predict_proba'):
-            probs = model.predict_proba(input_vector)[0]
-            confidence = np.max(probs) * 100
-        else:
-            confidence = 0 # or some default
-            
-        results[name] = {
-            'disease': prediction,
-            'confidence': float(f"{confidence:.2f}")
-        }
-        
-    # Simple logic to find the most agreed upon prediction
-    predictions = [res['disease'] for res in results.values()]
-    final_prediction = max(set(predictions), key=predictions.count)
+    if not valid_symptom_list(user_symptoms):
+        return jsonify({'error': 'symptoms must be a list of symptom names'}), 400
+    top_k = data.get('top_k')
+
+    try:
+        result = active.ensemble.predict_symptoms([user_symptoms], need_probabilities=bool(top_k))
+    except InferenceTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    results = result.model_predictions(0)
+    final_prediction = str(result.final_predictions[0])
     
     remedies = remedies_data.get(final_prediction, {"remedies": [], "exercises": []})
 
@@ -325,39 +694,155 @@ def predict():
     try:
         current_user_id = get_jwt_identity()
         if current_user_id:
-            new_prediction = Prediction(
-                user_id=int(current_user_id),
-                disease=final_prediction,
-                symptoms=",".join(user_symptoms)
-            )
-            db.session.add(new_prediction)
-            db.session.commit()
+            for entry in prediction_records(int(current_user_id), [final_prediction], [user_symptoms]):
+                audit_writer.put(('prediction', entry))
     except Exception as e:
         print(f"Error saving prediction: {e}")
 
-    return jsonify({
+    response = {
         'predictions': results,
         'final_prediction': final_prediction,
+        'models_evaluated': result.models_evaluated(0),
+        'model_version': active.version,
         'remedies': remedies['remedies'],
         'exercises': remedies['exercises']
-    })
+    }
+    if top_k:
+        response['differential'] = result.differential(0, int(top_k))
+    if result.timed_out:
+        response['models_timed_out'] = result.timed_out
+
+    return jsonify(response)
+
+# Upper bound on symptom sets accepted by a single /predict/batch call
+MAX_PREDICT_BATCH = int(os.environ.get('MAX_PREDICT_BATCH', 1000))
+
+@app.route('/predict/batch', methods=['POST'])
+@jwt_required()
+def predict_batch():
+    active = model_registry.current
+    if not active:
+        return jsonify({'error': 'Models not loaded'}), 500
+
+    data = request.json or {}
+    symptom_sets = data.get('symptom_sets')
+
+    if not isinstance(symptom_sets, list) or not all(valid_symptom_list(s) for s in symptom_sets):
+        return jsonify({'error': 'symptom_sets must be a list of symptom lists'}), 400
+    if len(symptom_sets) > MAX_PREDICT_BATCH:
+        return jsonify({'error': f'At most {MAX_PREDICT_BATCH} symptom sets per batch'}), 413
+    if not symptom_sets:
+        return jsonify({'results': []})
+
+    top_k = data.get('top_k')
+    try:
+        result = active.ensemble.predict_symptoms(symptom_sets, need_probabilities=bool(top_k))
+    except InferenceTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    final_predictions = [str(disease) for disease in result.final_predictions]
+
+    results = []
+    for row, final_prediction in enumerate(final_predictions):
+        remedies = remedies_data.get(final_prediction, {"remedies": [], "exercises": []})
+        row_result = {
+            'predictions': result.model_predictions(row),
+            'final_prediction': final_prediction,
+            'models_evaluated': result.models_evaluated(row),
+            'remedies': remedies['remedies'],
+            'exercises': remedies['exercises']
+        }
+        if top_k:
+            row_result['differential'] = result.differential(row, int(top_k))
+        results.append(row_result)
+
+    # Saved through the write-behind queue, which writes them in one bulk insert
+    try:
+        current_user_id = get_jwt_identity()
+        if current_user_id:
+            for entry in prediction_records(int(current_user_id), final_predictions, symptom_sets):
+                audit_writer.put(('prediction', entry))
+    except Exception as e:
+        print(f"Error saving batch predictions: {e}")
+
+    response = {'results': results, 'model_version': active.version}
+    if result.timed_out:
+        response['models_timed_out'] = result.timed_out
+    return jsonify(response)
+
+# History endpoints return one page, newest first: ?limit=N (default HISTORY_PAGE_SIZE, at
+# most HISTORY_MAX_PAGE_SIZE) and ?before=<id of the oldest row already shown>, which is
+# next_before of the previous page. ?all=1 returns everything in one response, as before.
+# /exercise/history only paginates when asked to (limit or before given).
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', 200))
+
+def wants_full_history():
+    return request.args.get('all') == '1'
+
+def history_page(model, user_id, *criteria):
+    # Keyset pagination on (date, id) along the (user_id, date DESC, id DESC) index: every
+    # page is an index range scan of limit + 1 rows, however far back it starts.
+    # The cursor is a row id; its date is read in the query so it compares exactly as stored.
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        raise ValueError("limit must be a positive integer")
+    limit = min(limit, HISTORY_MAX_PAGE_SIZE)
+
+    query = model.query.filter(model.user_id == user_id, *criteria)
+    before = request.args.get('before')
+    if before:
+        if not before.isdigit():
+            raise ValueError("before must be a row id")
+        before_date = db.session.query(model.date).filter(model.id == int(before)).scalar_subquery()
+        query = query.filter(db.tuple_(model.date, model.id) < db.tuple_(before_date, int(before)))
+    rows = query.order_by(model.date.desc(), model.id.desc()).limit(limit + 1).all()
+    next_before = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_before = rows[-1].id
+    return rows, next_before
 
 @app.route('/history', methods=['GET'])
 @jwt_required()
 def get_history():
     current_user_id = get_jwt_identity()
-    predictions = Prediction.query.filter_by(user_id=current_user_id).order_by(Prediction.date.desc()).all()
+    criteria = []
+    if request.args.get('symptom'):
+        # ?symptom=fever: only predictions including it. A bit test on each row of the
+        # user's index range; exact, unlike LIKE on the text column. Symptoms beyond the
+        # mask, and overflowed masks, take a primary key probe of prediction_symptom.
+        symptom_id = symptom_vocabulary.id_for(request.args['symptom'])
+        linked = db.exists().where(
+            prediction_symptom.c.prediction_id == Prediction.id,
+            prediction_symptom.c.symptom_id == symptom_id
+        )
+        if symptom_id is not None and symptom_id < SYMPTOM_MASK_BITS:
+            criteria.append(db.or_(
+                db.and_(Prediction.symptom_mask >= 0, Prediction.symptom_mask.op('&')(1 << symptom_id) != 0),
+                db.and_(Prediction.symptom_mask == MASK_OVERFLOW, linked)
+            ))
+        else:
+            criteria.append(linked)
+    next_before = None
+    if wants_full_history():
+        predictions = Prediction.query.filter_by(user_id=current_user_id).filter(*criteria) \
+            .order_by(Prediction.date.desc()).all()
+    else:
+        try:
+            predictions, next_before = history_page(Prediction, current_user_id, *criteria)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
     history_list = []
-    for pred in predictions:
+    for pred, symptoms in zip(predictions, prediction_symptoms(predictions)):
         history_list.append({
             'id': pred.id,
             'disease': pred.disease,
             'date': pred.date.strftime('%Y-%m-%d %H:%M'),
-            'symptoms': pred.symptoms.split(',')
+            'symptoms': symptoms
         })
         
-    return jsonify({'history': history_list})
+    return jsonify({'history': history_list, 'next_before': next_before})
 
 @app.route('/history/<int:id>', methods=['DELETE'])
 @jwt_required()
@@ -368,6 +853,7 @@ def delete_history(id):
     if prediction.user_id != int(current_user_id):
         return jsonify({'error': 'Unauthorized'}), 403
         
+    db.session.execute(prediction_symptom.delete().where(prediction_symptom.c.prediction_id == prediction.id))
     db.session.delete(prediction)
     db.session.commit()
     
@@ -377,7 +863,14 @@ def delete_history(id):
 @jwt_required()
 def get_diet_history():
     current_user_id = get_jwt_identity()
-    plans = DietPlan.query.filter_by(user_id=current_user_id).order_by(DietPlan.date.desc()).all()
+    next_before = None
+    if wants_full_history():
+        plans = DietPlan.query.filter_by(user_id=current_user_id).order_by(DietPlan.date.desc()).all()
+    else:
+        try:
+            plans, next_before = history_page(DietPlan, current_user_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
     history_list = []
     import json
@@ -389,7 +882,7 @@ def get_diet_history():
             'plan_data': json.loads(plan.plan_data)
         })
         
-    return jsonify({'history': history_list})
+    return jsonify({'history': history_list, 'next_before': next_before})
 
 @app.route('/diet-history/<int:id>', methods=['DELETE'])
 @jwt_required()
@@ -415,27 +908,85 @@ def predict_skin():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    if file:
+    from_cache = False
+    if file and (SKIN_POOL_ENABLED or SKIN_MODEL_ENABLED):
+        # Uploads are a few MB at most; hashing and decoding both work on these bytes
+        data = file.read()
+        results, cache_keys, image = None, None, None
+        version = skin_model_version()
+        if skin_cache is not None:
+            try:
+                results, cache_keys, image = skin_cache.lookup(data, version)
+            except Exception as e:
+                print(f"Skin image decode error: {e}")
+                return jsonify({'error': 'Could not read image'}), 400
+            from_cache = results is not None
+
+        # The cache hands back the upload it already decoded while hashing
+        source = image if image is not None else data
+        if results is None and SKIN_POOL_ENABLED:
+            try:
+                results = skin_pool.predict(source, timeout=SKIN_TIMEOUT)
+            except PoolBusy:
+                # Saturated: fail fast instead of queueing behind requests that would time out
+                response = jsonify({'error': 'Skin analysis is busy, try again shortly'})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+            except (PoolError, FutureTimeoutError) as e:
+                print(f"Skin prediction error: {e}")
+                return jsonify({'error': 'Skin analysis failed'}), 503
+            except Exception as e:
+                print(f"Skin image decode error: {e}")
+                return jsonify({'error': 'Could not read image'}), 400
+        elif results is None:
+            model, batcher = get_skin_model()
+            try:
+                # Decoded in memory, nothing is written to disk
+                x = model.preprocess(source)
+            except Exception as e:
+                print(f"Skin image decode error: {e}")
+                return jsonify({'error': 'Could not read image'}), 400
+            try:
+                results = batcher.predict(x, timeout=SKIN_TIMEOUT)
+            except BatcherBusy:
+                response = jsonify({'error': 'Skin analysis is busy, try again shortly'})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+            except Exception as e:
+                print(f"Skin prediction error: {e}")
+                return jsonify({'error': 'Skin analysis failed'}), 503
+
+        if skin_cache is not None and not from_cache:
+            skin_cache.store(cache_keys, version, results)
+        top_result = {
+            'name': results[0]['name'],
+            'probability': results[0]['probability'] / 100,
+            'description': results[0]['recommendation'],
+            'predictions': results,
+            'from_cache': from_cache
+        }
+    elif file:
         # Mock prediction for now since TensorFlow is removed
         top_result = {
             'name': 'Eczema (Mock Result)',
             'probability': 0.95,
             'description': 'This is a mock result because the ML model is temporarily disabled.'
         }
-        
-        # Save to SkinAnalysisLog (Mock)
+
+    if file:
+        # Save to SkinAnalysisLog
         try:
             current_user_id = get_jwt_identity()
             if current_user_id:
-                # We don't save the file to disk in mock mode to save space
-                new_log = SkinAnalysisLog(
-                    user_id=int(current_user_id),
-                    condition_name=top_result['name'],
-                    probability=top_result['probability'],
-                    image_path="mock_image.jpg" 
-                )
-                db.session.add(new_log)
-                db.session.commit()
+                # We don't keep the uploaded file to save space
+                audit_writer.put(('skin', {
+                    'user_id': int(current_user_id),
+                    'date': utc_now(),
+                    'condition_name': top_result['name'],
+                    'probability': top_result['probability'],
+                    'image_path': None if SKIN_MODEL_ENABLED or SKIN_POOL_ENABLED else "mock_image.jpg",
+                    'from_cache': from_cache
+                }))
         except Exception as e:
             print(f"Error saving skin analysis log: {e}")
 
@@ -443,6 +994,75 @@ def predict_skin():
     
     return jsonify({'error': 'Something went wrong'}), 500
 
+@app.route('/health/skin', methods=['GET'])
+def skin_health():
+    # Pool load for load balancers and dashboards; 503 when the pool cannot take requests.
+    # Cache counters are those of the web worker answering this request.
+    cache = skin_cache.stats() if skin_cache is not None else None
+    if not SKIN_POOL_ENABLED:
+        return jsonify({'pool': False, 'healthy': True, 'cache': cache})
+    try:
+        stats = skin_pool.health()
+    except Exception as e:
+        return jsonify({'pool': True, 'healthy': False, 'error': str(e), 'cache': cache}), 503
+    stats['pool'] = True
+    stats['cache'] = cache
+    return jsonify(stats), 200 if stats['healthy'] and not stats['saturated'] else 503
+
+@app.route('/health/audit', methods=['GET'])
+def audit_health():
+    # Write-behind queue of the web worker answering this request
+    return jsonify(audit_writer.stats())
+
+# Google Places Text Search for /doctors: pooled connections, timeouts and a shared cache
+places_client = PlacesClient(
+    os.environ.get('GOOGLE_MAPS_API_KEY'),
+    base_url=os.environ.get('PLACES_BASE_URL', PLACES_BASE_URL),
+    connect_timeout=float(os.environ.get('PLACES_CONNECT_TIMEOUT_MS', 2000)) / 1000,
+    read_timeout=float(os.environ.get('PLACES_READ_TIMEOUT_MS', 5000)) / 1000,
+    ttl=float(os.environ.get('PLACES_CACHE_TTL', 3600)),
+    stale_ttl=float(os.environ.get('PLACES_STALE_TTL', 86400)),
+    max_entries=int(os.environ.get('PLACES_CACHE_SIZE', 1024)),
+    details_workers=int(os.environ.get('PLACES_DETAILS_THREADS', 8)),
+    details_ttl=float(os.environ.get('PLACES_DETAILS_TTL', 7 * 86400))
+)
+# Phone numbers (Place Details) for the first PLACES_DETAILS_TOP_N doctors, fetched in
+# parallel; whatever is not back after PLACES_DETAILS_DEADLINE_MS is left out
+PLACES_DETAILS_TOP_N = int(os.environ.get('PLACES_DETAILS_TOP_N', 5))
+PLACES_DETAILS_DEADLINE = float(os.environ.get('PLACES_DETAILS_DEADLINE_MS', 1500)) / 1000
+# 'places' asks Google first and falls back to the local directory; 'directory' never
+# leaves the server
+DOCTORS_SOURCE = os.environ.get('DOCTORS_SOURCE', 'places')
+DOCTOR_DIRECTORY_K = int(os.environ.get('DOCTOR_DIRECTORY_K', 10))
+DOCTOR_DIRECTORY_MAX_KM = float(os.environ.get('DOCTOR_DIRECTORY_MAX_KM', 100))
+
+def directory_doctors(specialty, location, point):
+    # Nearest doctors of the specialty from the local directory, [] if it cannot answer
+    point = point or doctor_directory.locate(location)
+    if point is None:
+        return []
+    found = doctor_directory.doctors(specialty, point[0], point[1], DOCTOR_DIRECTORY_K, DOCTOR_DIRECTORY_MAX_KM)
+    return [{
+        'name': doctor.name,
+        'address': doctor.address,
+        'rating': str(doctor.rating) if doctor.rating is not None else 'N/A',
+        'reviews': "Local directory",
+        'timings': doctor.hours or "Not available",
+        'phone': doctor.phone or "Phone number not available",
+        'lat': doctor.lat,
+        'lng': doctor.lng,
+        'distance_km': round(km, 1)
+    } for doctor, km in found]
+
+@app.route('/health/doctors', methods=['GET'])
+def doctors_health():
+    return jsonify(doctor_directory.stats())
+
+@app.route('/health/places', methods=['GET'])
+def places_health():
+    # Places cache of the web worker answering this request
+    return jsonify(places_client.stats())
+
 @app.route('/profile', methods=['GET', 'POST'])
 @jwt_required()
 def handle_profile():
@@ -481,7 +1101,14 @@ def handle_profile():
 @jwt_required()
 def get_skin_history():
     current_user_id = get_jwt_identity()
-    logs = SkinAnalysisLog.query.filter_by(user_id=current_user_id).order_by(SkinAnalysisLog.date.desc()).all()
+    next_before = None
+    if wants_full_history():
+        logs = SkinAnalysisLog.query.filter_by(user_id=current_user_id).order_by(SkinAnalysisLog.date.desc()).all()
+    else:
+        try:
+            logs, next_before = history_page(SkinAnalysisLog, current_user_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
     history = []
     for log in logs:
@@ -489,10 +1116,11 @@ def get_skin_history():
             'id': log.id,
             'date': log.date.strftime('%Y-%m-%d %H:%M'),
             'condition_name': log.condition_name,
-            'probability': log.probability
+            'probability': log.probability,
+            'from_cache': log.from_cache
         })
         
-    return jsonify({'history': history})
+    return jsonify({'history': history, 'next_before': next_before})
 
 @app.route('/exercise', methods=['POST'])
 @jwt_required()
@@ -516,12 +1144,20 @@ def log_exercise():
 @jwt_required()
 def get_exercise_history():
     current_user_id = get_jwt_identity()
-    # Get last 7 days
-    seven_days_ago = datetime.now() - timedelta(days=7)
-    logs = ExerciseLog.query.filter(
-        ExerciseLog.user_id == current_user_id,
-        ExerciseLog.date >= seven_days_ago
-    ).order_by(ExerciseLog.date.asc()).all()
+    next_before = None
+    if 'limit' not in request.args and 'before' not in request.args:
+        # The tracker chart, as before pagination: last 7 days, oldest first.
+        # Asking for a page (?limit= and/or ?before=) gives the paginated history.
+        seven_days_ago = datetime.now() - timedelta(days=7)
+        logs = ExerciseLog.query.filter(
+            ExerciseLog.user_id == current_user_id,
+            ExerciseLog.date >= seven_days_ago
+        ).order_by(ExerciseLog.date.asc()).all()
+    else:
+        try:
+            logs, next_before = history_page(ExerciseLog, current_user_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
     history = []
     for log in logs:
@@ -533,7 +1169,7 @@ def get_exercise_history():
             'calories_burnt': log.calories_burnt
         })
         
-    return jsonify({'history': history})
+    return jsonify({'history': history, 'next_before': next_before})
 
 @app.route('/exercise/recommendations', methods=['GET'])
 @jwt_required()
@@ -620,17 +1256,60 @@ def send_sos():
     
     if not contacts:
         return jsonify({'message': 'No contacts found, but SOS logged.'}), 200
-        
-    # Simulate sending alerts
-    print(f"--- SOS ALERT ---")
-    print(f"User ID: {current_user_id}")
-    print(f"Location: {lat}, {lng}")
-    print(f"Sending alerts to:")
-    for contact in contacts:
-        print(f"- {contact.name} ({contact.phone}, {contact.email})")
-    print(f"-----------------")
-    
-    return jsonify({'message': f'SOS sent to {len(contacts)} contacts'})
+
+    event = SosEvent(user_id=current_user_id, latitude=lat, longitude=lng)
+    db.session.add(event)
+    db.session.commit()
+
+    user = User.query.get(current_user_id)
+    where = f"https://maps.google.com/?q={lat},{lng}" if lat is not None and lng is not None else "unknown location"
+    body = f"SOS from {user.username if user else 'a Healix user'}: they need help. Location: {where}"
+    # Queued, not sent: the response does not wait for any SMS gateway or mail server
+    queued = sos_dispatcher.dispatch(
+        event.id,
+        [{'id': c.id, 'name': c.name, 'phone': c.phone, 'email': c.email} for c in contacts],
+        "Healix SOS alert", body
+    )
+    event.deliveries = queued
+    db.session.commit()
+    print(f"SOS event {event.id}: user {current_user_id} at {lat}, {lng}, {queued} alerts queued")
+
+    return jsonify({'message': f'SOS sent to {len(contacts)} contacts', 'event_id': event.id})
+
+@app.route('/sos/<int:event_id>', methods=['GET'])
+@jwt_required()
+def sos_status(event_id):
+    # Delivery attempts of one of the user's SOS events, oldest first
+    event = SosEvent.query.get_or_404(event_id)
+    if str(event.user_id) != str(get_jwt_identity()):
+        return jsonify({'error': 'Unauthorized'}), 403
+    attempts = SosDelivery.query.filter_by(event_id=event.id).order_by(SosDelivery.id).all()
+    return jsonify({
+        'event_id': event.id,
+        'date': event.date.isoformat(),
+        'queued': event.deliveries,
+        'delivered': len({(a.contact_id, a.channel) for a in attempts if a.status == 'sent'}),
+        'attempts': [{
+            'contact_id': a.contact_id,
+            'channel': a.channel,
+            'recipient': a.recipient,
+            'attempt': a.attempt,
+            'status': a.status,
+            'error': a.error,
+            'latency_ms': a.latency_ms,
+            'date': a.date.isoformat()
+        } for a in attempts]
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Summed over all gunicorn workers (METRICS_DIR), in the Prometheus text format
+    return registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/health/sos', methods=['GET'])
+def sos_health():
+    # SOS dispatcher of the web worker answering this request
+    return jsonify(sos_dispatcher.stats())
 
 @app.route('/doctors', methods=['POST'])
 @jwt_required()
@@ -642,6 +1321,14 @@ def find_doctors():
     if not specialty or not location:
         return jsonify({'error': 'Specialty and location are required'}), 400
         
+    # Optional coordinates (e.g. browser geolocation) for the local directory
+    point = None
+    if data.get('lat') is not None and data.get('lng') is not None:
+        try:
+            point = (float(data['lat']), float(data['lng']))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'lat and lng must be numbers'}), 400
+
     query = f"{specialty} doctors near {location}"
     print(f"Searching for: {query}")
     
@@ -680,59 +1367,55 @@ def find_doctors():
         }
     ]
 
+    if DOCTORS_SOURCE == 'directory':
+        return jsonify({'doctors': directory_doctors(specialty, location, point) or mock_doctors})
+
+    api_key = places_client.api_key
+    if not api_key or api_key == 'YOUR_API_KEY_HERE':
+        print("Warning: GOOGLE_MAPS_API_KEY not set or is default.")
+        # Local directory, or mock data if it has nothing
+        return jsonify({'doctors': directory_doctors(specialty, location, point) or mock_doctors})
+
     try:
-        import requests
-        
-        api_key = os.environ.get('GOOGLE_MAPS_API_KEY')
-        if not api_key or api_key == 'YOUR_API_KEY_HERE':
-            print("Warning: GOOGLE_MAPS_API_KEY not set or is default.")
-            # Return mock data if no key
-            return jsonify({'doctors': mock_doctors})
-
-        # Google Places Text Search API
-        url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-        params = {
-            'query': f"{specialty} doctors in {location}",
-            'key': api_key
-        }
-        
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if data.get('status') == 'OK':
-            results = data.get('results', [])
-            real_doctors = []
-            
-            for place in results:
-                # Get details for each place (optional, but Text Search gives basic info)
-                # We can use the basic info for now
-                
-                # Format opening hours
-                opening_hours = "Not available"
-                if place.get('opening_hours', {}).get('open_now'):
-                    opening_hours = "Open Now"
-                
-                doctor = {
-                    'name': place.get('name'),
-                    'address': place.get('formatted_address'),
-                    'rating': str(place.get('rating', 'N/A')),
-                    'reviews': f"{place.get('user_ratings_total', 0)} reviews",
-                    'timings': opening_hours,
-                    'phone': "Phone number not available in list view", # Requires Place Details API
-                    'lat': place['geometry']['location']['lat'],
-                    'lng': place['geometry']['location']['lng'],
-                    'place_id': place.get('place_id')
-                }
-                real_doctors.append(doctor)
-            
-            return jsonify({'doctors': real_doctors})
-        else:
-            print(f"Google Places API Error: {data.get('status')} - {data.get('error_message')}")
-            return jsonify({'doctors': mock_doctors}) # Fallback
-            
-    except Exception as e:
+        results = places_client.search(specialty, location)
+    except PlacesError as e:
         print(f"Error fetching doctors: {e}")
-        return jsonify({'doctors': mock_doctors})
+        results = []
+    if not results:
+        # Fallback
+        return jsonify({'doctors': directory_doctors(specialty, location, point) or mock_doctors})
+
+    top_ids = [place['place_id'] for place in results[:PLACES_DETAILS_TOP_N] if place.get('place_id')]
+    details = places_client.place_details(top_ids, PLACES_DETAILS_DEADLINE) if top_ids else {}
+
+    real_doctors = []
+    for place in results:
+        # Text Search gives basic info; phone numbers come from Place Details
+        place_details = details.get(place.get('place_id'), {})
+
+        # Format opening hours
+        opening_hours = "Not available"
+        if place.get('opening_hours', {}).get('open_now'):
+            opening_hours = "Open Now"
+
+        doctor = {
+            'name': place.get('name'),
+            'address': place.get('formatted_address'),
+            'rating': str(place.get('rating', 'N/A')),
+            'reviews': f"{place.get('user_ratings_total', 0)} reviews",
+            'timings': opening_hours,
+            'phone': (place_details.get('formatted_phone_number')
+                      or place_details.get('international_phone_number')
+                      or "Phone number not available in list view"),
+            'lat': place['geometry']['location']['lat'],
+            'lng': place['geometry']['location']['lng'],
+            'place_id': place.get('place_id')
+        }
+        real_doctors.append(doctor)
+
+    return jsonify({'doctors': real_doctors})
 
 if __name__ == '__main__':
+    with app.app_context():
+        prepare_database()
     app.run(debug=True, port=5000)
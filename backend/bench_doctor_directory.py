@@ -0,0 +1,100 @@
+import argparse
+import csv
+import os
+import tempfile
+import time
+import numpy as np
+
+# Offline doctor directory at scale: CSV import, index build and nearest-K query latency
+# against a brute-force great-circle scan over the same specialty, on a fresh SQLite
+# database filled with synthetic providers spread over the continental US.
+#   python bench_doctor_directory.py --providers 1000000
+
+SPECIALTIES = ['cardiologist', 'dermatologist', 'pediatrician', 'neurologist', 'orthopedist',
+               'psychiatrist', 'ophthalmologist', 'gynecologist', 'urologist', 'oncologist',
+               'general physician', 'dentist', 'ent specialist', 'endocrinologist', 'gastroenterologist',
+               'pulmonologist', 'nephrologist', 'rheumatologist', 'allergist', 'radiologist']
+
+def write_providers(path, count, seed=0):
+    rng = np.random.default_rng(seed)
+    # Clustered like real practices: around 2000 towns of different sizes
+    towns = np.column_stack((rng.uniform(25, 49, 2000), rng.uniform(-124, -67, 2000)))
+    town = rng.zipf(1.5, count) % len(towns)
+    lat = towns[town, 0] + rng.normal(0, 0.1, count)
+    lng = towns[town, 1] + rng.normal(0, 0.1, count)
+    specialty = rng.integers(0, len(SPECIALTIES), count)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for i in range(count):
+            writer.writerow((f"Dr. Provider {i}", SPECIALTIES[specialty[i]], f"{i % 9999} Main St",
+                             f"Town {town[i]}", f"555-{i % 10000:04d}", f"{lat[i]:.6f}", f"{lng[i]:.6f}",
+                             'Mon-Fri 9AM-5PM', f"{rng.uniform(3, 5):.1f}"))
+
+def brute_force(lat, lng, specialty, p_lat, p_lng, k):
+    rows = specialty_rows[specialty]
+    lat1, lng1 = np.radians(p_lat), np.radians(p_lng)
+    lat2, lng2 = lat[rows], lng[rows]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return rows[np.argpartition(a, k)[:k]]
+
+def percentiles(samples):
+    samples = np.array(samples) * 1000
+    return f"p50 {np.percentile(samples, 50):7.3f} ms   p99 {np.percentile(samples, 99):7.3f} ms"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--providers', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    from app import app, db, Doctor, doctor_directory
+    from doctor_directory import CSV_COLUMNS, import_csv
+
+    csv_path = os.path.join(workdir, 'providers.csv')
+    start = time.perf_counter()
+    write_providers(csv_path, args.providers)
+    print(f"generate CSV      {time.perf_counter() - start:8.1f} s  ({os.path.getsize(csv_path) / 1e6:.0f} MB)")
+
+    with app.app_context():
+        start = time.perf_counter()
+        import_csv(db, Doctor, csv_path)
+        print(f"import CSV        {time.perf_counter() - start:8.1f} s")
+        start = time.perf_counter()
+        doctor_directory.reload()
+        print(f"build index       {time.perf_counter() - start:8.1f} s")
+        index_bytes = sum(tree.data.nbytes + tree.indices.nbytes + ids.nbytes
+                          for tree, ids in doctor_directory.trees.values())
+        print(f"index arrays      {index_bytes / 1e6:8.1f} MB")
+
+        rng = np.random.default_rng(1)
+        points = np.column_stack((rng.uniform(25, 49, args.queries), rng.uniform(-124, -67, args.queries)))
+        specialties = rng.choice(SPECIALTIES, args.queries)
+
+        nearest, full = [], []
+        for (p_lat, p_lng), specialty in zip(points, specialties):
+            start = time.perf_counter()
+            doctor_directory.nearest(specialty, p_lat, p_lng, args.k)
+            nearest.append(time.perf_counter() - start)
+        for (p_lat, p_lng), specialty in zip(points[:200], specialties[:200]):
+            start = time.perf_counter()
+            doctor_directory.doctors(specialty, p_lat, p_lng, args.k)
+            full.append(time.perf_counter() - start)
+        print(f"nearest {args.k} (index)       {percentiles(nearest)}")
+        print(f"nearest {args.k} + rows (DB)   {percentiles(full)}")
+
+        # Baseline: scan every provider of the specialty in NumPy (no database round trip)
+        rows = db.session.execute(db.select(Doctor.specialty, Doctor.lat, Doctor.lng)).all()
+        names = np.array([r[0] for r in rows], dtype=object)
+        lat = np.radians(np.array([r[1] for r in rows]))
+        lng = np.radians(np.array([r[2] for r in rows]))
+        specialty_rows = {name: np.flatnonzero(names == name) for name in SPECIALTIES}
+        scan = []
+        for (p_lat, p_lng), specialty in zip(points[:200], specialties[:200]):
+            start = time.perf_counter()
+            brute_force(lat, lng, specialty, p_lat, p_lng, args.k)
+            scan.append(time.perf_counter() - start)
+        print(f"nearest {args.k} (full scan)   {percentiles(scan)}")
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import requests
+
+# /predict latency while other clients flood /auth/login, with bcrypt inline in the
+# request thread (AUTH_HASH_THREADS=0, the old behaviour) and on the bounded hashing pool.
+# Each configuration gets a fresh gunicorn and SQLite database.
+#   python bench_login_storm.py --login-clients 16 --seconds 10
+PORT = 8766
+BASE = f'http://127.0.0.1:{PORT}'
+
+CONFIGS = {
+    'no logins': ({}, False),
+    'login storm, bcrypt inline': ({'AUTH_HASH_THREADS': '0'}, True),
+    'login storm, bcrypt pool': ({'AUTH_HASH_THREADS': '1', 'AUTH_HASH_MAX_PENDING': '1'}, True),
+}
+
+def signed_in_session(username):
+    session = requests.Session()
+    session.post(f'{BASE}/auth/register', json={'username': username, 'password': 'storm-password'})
+    response = session.post(f'{BASE}/auth/login', json={'username': username, 'password': 'storm-password'})
+    assert response.status_code == 200, response.text
+    return session
+
+def run(name, env_overrides, storm, args):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_THREADS=str(args.threads), BCRYPT_ROUNDS=str(args.rounds), **env_overrides)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{PORT}', 'app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            try:
+                requests.get(f'{BASE}/', timeout=30)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        predict_session = signed_in_session('predict-user')
+        signed_in_session('storm-user')
+
+        stop = threading.Event()
+        logins = {'ok': 0, 'busy': 0, 'other': 0}
+        def login_client():
+            session = requests.Session()
+            while not stop.is_set():
+                status = session.post(f'{BASE}/auth/login',
+                                      json={'username': 'storm-user', 'password': 'storm-password'}).status_code
+                logins['ok' if status == 200 else 'busy' if status == 503 else 'other'] += 1
+                if status == 503:
+                    time.sleep(0.05)
+        storm_threads = [threading.Thread(target=login_client) for _ in range(args.login_clients if storm else 0)]
+        for t in storm_threads:
+            t.start()
+        time.sleep(1 if storm else 0)
+
+        latencies = []
+        end = time.monotonic() + args.seconds
+        while time.monotonic() < end:
+            start = time.perf_counter()
+            response = predict_session.post(f'{BASE}/predict', json={'symptoms': ['cough', 'chills']})
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+            time.sleep(0.02)
+        stop.set()
+        for t in storm_threads:
+            t.join()
+
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{name:<30}{len(latencies):>9}{p50:>9.1f}ms{p99:>9.1f}ms"
+              f"{logins['ok'] / args.seconds:>11.1f}/s{logins['busy'] / args.seconds:>9.1f}/s")
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--login-clients', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=12)
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers x {args.threads} threads, bcrypt cost {args.rounds}, "
+          f"{args.login_clients} login clients, {os.cpu_count()} CPUs")
+    print(f"{'config':<30}{'predicts':>9}{'p50':>11}{'p99':>11}{'logins ok':>13}{'503':>11}")
+    for name, (env_overrides, storm) in CONFIGS.items():
+        run(name, env_overrides, storm, args)
@@ -0,0 +1,28 @@
+import time
+import joblib
+import numpy as np
+from numpy_scoring import export_models, KERNELS
+
+# Microbenchmark: single-row predict_proba latency, sklearn vs NumPy kernels
+models = joblib.load('models/disease_prediction_models.pkl')
+symptoms_list = joblib.load('models/symptoms_list.pkl')
+kernels = {name: KERNELS[arrays['kind']](arrays) for name, arrays in export_models(models).items()}
+
+def time_per_call(fn, X, repeats):
+    fn(X)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(X)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+rng = np.random.default_rng(0)
+row = (rng.random((1, len(symptoms_list))) < 0.25).astype(np.float64)
+batch = (rng.random((1000, len(symptoms_list))) < 0.25).astype(np.float64)
+
+print(f"{'model':<14}{'sklearn 1 row':>16}{'numpy 1 row':>14}{'speedup':>10}{'sklearn 1k rows':>18}{'numpy 1k rows':>16}")
+for name, model in models.items():
+    sk_row = time_per_call(model.predict_proba, row, 200)
+    np_row = time_per_call(kernels[name].predict_proba, row, 200)
+    sk_batch = time_per_call(model.predict_proba, batch, 10)
+    np_batch = time_per_call(kernels[name].predict_proba, batch, 10)
+    print(f"{name:<14}{sk_row:>14.0f}us{np_row:>12.0f}us{sk_row / np_row:>9.1f}x{sk_batch / 1000:>16.1f}ms{np_batch / 1000:>14.1f}ms")
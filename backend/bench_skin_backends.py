@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+# Load time, memory and per-image latency of each skin model backend. Every backend is
+# measured in a fresh process so import cost and RSS are not shared. Backends whose
+# runtime or exported model is missing are reported as skipped.
+#   python bench_skin_backends.py --backends keras,onnx,onnx-int8,tflite,tflite-int8
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:')) / 1024
+
+def measure(spec, repeats):
+    backend, _, variant = spec.partition('-')
+    start = time.perf_counter()
+    from skin_model_loader import BACKENDS, exported_model_path
+    path = exported_model_path(backend, variant == 'int8') if backend != 'keras' else os.environ.get('SKIN_MODEL_PATH')
+    model = BACKENDS[backend](path)
+    x = np.random.default_rng(0).uniform(-1, 1, (16, 224, 224, 3)).astype(np.float32)
+    model.run(x[:1])
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.run(x[:1])
+        latencies.append(time.perf_counter() - start)
+    model.run(x)
+    start = time.perf_counter()
+    for _ in range(max(repeats // 8, 1)):
+        model.run(x)
+    batch_per_image = (time.perf_counter() - start) / max(repeats // 8, 1) / len(x)
+    return {
+        'load_s': load_seconds,
+        'rss_mb': rss_mb(),
+        'tensorflow': 'tensorflow' in sys.modules,
+        'p50_ms': np.percentile(latencies, 50) * 1000,
+        'p99_ms': np.percentile(latencies, 99) * 1000,
+        'batch16_ms': batch_per_image * 1000
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', default='keras,onnx,onnx-int8,tflite,tflite-int8')
+    parser.add_argument('--repeats', type=int, default=100)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.repeats)))
+        sys.exit()
+
+    print(f"{'backend':<13}{'load':>8}{'RSS':>9}{'TF loaded':>11}{'p50 1 img':>11}{'p99 1 img':>11}{'batch 16':>13}")
+    for spec in args.backends.split(','):
+        out = subprocess.run([sys.executable, __file__, '--child', spec, '--repeats', str(args.repeats)],
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f"{spec:<13}skipped: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else 'failed'}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{spec:<13}{r['load_s']:>7.2f}s{r['rss_mb']:>7.0f}MB{'yes' if r['tensorflow'] else 'no':>11}"
+              f"{r['p50_ms']:>9.1f}ms{r['p99_ms']:>9.1f}ms{r['batch16_ms']:>8.1f}ms/img")
@@ -0,0 +1,59 @@
+import argparse
+import threading
+import time
+import numpy as np
+from inference import MicroBatcher
+from skin_model_loader import SkinDiseaseModel
+
+# Load benchmark for the skin model: N closed-loop clients call predict() back to back,
+# once with batch-1 inference and once through the MicroBatcher. Needs TensorFlow.
+# Inputs are random preprocessed tensors, so only the forward pass is measured.
+
+def run_level(batcher, concurrency, duration):
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+    x = np.random.default_rng(0).uniform(-1, 1, (224, 224, 3)).astype(np.float32)
+
+    def client():
+        own = []
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            batcher.predict(x)
+            own.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', default='1,4,8,16,32')
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per concurrency level")
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    model = SkinDiseaseModel()
+    model.predict_batch(np.zeros((args.max_batch, 224, 224, 3), dtype=np.float32))  # warm up
+    configs = {
+        'batch-1': dict(max_batch_size=1, max_wait=0),
+        f'micro-batch {args.max_batch}/{args.max_wait_ms:g}ms': dict(max_batch_size=args.max_batch,
+                                                                     max_wait=args.max_wait_ms / 1000)
+    }
+
+    print(f"{'mode':<24}{'clients':>8}{'req/s':>9}{'p50':>10}{'p99':>10}{'mean batch':>12}")
+    for label, config in configs.items():
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            batcher = MicroBatcher(model.predict_batch, max_queue=1024, **config)
+            throughput, p50, p99 = run_level(batcher, concurrency, args.duration)
+            print(f"{label:<24}{concurrency:>8}{throughput:>9.1f}{p50:>8.1f}ms{p99:>8.1f}ms"
+                  f"{batcher.items / max(batcher.batches, 1):>12.1f}")
@@ -0,0 +1,81 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+import skin_preprocessing
+
+# Per-image preprocessing time and peak memory for a 12MP JPEG upload:
+#   disk:   upload written to a temp file, then keras' load_img(target_size=(224, 224))
+#           steps (full decode, RGB, nearest resize), img_to_array and preprocess_input
+#   memory: skin_preprocessing.preprocess() on the upload bytes (JPEG draft + resize)
+# Each method runs in its own process so peak RSS is not shared between them.
+
+def disk_path(data):
+    with tempfile.NamedTemporaryFile(suffix='.jpg') as upload:
+        upload.write(data)
+        upload.flush()
+        img = Image.open(upload.name).convert('RGB').resize((224, 224), Image.NEAREST)
+        x = np.asarray(img, dtype=np.float32)
+        x = np.expand_dims(x, axis=0)
+        return x / 127.5 - 1
+
+def memory_path(data):
+    return skin_preprocessing.preprocess(data)[None]
+
+METHODS = {'disk': disk_path, 'memory': memory_path}
+
+def make_photo(path, width=4032, height=3024):
+    # Smooth gradients plus sensor-like noise, saved like a phone camera JPEG
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.stack([xx / width * 255, yy / height * 255, (xx + yy) / (width + height) * 255], axis=2)
+    img += rng.normal(0, 8, img.shape).astype(np.float32)
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(path, quality=90)
+
+def rss_kb(field):
+    # VmRSS / VmHWM (peak) from /proc; Linux only
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ':'))
+
+def run_method(method, image_path, repeats):
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    # Peak RSS growth over the first call, then the mean time of the following ones
+    before = rss_kb('VmRSS')
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')  # reset VmHWM to the current RSS
+    METHODS[method](data)
+    peak = rss_kb('VmHWM') - before
+    start = time.perf_counter()
+    for _ in range(repeats):
+        METHODS[method](data)
+    per_image = (time.perf_counter() - start) / repeats * 1000
+    print(f"{per_image:.2f} {peak / 1024:.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--method', choices=list(METHODS), help=argparse.SUPPRESS)
+    parser.add_argument('--image', help="JPEG to use instead of a generated 12MP photo")
+    args = parser.parse_args()
+
+    if args.method:
+        run_method(args.method, args.image, args.repeats)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = args.image or os.path.join(tmp, 'photo.jpg')
+        if not args.image:
+            make_photo(image_path)
+        with Image.open(image_path) as img:
+            print(f"Input: {img.size[0]}x{img.size[1]} JPEG, {os.path.getsize(image_path) / 1e6:.1f} MB")
+        print(f"{'method':<8}{'ms/image':>10}{'peak RSS +MB':>14}")
+        for method in METHODS:
+            out = subprocess.run([sys.executable, __file__, '--method', method, '--image', image_path,
+                                  '--repeats', str(args.repeats)], capture_output=True, text=True, check=True)
+            per_image, peak = out.stdout.split()
+            print(f"{method:<8}{float(per_image):>10.2f}{float(peak):>14.1f}")
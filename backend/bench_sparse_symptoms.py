@@ -0,0 +1,64 @@
+import argparse
+import time
+import warnings
+import numpy as np
+from scipy import sparse
+from inference import DiseaseEnsemble
+from numpy_scoring import export_models, KERNELS
+from train_models import vocabulary, generate_synthetic_ids, deduplicate, fit_weights, build_models, fit_model, disease_names
+
+# Dense vs CSR symptom input at growing vocabularies: training matrix size, fit time
+# and request latency through DiseaseEnsemble (NumPy kernels).
+# Extra vocabulary entries are placeholder findings that only show up as noise.
+
+def matrix_bytes(X):
+    if sparse.issparse(X):
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    return X.nbytes
+
+def fit_all(X, disease_ids, svc_samples):
+    X_train, train_ids, weights = deduplicate(X, disease_ids)
+    y_train = disease_names[train_ids]
+    svc_rows = np.random.default_rng(0).permutation(X_train.shape[0])[:svc_samples]
+    models, seconds = {}, {}
+    for name, model in build_models(1).items():
+        rows = svc_rows if name == 'SVC' else slice(None)
+        _, models[name], seconds[name] = fit_model(name, model, X_train[rows], y_train[rows], fit_weights(weights[rows]))
+    return models, seconds
+
+def request_latency(ensemble, symptom_sets, repeats):
+    ensemble.predict_symptoms(symptom_sets)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        ensemble.predict_symptoms(symptom_sets)
+    return (time.perf_counter() - start) / repeats * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--svc-samples', type=int, default=2000)
+    parser.add_argument('--sizes', default='20,1000,10000')
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    rng = np.random.default_rng(1)
+    print(f"{'symptoms':>9}{'format':>8}{'X size':>11}{'generate':>10}{'fit RF':>9}{'fit SVC':>9}{'fit NB':>9}{'1 row':>10}{'1k rows':>10}")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        symptoms = vocabulary(size)
+        # Requests name the disease symptoms plus the odd finding from the long tail
+        requests = [list(rng.choice(symptoms[:20], rng.integers(1, 6), replace=False)) + list(rng.choice(symptoms, 1))
+                    for _ in range(1000)]
+        for as_sparse in (False, True):
+            start = time.perf_counter()
+            X, disease_ids = generate_synthetic_ids(args.samples, seed=0, n_symptoms=len(symptoms), as_sparse=as_sparse)
+            generate = time.perf_counter() - start
+            models, fit = fit_all(X, disease_ids, args.svc_samples)
+
+            kernels = {name: KERNELS[arrays['kind']](arrays) for name, arrays in export_models(models).items()}
+            ensemble = DiseaseEnsemble(kernels, symptoms)
+            ensemble.sparse_input = as_sparse
+            one = request_latency(ensemble, requests[:1], 50)
+            batch = request_latency(ensemble, requests, 3)
+            print(f"{len(symptoms):>9}{'csr' if as_sparse else 'dense':>8}{matrix_bytes(X) / 2**20:>9.1f}MB"
+                  f"{generate:>9.2f}s{fit['RandomForest']:>8.2f}s{fit['SVC']:>8.2f}s{fit['NaiveBayes']:>8.2f}s"
+                  f"{one:>8.2f}ms{batch:>8.1f}ms")
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+import time
+import requests
+
+# Starts gunicorn with a few configurations and reports startup time and per-worker memory.
+# RSS counts shared pages in every process; PSS splits them between the sharers and
+# private (USS) is what each extra worker really costs.
+WORKERS = int(os.environ.get('BENCH_WORKERS', 4))
+PORT = 8765
+
+CONFIGS = {
+    'sklearn pickle, no preload': {'GUNICORN_PRELOAD': '0', 'USE_NUMPY_KERNELS': '0'},
+    'sklearn pickle, preload': {'GUNICORN_PRELOAD': '1', 'USE_NUMPY_KERNELS': '0'},
+    'numpy kernels (mmap), preload': {'GUNICORN_PRELOAD': '1', 'USE_NUMPY_KERNELS': '1'},
+}
+
+def memory_kb(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Rss'], values['Pss'], values['Private_Clean'] + values['Private_Dirty']
+
+def loaded(pid):
+    # The models are in once sklearn (or the memory-mapped kernel file) shows up in the mappings
+    with open(f'/proc/{pid}/maps') as f:
+        maps = f.read()
+    return 'sklearn' in maps or 'disease_prediction_kernels' in maps
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+def run(name, env_overrides):
+    env = dict(os.environ, WEB_CONCURRENCY=str(WORKERS), **env_overrides)
+    start = time.perf_counter()
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{PORT}', 'app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            try:
+                requests.get(f'http://127.0.0.1:{PORT}/', timeout=30)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.05)
+        # Every worker is ready once it has the app loaded and its memory stops growing
+        pids = children(master.pid)
+        while len(pids) < WORKERS:
+            time.sleep(0.05)
+            pids = children(master.pid)
+        for pid in pids:
+            stable, last = 0, None
+            while stable < 3:
+                time.sleep(0.1)
+                current = memory_kb(pid)[0]
+                stable = stable + 1 if current == last and loaded(pid) else 0
+                last = current
+        startup = time.perf_counter() - start - 0.3
+        for _ in range(WORKERS * 10):
+            requests.get(f'http://127.0.0.1:{PORT}/', timeout=5)
+
+        workers = [memory_kb(pid) for pid in children(master.pid)]
+        rss, pss, private = (sum(values) / len(workers) / 1024 for values in zip(*workers))
+        total_pss = (sum(w[1] for w in workers) + memory_kb(master.pid)[1]) / 1024
+        print(f"{name:<32}{startup:>9.2f}s{rss:>10.1f}{pss:>10.1f}{private:>10.1f}{total_pss:>12.1f}")
+    finally:
+        master.terminate()
+        master.wait()
+
+if __name__ == "__main__":
+    print(f"{WORKERS} workers; memory in MB per worker")
+    print(f"{'config':<32}{'startup':>10}{'RSS':>10}{'PSS':>10}{'private':>10}{'total PSS':>12}")
+    for name, env_overrides in CONFIGS.items():
+        run(name, env_overrides)
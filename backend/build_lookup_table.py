@@ -0,0 +1,46 @@
+import argparse
+import joblib
+import numpy as np
+import os
+import time
+from inference import (
+    DiseaseEnsemble, PredictionLookupTable, build_lookup_table, file_fingerprint, MAX_LOOKUP_SYMPTOMS
+)
+from model_registry import latest_version, version_path, MODELS_FILE, SYMPTOMS_FILE
+
+# Offline step: run after train_models.py to precompute the ensemble output for every
+# possible symptom combination of a model version. The backend memory-maps the result
+# when it matches the models; running processes pick it up on their next restart.
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--version', default=None, help="Model version (default: newest)")
+    args = parser.parse_args()
+
+    path = version_path('models', args.version or latest_version('models'))
+    models_path = os.path.join(path, MODELS_FILE)
+    models = joblib.load(models_path)
+    symptoms_list = joblib.load(os.path.join(path, SYMPTOMS_FILE))
+    ensemble = DiseaseEnsemble(models, symptoms_list)
+
+    if len(symptoms_list) > MAX_LOOKUP_SYMPTOMS:
+        print(f"{len(symptoms_list)} symptoms is too many to enumerate, the backend will use live inference.")
+        return
+
+    print(f"Evaluating ensemble on {1 << len(symptoms_list)} symptom combinations...")
+    start = time.time()
+    table = build_lookup_table(ensemble)
+    print(f"Done in {time.time() - start:.1f}s")
+
+    table_path, meta_path = PredictionLookupTable.paths(path)
+    np.save(table_path, table)
+    joblib.dump({
+        'symptoms_list': ensemble.symptoms_list,
+        'classes': ensemble.classes,
+        'model_names': list(models.keys()),
+        'models_fingerprint': file_fingerprint(models_path)
+    }, meta_path)
+    print(f"Lookup table saved to '{table_path}' ({os.path.getsize(table_path) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
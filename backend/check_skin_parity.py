@@ -0,0 +1,58 @@
+import argparse
+import glob
+import os
+import numpy as np
+import skin_preprocessing
+from skin_model_loader import BACKENDS, exported_model_path
+
+# Accuracy parity of an exported skin model (export_skin_model.py) against Keras:
+# top-1 agreement, top-5 overlap and the largest probability difference, on a
+# directory of photos or, without one, random inputs. Exits non-zero below the
+# top-1 threshold (default 99% for float exports, 90% for INT8).
+
+MIN_TOP1_AGREEMENT = {False: 0.99, True: 0.90}
+BATCH_SIZE = 16
+
+def load_images(directory, limit):
+    paths = sorted(p for p in glob.glob(os.path.join(directory, '*'))
+                   if p.lower().endswith(('.jpg', '.jpeg', '.png')))[:limit]
+    return np.stack([skin_preprocessing.preprocess(p) for p in paths]) if paths else None
+
+def run_batched(run, images):
+    return np.concatenate([run(images[start:start + BATCH_SIZE]) for start in range(0, len(images), BATCH_SIZE)])
+
+def check_parity(keras_model, backend, path, images_dir=None, int8=False, limit=500, min_top1=None):
+    images = load_images(images_dir, limit) if images_dir else None
+    if images is None:
+        print("No parity photos given, comparing on random inputs.")
+        images = np.random.default_rng(1).uniform(-1, 1, (64, 224, 224, 3)).astype(np.float32)
+
+    expected = run_batched(lambda x: keras_model(x, training=False).numpy(), images)
+    actual = run_batched(BACKENDS[backend](path).run, images)
+
+    top1 = np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1))
+    top5_expected = np.argsort(expected, axis=1)[:, -5:]
+    top5_actual = np.argsort(actual, axis=1)[:, -5:]
+    top5 = np.mean([len(set(e) & set(a)) / 5 for e, a in zip(top5_expected, top5_actual)])
+    max_diff = np.abs(expected - actual).max()
+    print(f"Parity {backend}{' int8' if int8 else ''} vs Keras on {len(images)} images: "
+          f"top-1 agreement {top1:.2%}, top-5 overlap {top5:.2%}, max |diff| {max_diff:.4f}")
+
+    min_top1 = MIN_TOP1_AGREEMENT[int8] if min_top1 is None else min_top1
+    if top1 < min_top1:
+        raise SystemExit(f"Top-1 agreement {top1:.2%} is below {min_top1:.0%}")
+    return top1, top5, max_diff
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--format', choices=['onnx', 'tflite'], default='onnx')
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--path', help="Exported model (default: models/skin/mobilenet_v2[.int8].<format>)")
+    parser.add_argument('--images', help="Directory of photos to compare on")
+    parser.add_argument('--weights', default='imagenet', help="'imagenet' or a Keras weights file")
+    parser.add_argument('--min-top1', type=float)
+    args = parser.parse_args()
+
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+    check_parity(MobileNetV2(weights=args.weights), args.format, args.path or exported_model_path(args.format, args.int8),
+                 args.images, args.int8, min_top1=args.min_top1)
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import pytest
+
+# Shared setup for the tests that go through app.py. The app binds its database when it
+# is first imported, so every test file uses this one throwaway SQLite database and the
+# fresh_app fixture empties it before each test. The __main__ runners of those files
+# import reset_app / logged_in_client from here, which sets the database up the same way.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'tests.db')
+# /doctors answers from the local directory, never the Places API
+os.environ['GOOGLE_MAPS_API_KEY'] = ''
+
+
+def reset_app():
+    # Empty every table and the per-process caches built from them
+    from app import app, db, audit_writer, prepare_database
+    from metrics import registry
+    # Rows still buffered from the previous test must not land in this one
+    audit_writer.flush()
+    with app.app_context():
+        db.create_all()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        # Seeds the symptom vocabulary and reloads the directory, as at gunicorn startup
+        prepare_database()
+    registry.clear()
+    return app
+
+
+def logged_in_client(username='test'):
+    # A test client with the JWT cookie of a new user
+    from flask_jwt_extended import create_access_token
+    from app import app, db, User
+    with app.app_context():
+        user = User(username=username, password='-')
+        db.session.add(user)
+        db.session.commit()
+        client = app.test_client()
+        client.set_cookie('access_token_cookie', create_access_token(identity=str(user.id)))
+        return client, user.id
+
+
+@pytest.fixture
+def fresh_app():
+    return reset_app()
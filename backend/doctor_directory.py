@@ -0,0 +1,173 @@
+import csv
+import sys
+import time
+import numpy as np
+from scipy.spatial import cKDTree
+from sqlalchemy import delete, insert, select
+
+# Offline provider directory for /doctors: the doctor table, loaded in bulk from CSV, and
+# an in-memory spatial index that answers "nearest K doctors of specialty X to point P"
+# without any network call. Each specialty gets a KD-tree over the doctors' positions as
+# 3D unit vectors, so nearest by straight-line (chord) distance is nearest by
+# great-circle distance, with no trouble at the poles or the date line.
+# The index holds only ids and coordinates (~40 bytes a doctor); the rows of the K hits
+# are read by primary key. With gunicorn preload it is built once in the master and
+# shared by the workers. After importing a CSV restart (or HUP) gunicorn to rebuild it.
+#   python doctor_directory.py providers.csv [--replace]
+# CSV header: name,specialty,address,city,phone,lat,lng,hours,rating (rating and hours
+# may be empty).
+
+EARTH_RADIUS_KM = 6371.0088
+CSV_COLUMNS = ('name', 'specialty', 'address', 'city', 'phone', 'lat', 'lng', 'hours', 'rating')
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().replace(',', ', ').split())
+
+
+def unit_vectors(lat, lng):
+    lat, lng = np.radians(lat), np.radians(lng)
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def csv_rows(path):
+    # Valid rows as column dicts; bad coordinates are skipped and counted
+    skipped = 0
+    with open(path, newline='', encoding='utf-8') as f:
+        for record in csv.DictReader(f):
+            try:
+                lat, lng = float(record['lat']), float(record['lng'])
+                rating = float(record['rating']) if record.get('rating') else None
+                if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not record.get('specialty'):
+                    raise ValueError
+            except (TypeError, ValueError, KeyError):
+                skipped += 1
+                continue
+            yield {
+                'name': record.get('name') or 'Unknown',
+                'specialty': normalize(record['specialty']),
+                'address': record.get('address') or '',
+                'city': normalize(record.get('city')),
+                'phone': record.get('phone') or None,
+                'lat': lat,
+                'lng': lng,
+                'hours': record.get('hours') or None,
+                'rating': rating
+            }
+    if skipped:
+        print(f"Doctor directory: skipped {skipped} rows without a specialty or with invalid numbers")
+
+
+def import_csv(db, model, path, replace=False, chunk_size=10000):
+    # Executemany inserts in committed chunks; returns the number of rows loaded
+    start, count, chunk = time.time(), 0, []
+    if replace:
+        db.session.execute(delete(model))
+    for row in csv_rows(path):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            db.session.execute(insert(model), chunk)
+            db.session.commit()
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(model), chunk)
+        count += len(chunk)
+    db.session.commit()
+    print(f"Doctor directory: imported {count} doctors in {time.time() - start:.1f}s")
+    return count
+
+
+class DoctorDirectory:
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        # specialty -> (KD-tree, doctor ids in tree order)
+        self.trees = {}
+        # city -> (lat, lng) centroid of its doctors, to place a typed-in location
+        self.cities = {}
+        self.size = 0
+        self.build_seconds = 0.0
+
+    def reload(self):
+        start = time.time()
+        m = self.model
+        rows = self.db.session.execute(select(m.id, m.specialty, m.city, m.lat, m.lng)).all()
+        trees, cities = {}, {}
+        if rows:
+            ids, specialties, city_names, lat, lng = zip(*rows)
+            ids = np.array(ids, dtype=np.int64)
+            points = unit_vectors(np.array(lat, dtype=np.float64), np.array(lng, dtype=np.float64))
+            names, groups = np.unique(np.array(specialties, dtype=object), return_inverse=True)
+            order = np.argsort(groups, kind='stable')
+            bounds = np.searchsorted(groups[order], np.arange(len(names) + 1))
+            for i, name in enumerate(names):
+                members = order[bounds[i]:bounds[i + 1]]
+                trees[name] = (cKDTree(points[members]), ids[members])
+            # Centroid of each city's doctors: mean unit vector back to lat/lng
+            names, groups = np.unique(np.array(city_names, dtype=object), return_inverse=True)
+            sums = np.zeros((len(names), 3))
+            np.add.at(sums, groups, points)
+            for name, (x, y, z) in zip(names, sums):
+                if name:
+                    cities[name] = (float(np.degrees(np.arctan2(z, np.hypot(x, y)))),
+                                    float(np.degrees(np.arctan2(y, x))))
+        self.trees, self.cities, self.size = trees, cities, len(rows)
+        self.build_seconds = time.time() - start
+        if rows:
+            print(f"Doctor directory: indexed {len(rows)} doctors in {len(trees)} specialties "
+                  f"in {self.build_seconds:.1f}s")
+
+    def locate(self, location):
+        # "Springfield" or "Springfield, IL" -> centroid of the doctors in that city
+        location = normalize(location)
+        if location in self.cities:
+            return self.cities[location]
+        first = location.split(',')[0].strip()
+        return self.cities.get(first)
+
+    def nearest(self, specialty, lat, lng, k=10, max_km=None):
+        # [(doctor id, km)] nearest first
+        entry = self.trees.get(normalize(specialty))
+        if entry is None:
+            return []
+        tree, ids = entry
+        k = min(k, len(ids))
+        bound = km_to_chord(max_km) if max_km else np.inf
+        chords, index = tree.query(unit_vectors([lat], [lng])[0], k=k, distance_upper_bound=bound)
+        chords, index = np.atleast_1d(chords), np.atleast_1d(index)
+        found = index < len(ids)
+        return list(zip(ids[index[found]].tolist(), chord_to_km(chords[found]).tolist()))
+
+    def doctors(self, specialty, lat, lng, k=10, max_km=None):
+        # [(Doctor row, km)] nearest first
+        hits = self.nearest(specialty, lat, lng, k, max_km)
+        if not hits:
+            return []
+        rows = {row.id: row for row in self.model.query.filter(self.model.id.in_([i for i, _ in hits]))}
+        return [(rows[i], km) for i, km in hits if i in rows]
+
+    def stats(self):
+        return {
+            'doctors': self.size,
+            'specialties': len(self.trees),
+            'cities': len(self.cities),
+            'build_seconds': round(self.build_seconds, 2)
+        }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python doctor_directory.py providers.csv [--replace]")
+        sys.exit(1)
+    from app import app, db, Doctor
+    with app.app_context():
+        import_csv(db, Doctor, sys.argv[1], replace='--replace' in sys.argv[2:])
@@ -0,0 +1,52 @@
+import argparse
+import time
+import joblib
+import numpy as np
+from inference import DiseaseEnsemble
+from numpy_scoring import export_models, KERNELS
+from train_models import generate_synthetic_data
+
+# Offline sweep of the cascade thresholds on synthetic data: how much accuracy we give
+# up against the full ensemble, and how much per-request latency we save.
+
+def per_row_latency(X, predict):
+    start = time.perf_counter()
+    for row in X:
+        predict(row[None, :])
+    return (time.perf_counter() - start) / len(X) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=5000)
+    parser.add_argument('--latency-rows', type=int, default=300)
+    parser.add_argument('--sklearn', action='store_true', help="Time the sklearn models instead of the NumPy kernels")
+    parser.add_argument('--order', default='SVC,NaiveBayes,RandomForest')
+    parser.add_argument('--margin', type=float, default=0.2)
+    args = parser.parse_args()
+
+    models = joblib.load('models/disease_prediction_models.pkl')
+    if not args.sklearn:
+        models = {name: KERNELS[arrays['kind']](arrays) for name, arrays in export_models(models).items()}
+    ensemble = DiseaseEnsemble(models, joblib.load('models/symptoms_list.pkl'))
+
+    X, y = generate_synthetic_data(args.samples, seed=0)
+    X = X.astype(np.float64)
+    latency_rows = X[:args.latency_rows]
+
+    full = ensemble.predict(X)
+    full_accuracy = np.mean(full.final_predictions == y)
+    full_latency = per_row_latency(latency_rows, ensemble.predict)
+    print(f"Full ensemble: accuracy {full_accuracy:.4f}, {full_latency:.3f} ms/request")
+    print(f"{'min_confidence':>15}{'accuracy':>10}{'vs full':>9}{'agreement':>11}{'escalated':>11}{'ms/request':>12}")
+
+    for threshold in [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 0.999]:
+        ensemble.set_cascade(args.order.split(','), threshold, args.margin)
+        cascade = ensemble.predict_cascade(X)
+        accuracy = np.mean(cascade.final_predictions == y)
+        agreement = np.mean(cascade.final_ids == full.final_ids)
+        escalated = np.mean(cascade.evaluated[ensemble.cascade_order[1]])
+        latency = per_row_latency(latency_rows, ensemble.predict_cascade)
+        print(f"{threshold:>15}{accuracy:>10.4f}{accuracy - full_accuracy:>+9.4f}{agreement:>11.4f}{escalated:>11.2%}{latency:>12.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Thread pools for objects built at import time. With preload_app (gunicorn.conf.py) the
+# app is imported in the master and then forked, and threads do not survive a fork, so
+# each process lazily builds its own pool the first time it submits work.
+
+
+class ForkSafeExecutor:
+    def __init__(self, max_workers, name, shutdown_at_exit=False):
+        self.max_workers = max_workers
+        self.name = name
+        # Wait for queued work when the process exits (and in gunicorn's worker_exit)
+        self.shutdown_at_exit = shutdown_at_exit
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                self._pid = os.getpid()
+                if self.shutdown_at_exit:
+                    atexit.register(self.shutdown)
+            return self._pool
+
+    def submit(self, fn, *args, **kwargs):
+        return self.pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        # Only this process's pool; one inherited from the parent has no threads here
+        with self._lock:
+            pool = self._pool if self._pid == os.getpid() else None
+            self._pool = None
+        if pool is not None:
+            pool.shutdown(wait=wait)
@@ -0,0 +1,25 @@
+import argparse
+import joblib
+import os
+from inference import file_fingerprint
+from model_registry import latest_version, version_path, MODELS_FILE, KERNELS_FILE
+from numpy_scoring import save_kernels
+
+# Offline step: flatten the pickled sklearn models of a model version into plain NumPy
+# arrays that numpy_scoring.py evaluates without sklearn's per-call overhead.
+# train_models.py already does this for new versions.
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--version', default=None, help="Model version (default: newest)")
+    args = parser.parse_args()
+
+    version = args.version or latest_version('models')
+    path = version_path('models', version)
+    models_path = os.path.join(path, MODELS_FILE)
+    models = joblib.load(models_path)
+    save_kernels(models, os.path.join(path, KERNELS_FILE), file_fingerprint(models_path))
+    print(f"NumPy kernels for {', '.join(models)} saved to '{os.path.join(path, KERNELS_FILE)}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from check_skin_parity import check_parity, load_images
+from skin_model_loader import SKIN_MODELS_DIR, LABELS_FILE, exported_model_path, keras_labels
+
+# Offline step: export the Keras MobileNetV2 to ONNX or TFLite, optionally INT8
+# quantized, so the backend can serve it with SKIN_BACKEND=onnx|tflite without
+# importing TensorFlow. Needs TensorFlow (and tf2onnx for ONNX) at export time only.
+# Quantization is calibrated on --calibration-dir photos; real skin photos give the
+# best INT8 accuracy. The parity check (check_skin_parity.py) runs after the export.
+
+def calibration_images(directory, limit):
+    images = load_images(directory, limit) if directory else None
+    if images is None:
+        print("No calibration photos given, calibrating INT8 ranges on random inputs (expect lower accuracy).")
+        images = np.random.default_rng(0).uniform(-1, 1, (limit, 224, 224, 3)).astype(np.float32)
+    return images
+
+def export_onnx(model, path, int8, calibration):
+    if not int8:
+        model.export(path, format='onnx', verbose=False)
+        return
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    float_path, prepared_path = path + '.float', path + '.prepared'
+    model.export(float_path, format='onnx', verbose=False)
+    # MobileNetV2 shapes are static apart from the batch, so ONNX shape inference is enough
+    quant_pre_process(float_path, prepared_path, skip_symbolic_shape=True)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            import onnx
+            self.input_name = onnx.load(prepared_path).graph.input[0].name
+            self.rows = iter(calibration)
+
+        def get_next(self):
+            row = next(self.rows, None)
+            return None if row is None else {self.input_name: row[None]}
+
+    try:
+        quantize_static(prepared_path, path, Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    finally:
+        os.remove(float_path)
+        os.remove(prepared_path)
+
+def export_tflite(model, path, int8, calibration):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if int8:
+        # Integer weights and activations; input and output stay float32 so the same
+        # preprocessing and decoding apply
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([row[None]] for row in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+
+EXPORTERS = {'onnx': export_onnx, 'tflite': export_tflite}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--format', choices=list(EXPORTERS), default='onnx')
+    parser.add_argument('--int8', action='store_true', help="INT8 post-training quantization")
+    parser.add_argument('--calibration-dir', help="Photos used to calibrate INT8 activation ranges")
+    parser.add_argument('--calibration-images', type=int, default=200)
+    parser.add_argument('--weights', default='imagenet', help="'imagenet' or a Keras weights file")
+    parser.add_argument('--parity-dir', help="Photos for the parity check (default: calibration photos)")
+    parser.add_argument('--no-check', action='store_true', help="Skip the parity check")
+    args = parser.parse_args()
+
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+    model = MobileNetV2(weights=args.weights)
+    model(np.zeros((1, 224, 224, 3), dtype=np.float32))  # build the graph for export
+
+    os.makedirs(SKIN_MODELS_DIR, exist_ok=True)
+    path = exported_model_path(args.format, args.int8)
+    calibration = calibration_images(args.calibration_dir, args.calibration_images) if args.int8 else None
+    start = time.time()
+    EXPORTERS[args.format](model, path, args.int8, calibration)
+    print(f"Exported {path} ({os.path.getsize(path) / 1e6:.1f} MB) in {time.time() - start:.1f}s")
+
+    # ImageNet class names so serving does not need keras' decode_predictions
+    with open(os.path.join(SKIN_MODELS_DIR, LABELS_FILE), 'w') as f:
+        json.dump(keras_labels(), f)
+
+    if not args.no_check:
+        check_parity(model, args.format, path, args.parity_dir or args.calibration_dir, int8=args.int8)
+
+if __name__ == "__main__":
+    main()
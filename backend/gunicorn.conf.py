@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+# Import the app (and load the models) once in the master process. Workers are forked
+# from it and share the read-only model memory copy-on-write, so adding workers does not
+# add another unpickled copy of the forest and SVC, and workers start instantly.
+# Worker count and port come from WEB_CONCURRENCY / PORT as usual.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+# Threads per worker (gthread). Requests waiting on slow work (bcrypt, skin inference)
+# then block one thread, not the whole worker; keep it above
+# AUTH_HASH_THREADS + AUTH_HASH_MAX_PENDING so that logins beyond those, which wait at
+# most AUTH_HASH_QUEUE_MS, are the only ones that can briefly take every thread.
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# Each worker writes its request metrics here and /metrics adds them all up (metrics.py).
+# Set before the app is imported (preload) so every process uses the same directory.
+default_metrics_dir = os.path.join(tempfile.gettempdir(), f"healix-metrics-{os.getpid()}")
+os.environ.setdefault('METRICS_DIR', default_metrics_dir)
+
+def post_fork(server, worker):
+    # Database connections opened while preloading must not be shared between processes
+    if not server.cfg.preload_app:
+        return
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def on_starting(server):
+    # Counters start from zero with every gunicorn start
+    metrics_dir = os.environ['METRICS_DIR']
+    if os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.endswith('.json') and name != f"{os.getpid()}.json":
+                os.remove(os.path.join(metrics_dir, name))
+    # Schema migrations and the symptom backfill (migrations.py), once before any worker
+    # starts instead of in every worker importing the app. A preloaded app is migrated
+    # in place; otherwise a separate process does it, so the master never imports the
+    # app and its workers still start from a clean import.
+    if os.environ.get('MIGRATE_ON_START', '1') == '1':
+        if server.cfg.preload_app:
+            from app import app, prepare_database
+            with app.app_context():
+                prepare_database()
+        else:
+            import subprocess
+            import sys
+            subprocess.run([sys.executable, 'migrations.py'], check=True)
+    # Skin model worker pool (skin_worker_pool.py), sized by SKIN_POOL_WORKERS independently
+    # of the web workers; web workers connect to it over SKIN_POOL_SOCKET
+    if int(os.environ.get('SKIN_POOL_WORKERS', 0)) > 0:
+        import subprocess
+        import sys
+        server.skin_pool = subprocess.Popen([sys.executable, 'skin_worker_pool.py'])
+
+def on_exit(server):
+    if os.environ['METRICS_DIR'] == default_metrics_dir:
+        import shutil
+        shutil.rmtree(default_metrics_dir, ignore_errors=True)
+    pool = getattr(server, 'skin_pool', None)
+    if pool is not None:
+        pool.terminate()
+        pool.wait(timeout=10)
+
+def worker_exit(server, worker):
+    # Send the SOS alerts still queued, then write the rows still buffered by the
+    # write-behind queue (including those alerts' delivery records) before the worker goes away
+    from app import audit_writer, sos_dispatcher
+    sos_dispatcher.close()
+    audit_writer.close()
@@ -0,0 +1,409 @@
+import contextvars
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait
+from functools import partial
+
+import joblib
+import numpy as np
+from scipy import sparse
+from executors import ForkSafeExecutor
+from metrics import registry, span
+
+# Largest vocabulary we enumerate into a lookup table (2**24 rows is ~160MB for three models)
+MAX_LOOKUP_SYMPTOMS = 24
+# From this many symptoms on, request vectors are built as CSR instead of dense rows
+SPARSE_MIN_SYMPTOMS = int(os.environ.get('SPARSE_MIN_SYMPTOMS', 256))
+# sklearn estimators that take CSR input as-is; other models get a densified copy
+SPARSE_ESTIMATORS = ('RandomForestClassifier', 'SVC')
+
+
+def majority_vote(label_ids, n_classes, evaluated=None):
+    # Count label ids per row across models, ties go to the first class.
+    # evaluated optionally masks out rows a model was not run on.
+    n_rows = len(next(iter(label_ids.values()))) if label_ids else 0
+    votes = np.zeros((n_rows, n_classes), dtype=np.int64)
+    for name, model_label_ids in label_ids.items():
+        rows = np.arange(n_rows) if evaluated is None else np.flatnonzero(evaluated[name])
+        votes[rows, model_label_ids[rows]] += 1
+    return np.argmax(votes, axis=1)
+
+
+def file_fingerprint(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def accepts_sparse(model):
+    # NumPy kernels declare it themselves (numpy_scoring.Kernel.accepts_sparse)
+    if hasattr(model, 'accepts_sparse'):
+        return model.accepts_sparse
+    return type(model).__name__ in SPARSE_ESTIMATORS
+
+
+def densify(X):
+    # Dense float64 copy for models without sparse support (sklearn's GaussianNB)
+    return X.toarray().astype(np.float64) if sparse.issparse(X) else np.asarray(X, dtype=np.float64)
+
+
+def dense_chunks(X, chunk_size):
+    # Densify a bounded number of rows at a time, e.g. to feed GaussianNB.partial_fit
+    for start in range(0, X.shape[0], chunk_size):
+        yield start, densify(X[start:start + chunk_size])
+
+
+def model_input(model, X):
+    # An SVC fitted on CSR only predicts on CSR and vice versa, the rest take either or need dense
+    if type(model).__name__ == 'SVC':
+        if model._sparse:
+            return sparse.csr_matrix(X)
+        return densify(X)
+    if sparse.issparse(X) and not accepts_sparse(model):
+        return densify(X)
+    return X
+
+
+class InferenceTimeout(Exception):
+    pass
+
+
+class BatcherBusy(Exception):
+    pass
+
+
+class InferenceExecutor:
+    # Bounded thread pool shared by all requests. sklearn's tree/SVM code and the
+    # NumPy kernels release the GIL for most of their work, so models overlap.
+    def __init__(self, max_workers, deadline):
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.pool = ForkSafeExecutor(max_workers, 'inference')
+
+    def run(self, tasks, deadline=None):
+        # Returns results of the tasks that finished within the deadline and the names of the rest
+        # Each task runs in a copy of the caller's context, so its timing spans count
+        # towards the caller's request
+        futures = {self.pool.submit(contextvars.copy_context().run, task): name for name, task in tasks.items()}
+        done, not_done = wait(futures, timeout=self.deadline if deadline is None else deadline)
+        for future in not_done:
+            future.cancel()
+        results = {futures[future]: future.result() for future in done}
+        return results, [futures[future] for future in not_done]
+
+
+class MicroBatcher:
+    # Groups concurrent single-item requests into one predict_batch() call. A batch is
+    # closed when it reaches max_batch_size or max_wait seconds after its first item,
+    # so a lone request waits at most max_wait. predict_batch takes the stacked items
+    # and returns one result per row. At most max_queue items wait; a caller that cannot
+    # get a place within queue_timeout gets BatcherBusy instead of piling up behind them.
+    def __init__(self, predict_batch, max_batch_size=16, max_wait=0.005, max_queue=256, queue_timeout=0.1):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue_timeout = queue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pid = None
+        self._lock = threading.Lock()
+        # Counters for the mean batch size
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+
+    def _ensure_worker(self):
+        # One batching thread per (gunicorn) worker process, like InferenceExecutor.pool
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='micro-batcher', daemon=True).start()
+
+    def submit(self, item):
+        if self._pid != os.getpid():
+            self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put((item, future), timeout=self.queue_timeout)
+        except queue.Full:
+            self.rejected += 1
+            raise BatcherBusy("Too many requests waiting for a batch")
+        return future
+
+    def predict(self, item, timeout=None):
+        future = self.submit(item)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # Still queued: _run skips it instead of spending a forward pass on it
+            future.cancel()
+            raise
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        closes_at = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = closes_at - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Callers that gave up (cancelled futures) are dropped before the forward pass
+            batch = [(item, future) for item, future in self._next_batch() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.predict_batch(np.stack([item for item, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+class EnsembleResult:
+    # Per-model labels and confidences for a batch of rows, aligned to one shared class list
+    def __init__(self, classes, label_ids, confidences, probabilities=None, final_ids=None, evaluated=None):
+        self.classes = classes
+        self.label_ids = label_ids
+        self.confidences = confidences
+        self.probabilities = probabilities
+        # Per-model mask of the rows the model actually ran on; None means every row
+        self.evaluated = evaluated
+        if final_ids is None:
+            final_ids = majority_vote(label_ids, len(classes), evaluated)
+        self.final_ids = final_ids
+        # Models dropped from the vote because they missed the inference deadline
+        self.timed_out = []
+
+    @classmethod
+    def from_probabilities(cls, classes, probabilities, evaluated=None):
+        label_ids = {name: np.argmax(probs, axis=1) for name, probs in probabilities.items()}
+        confidences = {name: np.max(probs, axis=1) for name, probs in probabilities.items()}
+        return cls(classes, label_ids, confidences, probabilities, evaluated=evaluated)
+
+    def __len__(self):
+        return len(self.final_ids)
+
+    @property
+    def final_predictions(self):
+        return self.classes[self.final_ids]
+
+    def models_evaluated(self, row):
+        return [name for name in self.label_ids if self.evaluated is None or self.evaluated[name][row]]
+
+    def model_predictions(self, row):
+        return {
+            name: {
+                'disease': str(self.classes[self.label_ids[name][row]]),
+                'confidence': round(float(self.confidences[name][row]) * 100, 2)
+            } for name in self.models_evaluated(row)
+        }
+
+    def differential(self, row, k=3):
+        if self.probabilities is None:
+            raise ValueError("Differential needs the full probability vectors")
+        # Top-k diseases by mean probability across the ensemble
+        mean_probs = np.mean([self.probabilities[name][row] for name in self.models_evaluated(row)], axis=0)
+        top = np.argsort(mean_probs)[::-1][:k]
+        return [
+            {'disease': str(self.classes[i]), 'probability': float(round(mean_probs[i] * 100, 2))}
+            for i in top
+        ]
+
+
+class PredictionLookupTable:
+    # Precomputed ensemble output for every symptom bitmask, memory-mapped from disk
+    def __init__(self, table, meta):
+        self.table = table
+        self.model_names = list(meta['model_names'])
+        self.classes = np.asarray(meta['classes'])
+
+    @staticmethod
+    def paths(models_dir):
+        return (os.path.join(models_dir, 'prediction_lookup.npy'),
+                os.path.join(models_dir, 'prediction_lookup_meta.pkl'))
+
+    @classmethod
+    def load(cls, models_dir, ensemble, models_fingerprint):
+        # Returns None when the table is missing or was built for other models
+        table_path, meta_path = cls.paths(models_dir)
+        if not os.path.exists(table_path) or not os.path.exists(meta_path):
+            return None
+        meta = joblib.load(meta_path)
+        if (meta['symptoms_list'] != ensemble.symptoms_list
+                or meta['models_fingerprint'] != models_fingerprint):
+            print("Prediction lookup table is stale, using live inference.")
+            return None
+        return cls(np.load(table_path, mmap_mode='r'), meta)
+
+    def lookup(self, masks):
+        rows = self.table[masks]
+        label_ids = {name: rows['labels'][:, i] for i, name in enumerate(self.model_names)}
+        confidences = {
+            name: rows['confidence'][:, i].astype(np.float64) for i, name in enumerate(self.model_names)
+        }
+        return EnsembleResult(self.classes, label_ids, confidences, final_ids=rows['vote'])
+
+
+def build_lookup_table(ensemble, chunk_size=1 << 16):
+    # Evaluate the ensemble on every bitmask over the symptom vocabulary
+    n_symptoms = len(ensemble.symptoms_list)
+    if n_symptoms > MAX_LOOKUP_SYMPTOMS:
+        raise ValueError(f"{n_symptoms} symptoms is too many to enumerate (max {MAX_LOOKUP_SYMPTOMS})")
+    if len(ensemble.classes) > 255:
+        raise ValueError("Class ids do not fit in uint8")
+
+    n_models = len(ensemble.models)
+    table = np.zeros(1 << n_symptoms, dtype=[
+        ('vote', np.uint8),
+        ('labels', np.uint8, (n_models,)),
+        ('confidence', np.float16, (n_models,))
+    ])
+    bits = np.arange(n_symptoms)
+    for start in range(0, len(table), chunk_size):
+        masks = np.arange(start, min(start + chunk_size, len(table)))
+        result = ensemble.predict(((masks[:, None] >> bits) & 1).astype(np.float64))
+        table['vote'][masks] = result.final_ids
+        for i, name in enumerate(ensemble.models):
+            table['labels'][masks, i] = result.label_ids[name]
+            table['confidence'][masks, i] = result.confidences[name]
+    return table
+
+
+class DiseaseEnsemble:
+    def __init__(self, models, symptoms_list):
+        self.models = models
+        self.symptoms_list = list(symptoms_list)
+        # Symptom -> column lookup, built once when the models are loaded
+        self.symptom_index = {symptom: i for i, symptom in enumerate(self.symptoms_list)}
+        self.classes = np.unique(np.concatenate([model.classes_ for model in models.values()]))
+        # Column of each model's classes_ inside the shared class list
+        self.class_columns = {
+            name: np.searchsorted(self.classes, model.classes_) for name, model in models.items()
+        }
+        self.lookup_table = None
+        # Cascade mode settings, see set_cascade(); None runs every model
+        self.cascade_order = None
+        self.cascade_min_confidence = None
+        self.cascade_min_margin = None
+        # Optional InferenceExecutor; without one the models run one after another
+        self.executor = None
+        # Large vocabularies are vectorized as CSR, see SPARSE_MIN_SYMPTOMS
+        self.sparse_input = len(self.symptoms_list) >= SPARSE_MIN_SYMPTOMS
+
+    def set_cascade(self, order, min_confidence, min_margin):
+        # Models listed first are run first; anything not listed is appended in load order
+        order = [name for name in order if name in self.models]
+        self.cascade_order = order + [name for name in self.models if name not in order]
+        self.cascade_min_confidence = min_confidence
+        self.cascade_min_margin = min_margin
+
+    def vectorize(self, symptom_sets):
+        # One row per symptom set, one column per known symptom; unknown symptoms are ignored
+        if self.sparse_input:
+            return self.vectorize_sparse(symptom_sets)
+        matrix = np.zeros((len(symptom_sets), len(self.symptoms_list)))
+        for row, user_symptoms in enumerate(symptom_sets):
+            columns = [self.symptom_index[s] for s in user_symptoms if s in self.symptom_index]
+            matrix[row, columns] = 1
+        return matrix
+
+    def vectorize_sparse(self, symptom_sets):
+        # Same as vectorize() as a CSR matrix; memory follows the number of symptoms given
+        indices, indptr = [], [0]
+        for user_symptoms in symptom_sets:
+            indices.extend(sorted({self.symptom_index[s] for s in user_symptoms if s in self.symptom_index}))
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.ones(len(indices)), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int32)),
+            shape=(len(symptom_sets), len(self.symptoms_list))
+        )
+
+    def bitmasks(self, symptom_sets):
+        masks = np.zeros(len(symptom_sets), dtype=np.int64)
+        for row, user_symptoms in enumerate(symptom_sets):
+            for column in {self.symptom_index[s] for s in user_symptoms if s in self.symptom_index}:
+                masks[row] |= 1 << column
+        return masks
+
+    def model_probabilities(self, name, input_matrix):
+        # A single predict_proba call per model; the label is classes_[argmax]
+        model = self.models[name]
+        with span(f'model-{name}', 'healix_model_inference_seconds', model=name):
+            input_matrix = model_input(model, input_matrix)
+            probs = np.zeros((input_matrix.shape[0], len(self.classes)))
+            if hasattr(model, 'predict_proba'):
+                probs[:, self.class_columns[name]] = model.predict_proba(input_matrix)
+            else:
+                label_ids = np.searchsorted(self.classes, model.predict(input_matrix))
+                probs[np.arange(len(label_ids)), label_ids] = 1
+        return probs
+
+    def run_models(self, names, input_matrix):
+        if self.executor is None:
+            return {name: self.model_probabilities(name, input_matrix) for name in names}, []
+        probabilities, timed_out = self.executor.run(
+            {name: partial(self.model_probabilities, name, input_matrix) for name in names}
+        )
+        for name in timed_out:
+            registry.inc('healix_model_timeouts_total', model=name)
+        # Keep the configured model order regardless of completion order
+        return {name: probabilities[name] for name in names if name in probabilities}, timed_out
+
+    def predict(self, input_matrix):
+        probabilities, timed_out = self.run_models(list(self.models), input_matrix)
+        if not probabilities:
+            raise InferenceTimeout(f"No model answered within {self.executor.deadline}s")
+        result = EnsembleResult.from_probabilities(self.classes, probabilities)
+        result.timed_out = timed_out
+        return result
+
+    def predict_cascade(self, input_matrix):
+        # Run the cheapest model on every row and the rest only on rows where it is unsure
+        n_rows = input_matrix.shape[0]
+        first, rest = self.cascade_order[0], self.cascade_order[1:]
+        probabilities = {name: np.zeros((n_rows, len(self.classes))) for name in self.cascade_order}
+        evaluated = {name: np.zeros(n_rows, dtype=bool) for name in self.cascade_order}
+
+        # The first stage runs inline; the deadline applies to the escalation stage
+        probabilities[first] = self.model_probabilities(first, input_matrix)
+        evaluated[first][:] = True
+
+        ranked = np.sort(probabilities[first], axis=1)
+        top, margin = ranked[:, -1], ranked[:, -1] - ranked[:, -2]
+        escalate = (top < self.cascade_min_confidence) | (margin < self.cascade_min_margin)
+        timed_out = []
+        if escalate.any():
+            escalated, timed_out = self.run_models(rest, input_matrix[escalate])
+            for name, probs in escalated.items():
+                probabilities[name][escalate] = probs
+                evaluated[name] = escalate
+        for name in timed_out:
+            del probabilities[name], evaluated[name]
+        result = EnsembleResult.from_probabilities(self.classes, probabilities, evaluated)
+        result.timed_out = timed_out
+        return result
+
+    def predict_symptoms(self, symptom_sets, need_probabilities=False):
+        # The lookup table has no per-class vectors, so differentials use live inference
+        if self.lookup_table is not None and not need_probabilities:
+            with span('lookup'):
+                return self.lookup_table.lookup(self.bitmasks(symptom_sets))
+        with span('vectorize'):
+            input_matrix = self.vectorize(symptom_sets)
+        if self.cascade_order is not None:
+            return self.predict_cascade(input_matrix)
+        return self.predict(input_matrix)
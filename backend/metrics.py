@@ -0,0 +1,209 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Request timing and Prometheus-style metrics.
+# span('db') times a section of the current request: it adds to the request's
+# Server-Timing header (summed per name) and to the healix_span_duration_seconds
+# histogram. Histograms (observe) and counters (inc) live in the process; with
+# METRICS_DIR set (gunicorn.conf.py does) each process also writes them to
+# METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS, and render() adds up the files of
+# all processes, so /metrics shows the same totals whichever worker answers it. Files of
+# exited workers are kept so that counters never go down; gunicorn clears the directory
+# when it starts.
+
+# Seconds; Prometheus adds +Inf
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRIC_HELP = {
+    'healix_http_requests_total': ('counter', "HTTP requests by route, method and status"),
+    'healix_http_errors_total': ('counter', "HTTP responses with a 5xx status"),
+    'healix_http_request_duration_seconds': ('histogram', "Time to handle a request, by route"),
+    'healix_span_duration_seconds': ('histogram', "Time spent in named sections of requests"),
+    'healix_model_inference_seconds': ('histogram', "Time of one symptom model's predict call"),
+    'healix_model_timeouts_total': ('counter', "Models left out of a prediction by the deadline"),
+    'healix_upstream_seconds': ('histogram', "Time of calls to external services"),
+    'healix_upstream_errors_total': ('counter', "Failed calls to external services"),
+}
+
+# Server-Timing entries of the request being handled: {name: [seconds, count]}
+current_timings = contextvars.ContextVar('current_timings', default=None)
+
+
+def format_labels(labels, extra=''):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    pairs = [f'{name}="{escape(value)}"' for name, value in labels] + ([extra] if extra else [])
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class MetricsRegistry:
+    def __init__(self, directory=None, buckets=DEFAULT_BUCKETS, flush_interval=1.0):
+        self.directory = directory
+        self.buckets = buckets
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        # (metric, labels) -> value for counters, [bucket counts..., sum] for histograms.
+        # A forked worker starts empty: its parent's numbers are the parent's file.
+        self._counters = {}
+        self._histograms = {}
+        self._dirty = False
+        self._pid = os.getpid()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._run, name='metrics-writer', daemon=True).start()
+            atexit.register(self.flush)
+
+    def clear(self):
+        # Drops this process's numbers (the tests start every case from zero)
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._dirty = True
+
+    def inc(self, metric, amount=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._dirty = True
+
+    def observe(self, metric, seconds, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            # Per-bucket counts here; cumulative when rendered. Last two: +Inf, sum
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+                    break
+            else:
+                values[-2] += 1
+            values[-1] += seconds
+            self._dirty = True
+
+    def _snapshot(self):
+        return {
+            'counters': [[m, labels, value] for (m, labels), value in self._counters.items()],
+            'histograms': [[m, labels, values] for (m, labels), values in self._histograms.items()]
+        }
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        if not self.directory or self._pid != os.getpid():
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = self._snapshot()
+            self._dirty = False
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def collect(self):
+        # Totals over every process that wrote to directory, this one taken live
+        snapshots = []
+        if self.directory and os.path.isdir(self.directory):
+            own = f"{os.getpid()}.json"
+            for name in os.listdir(self.directory):
+                if name.endswith('.json') and name != own:
+                    try:
+                        with open(os.path.join(self.directory, name)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+        with self._lock:
+            if self._pid == os.getpid():
+                snapshots.append(json.loads(json.dumps(self._snapshot())))
+        counters, histograms = {}, {}
+        for snapshot in snapshots:
+            for metric, labels, value in snapshot['counters']:
+                key = (metric, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for metric, labels, values in snapshot['histograms']:
+                key = (metric, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+        return counters, histograms
+
+    def render(self):
+        # Prometheus text exposition format
+        counters, histograms = self.collect()
+        lines = []
+        described = set()
+
+        def describe(metric, kind):
+            if metric not in described:
+                described.add(metric)
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(metric, (kind, metric))[1]}")
+                lines.append(f"# TYPE {metric} {kind}")
+
+        for (metric, labels), value in sorted(counters.items()):
+            describe(metric, 'counter')
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        for (metric, labels), values in sorted(histograms.items()):
+            describe(metric, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{metric}_bucket{format_labels(labels, le)} {cumulative}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {values[-1]}")
+            lines.append(f"{metric}_count{format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(os.environ.get('METRICS_DIR') or None,
+                           flush_interval=float(os.environ.get('METRICS_FLUSH_SECONDS', 1)))
+
+
+def record(name, seconds, metric='healix_span_duration_seconds', **labels):
+    # Adds a timed section to the current request (if any) and to its histogram
+    timings = current_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    registry.observe(metric, seconds, **(labels or {'span': name}))
+
+
+@contextmanager
+def span(name, metric='healix_span_duration_seconds', **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, metric, **labels)
+
+
+def server_timing(timings, total):
+    # Server-Timing: auth;dur=0.8, db;dur=2.1;desc="3x", total;dur=9.5
+    parts = []
+    for name, (seconds, count) in timings.items():
+        part = f"{name};dur={seconds * 1000:.1f}"
+        if count > 1:
+            part += f';desc="{count}x"'
+        parts.append(part)
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
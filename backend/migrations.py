@@ -0,0 +1,79 @@
+import time
+from sqlalchemy import BigInteger, inspect, text, update
+from symptom_encoding import encode_mask
+
+# Schema changes for databases created by an older version of the app. db.create_all()
+# only creates missing tables, so columns and indexes added to existing models are
+# applied here. Every step checks the live schema first and is safe to run repeatedly.
+# gunicorn runs them once at startup, before any worker (app.prepare_database from
+# on_starting in gunicorn.conf.py). With several app instances on one database set
+# MIGRATE_ON_START=0 and run them once per deploy instead:
+#   python migrations.py
+# On a large Postgres table the index builds block writes while they run; create them
+# by hand with CREATE INDEX CONCURRENTLY first and this script will skip them.
+
+
+def add_column(conn, table, column, ddl):
+    if column in {c['name'] for c in inspect(conn).get_columns(table)}:
+        return False
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def create_indexes(conn, metadata):
+    # Indexes declared on the models (__table_args__) that the database does not have yet
+    created = []
+    inspector = inspect(conn)
+    for table in metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+                created.append(index.name)
+    return created
+
+
+def upgrade(db):
+    with db.engine.begin() as conn:
+        if add_column(conn, 'skin_analysis_log', 'from_cache', "BOOLEAN NOT NULL DEFAULT FALSE"):
+            print("Migration: added skin_analysis_log.from_cache")
+        if add_column(conn, 'prediction', 'symptom_mask', BigInteger().compile(dialect=conn.dialect)):
+            print("Migration: added prediction.symptom_mask")
+        start = time.time()
+        created = create_indexes(conn, db.metadata)
+        if created:
+            print(f"Migration: created {', '.join(created)} in {time.time() - start:.1f}s")
+
+
+def backfill_prediction_symptoms(db, prediction, links, vocabulary, chunk_size=5000):
+    # Encodes predictions stored before symptom_mask existed (NULL mask) from their
+    # comma-separated text, one committed chunk at a time, so an interrupted run resumes
+    # where it stopped.
+    start, done, last_id = time.time(), 0, 0
+    while True:
+        rows = db.session.query(prediction.id, prediction.symptoms) \
+            .filter(prediction.symptom_mask.is_(None), prediction.id > last_id) \
+            .order_by(prediction.id).limit(chunk_size).all()
+        if not rows:
+            break
+        encoded = [vocabulary.encode(row.symptoms.split(',') if row.symptoms else []) for row in rows]
+        db.session.execute(update(prediction), [
+            {'id': row.id, 'symptom_mask': encode_mask(ids)} for row, ids in zip(rows, encoded)
+        ])
+        pairs = [{'prediction_id': row.id, 'symptom_id': symptom_id}
+                 for row, ids in zip(rows, encoded) for symptom_id in ids]
+        if pairs:
+            db.session.execute(links.insert(), pairs)
+        db.session.commit()
+        done += len(rows)
+        last_id = rows[-1].id
+    if done:
+        print(f"Migration: encoded symptoms of {done} predictions in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    # Creates missing tables, runs upgrade() and the symptom backfill
+    from app import app, prepare_database
+    with app.app_context():
+        prepare_database()
+    print(f"Database {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]} is up to date.")
@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from inference import DiseaseEnsemble, PredictionLookupTable, file_fingerprint
+from numpy_scoring import load_kernels
+
+# Versioned model artifacts live in models/versions/<version>/, newest version name wins.
+# A version is published by writing it to a hidden temp directory and renaming it into
+# place, so the watcher never sees a half-written version. The old flat models/ layout
+# is still loaded as version "legacy" when no versioned artifacts exist.
+
+MODELS_FILE = 'disease_prediction_models.pkl'
+SYMPTOMS_FILE = 'symptoms_list.pkl'
+KERNELS_FILE = 'disease_prediction_kernels.pkl'
+SMOKE_TEST_FILE = 'smoke_test.pkl'
+# Last Prediction id folded in by update_models.py
+CHECKPOINT_FILE = 'update_checkpoint.pkl'
+LEGACY_VERSION = 'legacy'
+
+# Symptom sets every version must handle before it is activated
+SMOKE_TEST_SETS = [
+    [],
+    ['fever'],
+    ['fever', 'cough', 'fatigue'],
+    ['nausea', 'vomiting', 'diarrhea'],
+    ['headache', 'nausea', 'sensitivity_to_light'],
+    ['not_a_symptom']
+]
+
+
+def versions_dir(models_dir):
+    return os.path.join(models_dir, 'versions')
+
+
+def list_versions(models_dir):
+    root = versions_dir(models_dir)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.startswith('.') and os.path.exists(os.path.join(root, name, MODELS_FILE))
+    )
+
+
+def version_path(models_dir, version):
+    if version == LEGACY_VERSION:
+        return models_dir
+    return os.path.join(versions_dir(models_dir), version)
+
+
+def latest_version(models_dir):
+    versions = list_versions(models_dir)
+    return versions[-1] if versions else LEGACY_VERSION
+
+
+def publish_version(models_dir, write_artifacts, version=None):
+    # write_artifacts(path) saves the files; the directory only appears once complete
+    version = version or time.strftime('%Y%m%d-%H%M%S')
+    root = versions_dir(models_dir)
+    os.makedirs(root, exist_ok=True)
+    tmp_path = os.path.join(root, f'.tmp-{version}')
+    os.makedirs(tmp_path)
+    write_artifacts(tmp_path)
+    os.rename(tmp_path, os.path.join(root, version))
+    return version
+
+
+class ModelVersion:
+    def __init__(self, version, path, models, symptoms_list, ensemble):
+        self.version = version
+        self.path = path
+        self.models = models
+        self.symptoms_list = symptoms_list
+        self.ensemble = ensemble
+        self.loaded_at = time.time()
+
+
+def load_version(models_dir, version, use_kernels=True):
+    path = version_path(models_dir, version)
+    symptoms_list = joblib.load(os.path.join(path, SYMPTOMS_FILE))
+    models_path = os.path.join(path, MODELS_FILE)
+    fingerprint = file_fingerprint(models_path)
+
+    # The NumPy kernels are memory-mapped read-only, so every worker shares one copy
+    # through the page cache. The sklearn fallback is not: joblib only maps its plain
+    # arrays (copy-on-write), and the forest's tree nodes are copied into each process.
+    # Preloaded workers (gunicorn.conf.py) share those pages only until they are written.
+    models = None
+    if use_kernels:
+        models = load_kernels(os.path.join(path, KERNELS_FILE), fingerprint, mmap_mode='r')
+    if models is None:
+        # 'c' (private copy-on-write) because libsvm wants writable buffers
+        models = joblib.load(models_path, mmap_mode='c')
+
+    ensemble = DiseaseEnsemble(models, symptoms_list)
+    ensemble.lookup_table = PredictionLookupTable.load(path, ensemble, fingerprint)
+    return ModelVersion(version, path, models, symptoms_list, ensemble)
+
+
+def smoke_test(model_version):
+    # Raises ValueError if the version produces unusable output
+    ensemble = model_version.ensemble
+    result = ensemble.predict_symptoms(SMOKE_TEST_SETS, need_probabilities=True)
+    for name, probs in result.probabilities.items():
+        # In cascade mode later models leave the rows they were not asked about all zero
+        if result.evaluated is not None:
+            probs = probs[result.evaluated[name]]
+        if not np.all(np.isfinite(probs)) or not np.allclose(probs.sum(axis=1), 1, atol=1e-3):
+            raise ValueError(f"{name} returned invalid probabilities")
+
+    # Optional labelled vectors saved by train_models.py next to the models
+    smoke_path = os.path.join(model_version.path, SMOKE_TEST_FILE)
+    if os.path.exists(smoke_path):
+        smoke = joblib.load(smoke_path)
+        predicted = ensemble.predict_symptoms(smoke['symptom_sets']).final_predictions
+        accuracy = np.mean(predicted == np.asarray(smoke['expected']))
+        if accuracy < smoke['min_accuracy']:
+            raise ValueError(f"Smoke test accuracy {accuracy:.3f} below {smoke['min_accuracy']}")
+
+
+class ModelRegistry:
+    def __init__(self, models_dir, configure=None, poll_interval=30, use_kernels=True, pinned_version=None):
+        self.models_dir = models_dir
+        # Called with each new DiseaseEnsemble before it goes live (cascade, executor, ...)
+        self.configure = configure
+        self.poll_interval = poll_interval
+        self.use_kernels = use_kernels
+        self.pinned_version = pinned_version
+        # Requests read this once and keep using that version until they finish
+        self.current = None
+        self.rejected = set()
+        self._lock = threading.Lock()
+        self._watcher_pid = None
+
+    @property
+    def version(self):
+        return self.current.version if self.current else None
+
+    def load(self, version):
+        model_version = load_version(self.models_dir, version, self.use_kernels)
+        if self.configure:
+            self.configure(model_version.ensemble)
+        smoke_test(model_version)
+        return model_version
+
+    def load_initial(self):
+        # Newest version that passes its smoke test, falling back to older ones
+        if self.pinned_version:
+            candidates = [self.pinned_version]
+        else:
+            candidates = list(reversed(list_versions(self.models_dir))) + [LEGACY_VERSION]
+        for version in candidates:
+            try:
+                self.current = self.load(version)
+                print(f"Model version {version} loaded.")
+                return self.current
+            except Exception as e:
+                print(f"Error loading model version {version}: {e}")
+                self.rejected.add(version)
+        return None
+
+    def check_for_update(self):
+        # Load and smoke test outside the lock; the swap itself is a single reference assignment
+        if self.pinned_version:
+            return False
+        version = latest_version(self.models_dir)
+        if version == self.version or version in self.rejected or version == LEGACY_VERSION:
+            return False
+        try:
+            model_version = self.load(version)
+        except Exception as e:
+            print(f"Rejected model version {version}: {e}")
+            self.rejected.add(version)
+            return False
+        with self._lock:
+            self.current = model_version
+        print(f"Switched to model version {version}.")
+        return True
+
+    def start_watching(self):
+        # One watcher thread per process; forked gunicorn workers start their own
+        if not self.poll_interval or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='model-registry', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.check_for_update()
+            except Exception as e:
+                print(f"Model registry watcher error: {e}")
@@ -0,0 +1,266 @@
+import os
+
+import joblib
+import numpy as np
+from scipy import sparse
+
+# Flat NumPy versions of the fitted RandomForest / GaussianNB / SVC models.
+# For single-row requests most of sklearn's time goes to input validation and
+# dispatch, so evaluating the exported arrays directly is much cheaper.
+# export_numpy_models.py writes the arrays, load_kernels() turns them back into
+# objects with the same classes_ / predict_proba / predict interface.
+# All kernels take dense arrays or scipy CSR matrices.
+
+KERNELS_PATH = 'models/disease_prediction_kernels.pkl'
+
+# libsvm constants for pairwise coupling (svm.cpp: svm_predict_probability)
+SVC_MIN_PROB = 1e-7
+# Below this many rows the scalar coupling loop beats the vectorized one
+SVC_SCALAR_COUPLING_ROWS = 4
+
+
+def export_forest(model):
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+
+    left, right, feature, threshold, value = [], [], [], [], []
+    for offset, tree in zip(offsets, trees):
+        is_leaf = tree.children_left == -1
+        # Leaves point at themselves so traversal can run a fixed number of steps
+        own_index = np.arange(tree.node_count) + offset
+        left.append(np.where(is_leaf, own_index, tree.children_left + offset))
+        right.append(np.where(is_leaf, own_index, tree.children_right + offset))
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(tree.threshold)
+        leaf_value = tree.value[:, 0, :]
+        value.append(leaf_value / leaf_value.sum(axis=1, keepdims=True))
+
+    return {
+        'kind': 'forest',
+        'classes': model.classes_,
+        'roots': offsets.astype(np.int64),
+        'left': np.concatenate(left).astype(np.int64),
+        'right': np.concatenate(right).astype(np.int64),
+        'feature': np.concatenate(feature).astype(np.int64),
+        'threshold': np.concatenate(threshold),
+        'value': np.concatenate(value),
+        'max_depth': max(tree.max_depth for tree in trees)
+    }
+
+
+def export_gaussian_nb(model):
+    # Gaussian log-likelihood expanded into bias + X @ linear + X**2 @ quadratic
+    inv_var = 1.0 / model.var_
+    log_prior = np.log(model.class_prior_)
+    bias = log_prior - 0.5 * np.sum(np.log(2.0 * np.pi * model.var_), axis=1) \
+        - 0.5 * np.sum(model.theta_ ** 2 * inv_var, axis=1)
+    return {
+        'kind': 'gaussian_nb',
+        'classes': model.classes_,
+        'bias': bias,
+        'linear': (model.theta_ * inv_var).T,
+        'quadratic': (-0.5 * inv_var).T
+    }
+
+
+def squared(X):
+    return X.multiply(X) if sparse.issparse(X) else X * X
+
+
+def row_sums(X):
+    return np.asarray(X.sum(axis=1)).ravel()
+
+
+def export_svc(model):
+    if model.kernel != 'rbf':
+        raise ValueError(f"Only the rbf kernel is supported, got {model.kernel}")
+    if not model.probability:
+        raise ValueError("SVC must be trained with probability=True")
+
+    n_classes = len(model.classes_)
+    starts = np.cumsum(np.concatenate([[0], model.n_support_]))
+    pairs = [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+
+    # An SVC fitted on CSR keeps CSR support vectors (they stay sparse in the export)
+    # and CSR dual coefficients
+    support_vectors, dual_coef = model.support_vectors_, model.dual_coef_
+    if sparse.issparse(support_vectors):
+        support_vectors = sparse.csr_matrix(support_vectors, dtype=np.float64)
+        dual_coef = dual_coef.toarray()
+
+    # One column of dual coefficients per one-vs-one pair, zero for unrelated support vectors
+    pair_coef = np.zeros((support_vectors.shape[0], len(pairs)))
+    for k, (i, j) in enumerate(pairs):
+        pair_coef[starts[i]:starts[i + 1], k] = dual_coef[j - 1, starts[i]:starts[i + 1]]
+        pair_coef[starts[j]:starts[j + 1], k] = dual_coef[i, starts[j]:starts[j + 1]]
+
+    return {
+        'kind': 'svc',
+        'classes': model.classes_,
+        'support_vectors': support_vectors,
+        'support_norms': row_sums(squared(support_vectors)),
+        'pair_coef': pair_coef,
+        'intercept': model.intercept_,
+        'gamma': float(model._gamma),
+        'prob_a': model.probA_,
+        'prob_b': model.probB_,
+        'pairs': np.array(pairs, dtype=np.int64)
+    }
+
+
+EXPORTERS = {
+    'RandomForestClassifier': export_forest,
+    'GaussianNB': export_gaussian_nb,
+    'SVC': export_svc
+}
+
+
+def export_models(models):
+    exported = {}
+    for name, model in models.items():
+        exporter = EXPORTERS.get(type(model).__name__)
+        if exporter is None:
+            raise ValueError(f"No NumPy export for {name} ({type(model).__name__})")
+        exported[name] = exporter(model)
+    return exported
+
+
+class Kernel:
+    accepts_sparse = True
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.classes_ = arrays['classes']
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+class ForestKernel(Kernel):
+    def __init__(self, arrays):
+        super().__init__(arrays)
+        # The trees split on a small subset of a large vocabulary; CSR input is
+        # densified over just those columns
+        self.used_features = np.unique(arrays['feature'])
+        self.local_feature = np.searchsorted(self.used_features, arrays['feature'])
+
+    def predict_proba(self, X):
+        a = self.arrays
+        feature = a['feature']
+        if sparse.issparse(X):
+            X, feature = X[:, self.used_features].toarray(), self.local_feature
+        # sklearn compares float32 features against the float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(a['roots'], (X.shape[0], len(a['roots'])))
+        for _ in range(a['max_depth']):
+            go_left = X[rows, feature[nodes]] <= a['threshold'][nodes]
+            nodes = np.where(go_left, a['left'][nodes], a['right'][nodes])
+        return a['value'][nodes].mean(axis=1)
+
+
+class GaussianNBKernel(Kernel):
+    def predict_proba(self, X):
+        a = self.arrays
+        X = X.astype(np.float64) if sparse.issparse(X) else np.asarray(X, dtype=np.float64)
+        jll = a['bias'] + X @ a['linear'] + squared(X) @ a['quadratic']
+        jll -= jll.max(axis=1, keepdims=True)
+        probs = np.exp(jll)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+
+class SVCKernel(Kernel):
+    def decision_values(self, X):
+        a = self.arrays
+        X = X.astype(np.float64) if sparse.issparse(X) else np.asarray(X, dtype=np.float64)
+        dot = X @ a['support_vectors'].T
+        if sparse.issparse(dot):
+            dot = dot.toarray()
+        sq_dist = row_sums(squared(X))[:, None] + a['support_norms'] - 2.0 * dot
+        return np.exp(-a['gamma'] * sq_dist) @ a['pair_coef'] + a['intercept']
+
+    def predict_proba(self, X):
+        a = self.arrays
+        dec = self.decision_values(X)
+        n_rows, n_classes = dec.shape[0], len(self.classes_)
+
+        # Platt scaling of each one-vs-one decision value
+        pair_prob = 1.0 / (1.0 + np.exp(dec * a['prob_a'] + a['prob_b']))
+        pair_prob = np.clip(pair_prob, SVC_MIN_PROB, 1 - SVC_MIN_PROB)
+        r = np.zeros((n_rows, n_classes, n_classes))
+        i, j = a['pairs'][:, 0], a['pairs'][:, 1]
+        r[:, i, j] = pair_prob
+        r[:, j, i] = 1 - pair_prob
+        if n_rows <= SVC_SCALAR_COUPLING_ROWS:
+            return np.array([self.couple_row(row) for row in r.tolist()]).reshape(n_rows, n_classes)
+        return self.couple(r)
+
+    @staticmethod
+    def couple_row(r):
+        # libsvm multiclass_probability (Wu, Lin and Weng 2004, method 2) for one row
+        k = len(r)
+        Q = [[-r[j][t] * r[t][j] for j in range(k)] for t in range(k)]
+        for t in range(k):
+            Q[t][t] = sum(r[j][t] ** 2 for j in range(k) if j != t)
+        p = [1.0 / k] * k
+        eps = 0.005 / k
+
+        for _ in range(max(100, k)):
+            Qp = [sum(Q[t][j] * p[j] for j in range(k)) for t in range(k)]
+            pQp = sum(p[t] * Qp[t] for t in range(k))
+            if max(abs(Qp[t] - pQp) for t in range(k)) < eps:
+                break
+            for t in range(k):
+                diff = (-Qp[t] + pQp) / Q[t][t]
+                p[t] += diff
+                pQp = (pQp + diff * (diff * Q[t][t] + 2 * Qp[t])) / (1 + diff) / (1 + diff)
+                Qp = [(Qp[j] + diff * Q[t][j]) / (1 + diff) for j in range(k)]
+                p = [pj / (1 + diff) for pj in p]
+        return p
+
+    @staticmethod
+    def couple(r):
+        # Same as couple_row, vectorized over rows; converged rows stop updating
+        n_rows, k = r.shape[0], r.shape[1]
+        Q = -r.transpose(0, 2, 1) * r
+        Q[:, np.arange(k), np.arange(k)] = np.sum(r ** 2, axis=1)
+        p = np.full((n_rows, k), 1.0 / k)
+        eps = 0.005 / k
+        active = np.ones(n_rows, dtype=bool)
+
+        for _ in range(max(100, k)):
+            Qp = np.einsum('ntj,nj->nt', Q, p)
+            pQp = np.sum(p * Qp, axis=1)
+            active &= np.max(np.abs(Qp - pQp[:, None]), axis=1) >= eps
+            if not active.any():
+                break
+            for t in range(k):
+                diff = np.where(active, (-Qp[:, t] + pQp) / Q[:, t, t], 0.0)
+                p[:, t] += diff
+                pQp = (pQp + diff * (diff * Q[:, t, t] + 2 * Qp[:, t])) / (1 + diff) / (1 + diff)
+                Qp = (Qp + diff[:, None] * Q[:, t, :]) / (1 + diff)[:, None]
+                p /= (1 + diff)[:, None]
+        return p
+
+
+KERNELS = {
+    'forest': ForestKernel,
+    'gaussian_nb': GaussianNBKernel,
+    'svc': SVCKernel
+}
+
+
+def save_kernels(models, path, models_fingerprint):
+    # models_fingerprint ties the export to the pickle it came from (inference.file_fingerprint)
+    joblib.dump({'models': export_models(models), 'models_fingerprint': models_fingerprint}, path)
+
+
+def load_kernels(path=KERNELS_PATH, models_fingerprint=None, mmap_mode=None):
+    # Returns None when the export is missing or was made from other models
+    if not os.path.exists(path):
+        return None
+    exported = joblib.load(path, mmap_mode=mmap_mode)
+    if models_fingerprint is not None and exported['models_fingerprint'] != models_fingerprint:
+        print("NumPy kernels are stale, using the sklearn models.")
+        return None
+    return {name: KERNELS[arrays['kind']](arrays) for name, arrays in exported['models'].items()}
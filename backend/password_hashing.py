@@ -0,0 +1,73 @@
+import os
+import threading
+
+from executors import ForkSafeExecutor
+
+# bcrypt off the request path. Each hash costs ~2^rounds work (hundreds of ms at the
+# default 12), so hashing runs on a small per-process pool of AUTH_HASH_THREADS threads
+# (bcrypt releases the GIL; by default the CPUs shared out between the WEB_CONCURRENCY
+# web workers) and AUTH_HASH_MAX_PENDING calls (default twice the threads) may queue on
+# it. Callers beyond that wait up to AUTH_HASH_QUEUE_MS for a place, then /auth/login and
+# /auth/register answer 503, so a login burst cannot hold every web worker thread and
+# CPU from /predict for long. AUTH_HASH_THREADS=0 hashes inline in the request thread.
+# BCRYPT_ROUNDS sets the cost of new hashes; a login with a hash of another cost is
+# rehashed at the new one.
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def hash_rounds(pw_hash):
+    # bcrypt hashes look like $2b$12$<salt+hash>
+    try:
+        return int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def default_threads(web_workers=1):
+    # bcrypt is CPU-bound: about one hashing thread per CPU across all web worker processes
+    return max(1, (os.cpu_count() or 1) // max(1, web_workers))
+
+
+class PasswordHasher:
+    def __init__(self, bcrypt, rounds=12, max_workers=None, max_pending=None, queue_timeout=2, timeout=10):
+        self.bcrypt = bcrypt
+        self.rounds = rounds
+        if max_workers is None:
+            max_workers = default_threads()
+        if max_pending is None:
+            max_pending = 2 * max_workers
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.pool = ForkSafeExecutor(max_workers, 'bcrypt') if max_workers else None
+        # Calls running or queued on the pool, bounded by max_workers + max_pending
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending) if max_workers else None
+        self.rejected = 0
+
+    def _run(self, fn, *args):
+        if not self.max_workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected += 1
+            raise HasherBusy("Too many concurrent password checks")
+        try:
+            future = self.pool.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # Freed when the hash is done, even if this caller stopped waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(self.timeout)
+
+    def hash(self, password):
+        return self._run(self.bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def check(self, pw_hash, password):
+        return self._run(self.bcrypt.check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        return hash_rounds(pw_hash) != self.rounds
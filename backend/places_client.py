@@ -0,0 +1,262 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from executors import ForkSafeExecutor
+from metrics import registry, span
+
+# Google Places Text Search for /doctors. One pooled requests.Session per process keeps
+# connections to the API alive, and every call has a connect and a read timeout so a
+# slow upstream cannot hold a web worker thread.
+# Results are cached per normalized (specialty, location) for PLACES_CACHE_TTL seconds.
+# For PLACES_STALE_TTL seconds after that an expired entry is still answered at once
+# while one background request refreshes it (stale-while-revalidate); it is also served
+# if the refresh fails. Concurrent misses for the same key share a single upstream call.
+# Every failure, including a malformed answer or a coalesced caller giving up on the
+# shared call, is raised as PlacesError; places without coordinates are left out.
+# place_details() fetches Place Details (phone numbers) for several places at once on a
+# small thread pool and returns whatever arrived before the deadline; details are cached
+# per place_id for details_ttl seconds, and late answers still fill the cache.
+
+PLACES_BASE_URL = 'https://maps.googleapis.com/maps/api/place'
+# Only what the doctor list shows; Place Details is billed per field group
+DETAILS_FIELDS = 'place_id,formatted_phone_number,international_phone_number,opening_hours'
+
+
+class PlacesError(Exception):
+    pass
+
+
+def search_key(specialty, location):
+    # "Cardiologist ", "cardiologist" and "New  York,NY" / "new york, ny" share an entry
+    def normalize(text):
+        return ' '.join(text.lower().replace(',', ', ').split())
+    return normalize(specialty), normalize(location)
+
+
+def has_location(place):
+    try:
+        location = place['geometry']['location']
+        return isinstance(location['lat'], (int, float)) and isinstance(location['lng'], (int, float))
+    except (KeyError, TypeError):
+        return False
+
+
+class PlacesClient:
+    def __init__(self, api_key, base_url=PLACES_BASE_URL, connect_timeout=2.0, read_timeout=5.0,
+                 ttl=3600, stale_ttl=86400, max_entries=1024, pool_size=10,
+                 details_workers=8, details_ttl=7 * 86400, max_details=10000):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.pool_size = pool_size
+        self.details_workers = details_workers
+        self.details_ttl = details_ttl
+        self.max_details = max_details
+        self._session = None
+        self._pid = None
+        self.details_pool = ForkSafeExecutor(details_workers, 'places-details')
+        self._lock = threading.Lock()
+        # key -> (fetched_at, results), least recently used first
+        self._entries = OrderedDict()
+        # key -> Future of the upstream call in progress
+        self._inflight = {}
+        # place_id -> (fetched_at, details)
+        self._details = OrderedDict()
+        # Counters for health reporting
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.details_hits = 0
+        self.details_fetched = 0
+        self.details_late = 0
+
+    @property
+    def session(self):
+        # Sockets must not be shared with a forked parent, so each (gunicorn) worker
+        # process opens its own pool
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
+
+    def get_json(self, path, params):
+        self.upstream_calls += 1
+        try:
+            with span('places', 'healix_upstream_seconds', service='places', call=path.split('/')[0]):
+                response = self.session.get(f"{self.base_url}/{path}", params=dict(params, key=self.api_key),
+                                            timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+            if not isinstance(data, dict):
+                raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+            return data
+        except (requests.RequestException, ValueError) as e:
+            self.upstream_errors += 1
+            registry.inc('healix_upstream_errors_total', service='places')
+            raise PlacesError(f"Places request failed: {e}") from e
+
+    def _text_search(self, specialty, location):
+        data = self.get_json('textsearch/json', {'query': f"{specialty} doctors in {location}"})
+        status = data.get('status')
+        if status == 'ZERO_RESULTS':
+            return []
+        if status != 'OK':
+            self.upstream_errors += 1
+            registry.inc('healix_upstream_errors_total', service='places')
+            raise PlacesError(f"Places API error: {status} - {data.get('error_message')}")
+        results = data.get('results', [])
+        if not isinstance(results, list):
+            self.upstream_errors += 1
+            registry.inc('healix_upstream_errors_total', service='places')
+            raise PlacesError("Places API returned malformed results")
+        # The doctor list and map need coordinates
+        return [place for place in results if has_location(place)]
+
+    def search(self, specialty, location):
+        key = search_key(specialty, location)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry[0]
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    future, leader = self._join(key)
+                    if leader:
+                        threading.Thread(target=self._fetch, args=(key, specialty, location, future),
+                                         name='places-refresh', daemon=True).start()
+                    return entry[1]
+            self.misses += 1
+            future, leader = self._join(key)
+        if leader:
+            self._fetch(key, specialty, location, future)
+        # Followers wait for the leader's call, which is itself bounded by the timeouts
+        try:
+            return future.result(sum(self.timeout) + 1)
+        except FutureTimeoutError as e:
+            raise PlacesError("Timed out waiting for a Places search in progress") from e
+
+    def _join(self, key):
+        # Called under the lock: the first caller for a key makes the request
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future, False
+        future = self._inflight[key] = Future()
+        return future, True
+
+    def _fetch(self, key, specialty, location, future):
+        try:
+            results = self._text_search(specialty, location)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                entry = self._entries.get(key)
+            if entry is not None:
+                # Upstream down: keep answering with what we had
+                print(f"Places refresh failed, serving stale results: {e}")
+                future.set_result(entry[1])
+            else:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        future.set_result(results)
+
+    def _fetch_details(self, place_id):
+        data = self.get_json('details/json', {'place_id': place_id, 'fields': DETAILS_FIELDS})
+        if data.get('status') != 'OK':
+            self.upstream_errors += 1
+            registry.inc('healix_upstream_errors_total', service='places')
+            raise PlacesError(f"Places API error: {data.get('status')} - {data.get('error_message')}")
+        details = data.get('result')
+        if not isinstance(details, dict):
+            # Not cached: find_doctors would trip over it on every request
+            self.upstream_errors += 1
+            registry.inc('healix_upstream_errors_total', service='places')
+            raise PlacesError("Places API returned malformed details")
+        with self._lock:
+            self._details[place_id] = (time.monotonic(), details)
+            self._details.move_to_end(place_id)
+            while len(self._details) > self.max_details:
+                self._details.popitem(last=False)
+            self.details_fetched += 1
+        return details
+
+    def place_details(self, place_ids, deadline):
+        # {place_id: details} for the places whose details are cached or arrive within
+        # deadline seconds; the rest are simply missing
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for place_id in dict.fromkeys(place_ids):
+                entry = self._details.get(place_id)
+                if entry is not None and now - entry[0] < self.details_ttl:
+                    self._details.move_to_end(place_id)
+                    self.details_hits += 1
+                    found[place_id] = entry[1]
+                else:
+                    missing.append(place_id)
+        if not missing:
+            return found
+        pool = self.details_pool
+        # In copies of the caller's context, so the calls show in the request's timings
+        futures = {pool.submit(contextvars.copy_context().run, self._fetch_details, place_id): place_id
+                   for place_id in missing}
+        done, not_done = wait(futures, timeout=deadline)
+        for future in done:
+            try:
+                found[futures[future]] = future.result()
+            except PlacesError as e:
+                print(f"Place details for {futures[future]} failed: {e}")
+        for future in not_done:
+            # Calls still queued behind other requests are dropped; running ones finish
+            # in the background and are cached for the next search
+            future.cancel()
+            self.details_late += 1
+        return found
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+            details = len(self._details)
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'upstream_calls': self.upstream_calls,
+            'upstream_errors': self.upstream_errors,
+            'details_entries': details,
+            'details_hits': self.details_hits,
+            'details_fetched': self.details_fetched,
+            'details_late': self.details_late
+        }
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the Google Places web service, for testing the Places client
+# offline: point PlacesClient(base_url=stand_in.base_url) at it.
+#   with PlacesStandIn(delay=0.2) as stand_in:
+#       ...
+#       stand_in.calls['textsearch/json']
+# Text Search answers `results` made-up doctors per query and Place Details a phone
+# number for any place_id. delay (seconds) is added to every call and delays maps a
+# place_id to its own Place Details latency; status makes every call answer that API
+# status instead of OK.
+
+
+def fake_place(place_id, query=''):
+    number = sum(map(ord, place_id)) % 90 + 10
+    return {
+        'place_id': place_id,
+        'name': f"Dr. {place_id.title()} ({query})" if query else f"Dr. {place_id.title()}",
+        'formatted_address': f"{number} Test Street",
+        'rating': 4.5,
+        'user_ratings_total': number,
+        'opening_hours': {'open_now': True},
+        'geometry': {'location': {'lat': 40.7 + number / 1000, 'lng': -74.0 - number / 1000}}
+    }
+
+
+class PlacesStandIn:
+    def __init__(self, delay=0.0, delays=None, status='OK', results=3):
+        self.delay = delay
+        self.delays = delays or {}
+        self.results = results
+        self.status = status
+        self.calls = {}
+        self.queries = []
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                stand_in.answer(self, url.path.strip('/'), params)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def answer(self, handler, path, params):
+        with self.lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+            self.queries.append((path, params))
+        place_id = params.get('place_id')
+        time.sleep(self.delays.get(place_id, self.delay))
+        if self.status != 'OK':
+            body = {'status': self.status, 'error_message': 'stand-in error'}
+        elif path == 'textsearch/json':
+            query = params.get('query', '')
+            body = {'status': 'OK', 'results': [fake_place(f"place{i}", query) for i in range(self.results)]}
+        elif path == 'details/json':
+            body = {'status': 'OK', 'result': {
+                'place_id': place_id,
+                'formatted_phone_number': f"(555) {sum(map(ord, place_id)):03d}-0100",
+                'opening_hours': {'open_now': True, 'weekday_text': ['Monday: 9:00 AM - 5:00 PM']}
+            }}
+        else:
+            handler.send_error(404)
+            return
+        payload = json.dumps(body).encode('utf-8')
+        try:
+            handler.send_response(200)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (read timeout)
+            pass
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, name='places-stand-in', daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import skin_preprocessing
+
+# Results of /predict-skin keyed by upload content, so a re-uploaded photo skips the
+# forward pass. Exact repeats match on the SHA-256 of the bytes; re-compressed or
+# re-saved copies match on a 64-bit difference hash (dHash) within max_distance bits.
+# Every entry carries the skin model version that produced it and is only served for
+# that version. One cache per web worker process, least recently used evicted first.
+
+SKIN_CACHE_SIZE = int(os.environ.get('SKIN_CACHE_SIZE', 1024))
+SKIN_CACHE_MAX_DISTANCE = int(os.environ.get('SKIN_CACHE_MAX_DISTANCE', 4))
+HASH_SIZE = 8
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(source):
+    # dHash: brightness gradient sign between neighbouring pixels of a 9x8 thumbnail.
+    # source is upload bytes or the image already decoded for the model.
+    img = skin_preprocessing.load_image(source, (HASH_SIZE + 1, HASH_SIZE)).convert('L')
+    pixels = np.asarray(img, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distances(hashes, h):
+    xor = np.asarray(hashes, dtype=np.uint64) ^ np.uint64(h)
+    return np.unpackbits(xor.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+class SkinResultCache:
+    def __init__(self, max_entries=SKIN_CACHE_SIZE, max_distance=SKIN_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        # (model version, sha256) -> (perceptual hash, results), oldest first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, data, version):
+        # Returns (results or None, keys, image); keys go back into store() after a miss.
+        # Only an exact miss decodes the upload, and image (the decoded model-sized
+        # upload) is returned so inference does not decode it a second time.
+        sha = content_hash(data)
+        with self.lock:
+            entry = self.entries.get((version, sha))
+            if entry is not None:
+                self.entries.move_to_end((version, sha))
+                self.exact_hits += 1
+                return entry[1], (sha, entry[0]), None
+
+        image = skin_preprocessing.load_image(data)
+        phash = perceptual_hash(image)
+        with self.lock:
+            candidates = [key for key in self.entries if key[0] == version]
+            if candidates and self.max_distance >= 0:
+                distances = hamming_distances([self.entries[key][0] for key in candidates], phash)
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    self.entries.move_to_end(candidates[best])
+                    self.perceptual_hits += 1
+                    return self.entries[candidates[best]][1], (sha, phash), image
+            self.misses += 1
+        return None, (sha, phash), image
+
+    def store(self, keys, version, results):
+        sha, phash = keys
+        with self.lock:
+            self.entries[(version, sha)] = (phash, results)
+            self.entries.move_to_end((version, sha))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            hits = self.exact_hits + self.perceptual_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': hits,
+                'exact_hits': self.exact_hits,
+                'perceptual_hits': self.perceptual_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+            }
@@ -1,51 +1,161 @@
-import tensorflow as tf
-from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input, decode_predictions
-from tensorflow.keras.preprocessing import image
+import json
 import numpy as np
 import os
+import threading
+import skin_preprocessing
+
+# Backends for the skin model. 'keras' builds MobileNetV2 with TensorFlow; 'onnx' and
+# 'tflite' run a model exported by export_skin_model.py (optionally INT8 quantized)
+# and never import TensorFlow. All of them map a (n, 224, 224, 3) float32 batch to
+# (n, 1000) ImageNet probabilities.
+
+SKIN_MODELS_DIR = 'models/skin'
+LABELS_FILE = 'imagenet_labels.json'
+# Threads per forward pass; 0 lets the runtime decide
+SKIN_THREADS = int(os.environ.get('SKIN_THREADS', 0))
+
+
+def exported_model_path(backend, int8=False, models_dir=SKIN_MODELS_DIR):
+    extension = {'onnx': 'onnx', 'tflite': 'tflite'}[backend]
+    return os.path.join(models_dir, f"mobilenet_v2{'.int8' if int8 else ''}.{extension}")
+
+
+def model_version(backend=None, model_path=None):
+    # Identifies the weights serving predictions, e.g. to tag cached results (skin_cache.py);
+    # changes when the backend or the exported model file is replaced
+    backend = backend or os.environ.get('SKIN_BACKEND', 'keras')
+    path = model_path or os.environ.get('SKIN_MODEL_PATH')
+    if path is None and backend != 'keras':
+        path = exported_model_path(backend)
+    if path and os.path.exists(path):
+        return f"{backend}:{os.path.basename(path)}:{int(os.path.getmtime(path))}"
+    return f"{backend}:{path or 'imagenet'}"
+
+
+class KerasBackend:
+    def __init__(self, path=None):
+        # Imported here so the other backends never load TensorFlow
+        from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+        # Load MobileNetV2 pre-trained on ImageNet, or weights saved at path
+        self.model = MobileNetV2(weights=path or 'imagenet')
+
+    def run(self, x):
+        return self.model(x, training=False).numpy()
+
+
+class OnnxBackend:
+    def __init__(self, path=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = SKIN_THREADS
+        self.session = ort.InferenceSession(path or exported_model_path('onnx'), options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, x):
+        return self.session.run(None, {self.input_name: x})[0]
+
+
+class TFLiteBackend:
+    def __init__(self, path=None):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                # Last resort; this one does import TensorFlow
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=path or exported_model_path('tflite'),
+                                       num_threads=SKIN_THREADS or None)
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_size = None
+        self.lock = threading.Lock()
+
+    def run(self, x):
+        # The interpreter is stateful: one batch at a time, resized when the batch size changes
+        with self.lock:
+            if x.shape[0] != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input_index, x.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = x.shape[0]
+            self.interpreter.set_tensor(self.input_index, np.ascontiguousarray(x, dtype=np.float32))
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'onnx': OnnxBackend,
+    'tflite': TFLiteBackend
+}
+
+
+def load_labels(models_dir=SKIN_MODELS_DIR):
+    # [(wnid, name)] per ImageNet class id, written by export_skin_model.py
+    with open(os.path.join(models_dir, LABELS_FILE)) as f:
+        return [tuple(label) for label in json.load(f)]
+
+
+def keras_labels():
+    from tensorflow.keras.applications.mobilenet_v2 import decode_predictions
+    decoded = decode_predictions(np.eye(1000), top=1)
+    return [(wnid, name) for [(wnid, name, _)] in decoded]
+
 
 class SkinDiseaseModel:
-    def __init__(self):
+    def __init__(self, backend=None, model_path=None):
+        self.backend_name = backend or os.environ.get('SKIN_BACKEND', 'keras')
+        self.model_path = model_path or os.environ.get('SKIN_MODEL_PATH')
         self.model = None
+        self.labels = None
         self.load_model()
 
     def load_model(self):
         try:
-            # Load MobileNetV2 pre-trained on ImageNet
-            print("Loading MobileNetV2 model...")
-            self.model = MobileNetV2(weights='imagenet')
+            print(f"Loading MobileNetV2 model ({self.backend_name} backend)...")
+            self.model = BACKENDS[self.backend_name](self.model_path)
+            if self.backend_name == 'keras' and not os.path.exists(os.path.join(SKIN_MODELS_DIR, LABELS_FILE)):
+                self.labels = keras_labels()
+            else:
+                self.labels = load_labels()
             print("MobileNetV2 model loaded successfully.")
         except Exception as e:
             print(f"Error loading model: {e}")
             self.model = None
 
-    def predict(self, img_path):
+    def preprocess(self, source):
+        # (224, 224, 3) float32 input row for predict_batch(); source is a path, raw
+        # upload bytes or a file object, decoded in memory (see skin_preprocessing.py)
+        return skin_preprocessing.preprocess(source)
+
+    def predict_batch(self, x):
+        # One forward pass over a (n, 224, 224, 3) batch; returns the top 3 results per image
+        preds = self.model.run(x)
+
+        # Decode predictions: top 3 class ids per row, best first
+        top = np.argsort(preds, axis=1)[:, ::-1][:, :3]
+        return [
+            [{
+                "name": self.labels[i][1].replace("_", " ").title(),
+                "probability": float(row_preds[i]) * 100,
+                "recommendation": "Consult a dermatologist for accurate diagnosis." # Generic recommendation
+            } for i in row_top]
+            for row_top, row_preds in zip(top, preds)
+        ]
+
+    def predict(self, source, batcher=None):
+        # With a MicroBatcher (inference.py) the image joins concurrent requests in one batch
         if not self.model:
             return {"error": "Model not loaded"}
 
         try:
-            # Load and preprocess image
-            img = image.load_img(img_path, target_size=(224, 224))
-            x = image.img_to_array(img)
-            x = np.expand_dims(x, axis=0)
-            x = preprocess_input(x)
-
-            # Run inference
-            preds = self.model.predict(x)
-            
-            # Decode predictions (returns list of tuples (class_id, class_name, probability))
-            # We take the top 3 predictions
-            decoded_preds = decode_predictions(preds, top=3)[0]
-            
-            results = []
-            for _, label, prob in decoded_preds:
-                results.append({
-                    "name": label.replace("_", " ").title(),
-                    "probability": float(prob) * 100,
-                    "recommendation": "Consult a dermatologist for accurate diagnosis." # Generic recommendation
-                })
-                
-            return results
+            x = self.preprocess(source)
+            if batcher is not None:
+                return batcher.predict(x)
+            return self.predict_batch(np.expand_dims(x, axis=0))[0]
 
         except Exception as e:
             print(f"Prediction error: {e}")
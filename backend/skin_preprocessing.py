@@ -0,0 +1,48 @@
+import io
+import numpy as np
+from PIL import Image, ImageOps
+
+# Upload bytes -> MobileNetV2 input, without TensorFlow and without touching disk.
+# JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale, so a 12MP phone photo
+# is never materialized at full size before the final resize.
+
+INPUT_SIZE = (224, 224)
+
+
+def open_image(source):
+    # source: raw bytes, a binary file object (e.g. request.files['image'].stream) or a path
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+def load_image(source, size=INPUT_SIZE):
+    if isinstance(source, Image.Image):
+        # Already decoded, e.g. by skin_cache.py while hashing the upload
+        img = source
+    else:
+        img = open_image(source)
+        # Only JPEG supports draft; the decoder picks the largest DCT scale still >= size
+        img.draft('RGB', size)
+        # Phone cameras store rotation in EXIF; cheap now that the image is small
+        img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != size:
+        img = img.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return img
+
+
+def to_input(img, out=None):
+    # MobileNetV2 preprocess_input (x / 127.5 - 1) written straight into a float32 buffer,
+    # e.g. one row of a preallocated batch
+    pixels = np.asarray(img, dtype=np.uint8)
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.float32)
+    np.multiply(pixels, np.float32(1 / 127.5), out=out, dtype=np.float32)
+    out -= 1
+    return out
+
+
+def preprocess(source, size=INPUT_SIZE, out=None):
+    return to_input(load_image(source, size), out)
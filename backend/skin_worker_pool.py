@@ -0,0 +1,418 @@
+import argparse
+import atexit
+import importlib
+import itertools
+import mmap
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+import numpy as np
+import skin_preprocessing
+
+# Out-of-process skin inference. One pool server owns SKIN_POOL_WORKERS model processes,
+# independent of the number of gunicorn web workers. Web workers decode the upload
+# straight into a shared-memory slot of their own and send only the slot name over a
+# Unix socket; the reply (top-3 results) comes back asynchronously on the same socket.
+# The server rejects requests once SKIN_POOL_MAX_PENDING are in flight and a client
+# rejects them when all of its slots are busy, so /predict-skin can fail fast.
+# Every request gets a reply: requests taken down by a crashed worker, or without a
+# result after LOST_REQUEST_SECONDS, are answered with an error. A client that stops
+# waiting (timeout) takes its slot back at once.
+# gunicorn.conf.py starts the server; `python skin_worker_pool.py` runs it standalone.
+
+SOCKET_PATH = os.environ.get('SKIN_POOL_SOCKET', '/tmp/healix-skin.sock')
+AUTHKEY = os.environ.get('SKIN_POOL_AUTHKEY', os.environ.get('SECRET_KEY', 'healix-skin-pool')).encode()
+DEFAULT_MODEL = 'skin_model_loader:SkinDiseaseModel'
+INPUT_SHAPE = skin_preprocessing.INPUT_SIZE[::-1] + (3,)
+INPUT_BYTES = int(np.prod(INPUT_SHAPE)) * np.dtype(np.float32).itemsize
+# Requests without a reply after this long are assumed lost (e.g. a crashed worker)
+LOST_REQUEST_SECONDS = 60
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolBusy(PoolError):
+    pass
+
+
+class PoolUnavailable(PoolError):
+    pass
+
+
+def attach(name):
+    # Map a client's segment as (handle, buffer) without registering it with this
+    # process's resource tracker, which would unlink it when the process exits
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+        return shm, shm.buf
+    except TypeError:
+        # Python < 3.13 has no track argument; map the POSIX segment directly (Linux)
+        with open(os.path.join('/dev/shm', name.lstrip('/')), 'r+b') as f:
+            segment = mmap.mmap(f.fileno(), INPUT_BYTES)
+        return segment, segment
+
+
+def load_model(spec, kwargs):
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)(**kwargs)
+
+
+def worker_main(spec, kwargs, requests, results, max_batch, max_wait):
+    # Model process: drains up to max_batch queued requests into one forward pass
+    model = load_model(spec, kwargs)
+    segments = {}
+    while True:
+        batch = [requests.get()]
+        closes_at = time.monotonic() + max_wait
+        while len(batch) < max_batch and batch[-1] is not None:
+            remaining = closes_at - time.monotonic()
+            try:
+                batch.append(requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait())
+            except queue.Empty:
+                break
+        stop = batch[-1] is None
+        batch = [item for item in batch if item is not None]
+
+        if batch:
+            # Lets the server answer these requests if this process dies before replying
+            results.put(('taken', os.getpid(), [(conn_id, request_id) for conn_id, request_id, _ in batch]))
+            x = np.empty((len(batch),) + INPUT_SHAPE, dtype=np.float32)
+            for row, (_, _, name) in enumerate(batch):
+                if name not in segments:
+                    if len(segments) > 1024:
+                        # Slots of restarted web workers are never seen again
+                        for handle, _ in segments.values():
+                            handle.close()
+                        segments.clear()
+                    segments[name] = attach(name)
+                x[row] = np.ndarray(INPUT_SHAPE, dtype=np.float32, buffer=segments[name][1])
+            try:
+                rows, error = model.predict_batch(x), None
+            except Exception as e:
+                rows, error = [None] * len(batch), str(e)
+            for (conn_id, request_id, _), row in zip(batch, rows):
+                results.put(('done', conn_id, request_id, row, error))
+        if stop:
+            return
+
+
+class SkinPoolServer:
+    def __init__(self, size, socket_path=SOCKET_PATH, max_pending=64, max_batch=8, max_wait=0.005,
+                 model=DEFAULT_MODEL, model_kwargs=None):
+        self.size = size
+        self.socket_path = socket_path
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.model = model
+        self.model_kwargs = model_kwargs or {}
+        # Workers are spawned, not forked, so they do not inherit the server's threads
+        self.context = mp.get_context('spawn')
+        self.requests = self.context.Queue()
+        self.results = self.context.Queue()
+        self.workers = []
+        self.connections = {}
+        # (conn_id, request_id) -> [submit time, pid of the worker that took it], for
+        # backpressure and lost request cleanup
+        self.outstanding = {}
+        self.completed = 0
+        self.rejected = 0
+        self.lost = 0
+        self.restarts = 0
+        self.started_at = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.listener = None
+
+    def start_worker(self):
+        worker = self.context.Process(
+            target=worker_main, name='skin-worker', daemon=True,
+            args=(self.model, self.model_kwargs, self.requests, self.results, self.max_batch, self.max_wait)
+        )
+        worker.start()
+        return worker
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.workers = [self.start_worker() for _ in range(self.size)]
+        self.listener = Listener(self.socket_path, family='AF_UNIX', authkey=AUTHKEY)
+        self.started_at = time.time()
+        for target in (self._accept, self._route_results, self._monitor):
+            threading.Thread(target=target, daemon=True).start()
+        print(f"Skin worker pool: {self.size} workers on {self.socket_path}")
+
+    def stop(self):
+        self.stopping.set()
+        for _ in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.listener.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def serve_forever(self):
+        self.start()
+        signal.signal(signal.SIGTERM, lambda *_: self.stopping.set())
+        try:
+            self.stopping.wait()
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def stats(self):
+        with self.lock:
+            pending = len(self.outstanding)
+        alive = sum(worker.is_alive() for worker in self.workers)
+        return {
+            'healthy': alive > 0,
+            'workers': self.size,
+            'workers_alive': alive,
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'saturated': pending >= self.max_pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'lost': self.lost,
+            'restarts': self.restarts,
+            'uptime_seconds': round(time.time() - self.started_at, 1)
+        }
+
+    def _send(self, conn_id, message):
+        conn, send_lock = self.connections.get(conn_id, (None, None))
+        if conn is None:
+            return
+        try:
+            with send_lock:
+                conn.send(message)
+        except (OSError, EOFError):
+            self.connections.pop(conn_id, None)
+
+    def _accept(self):
+        conn_ids = itertools.count()
+        while not self.stopping.is_set():
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError):
+                continue
+            conn_id = next(conn_ids)
+            self.connections[conn_id] = (conn, threading.Lock())
+            threading.Thread(target=self._serve_connection, args=(conn_id, conn), daemon=True).start()
+
+    def _serve_connection(self, conn_id, conn):
+        # One connection per web worker process, carrying many concurrent requests
+        try:
+            while True:
+                message = conn.recv()
+                if message['op'] == 'health':
+                    self._send(conn_id, {'id': message['id'], 'health': self.stats()})
+                    continue
+                key = (conn_id, message['id'])
+                with self.lock:
+                    busy = len(self.outstanding) >= self.max_pending
+                    if not busy:
+                        self.outstanding[key] = [time.monotonic(), None]
+                if busy:
+                    self.rejected += 1
+                    self._send(conn_id, {'id': message['id'], 'error': 'busy'})
+                else:
+                    self.requests.put((conn_id, message['id'], message['shm']))
+        except (OSError, EOFError):
+            self.connections.pop(conn_id, None)
+
+    def _route_results(self):
+        while not self.stopping.is_set():
+            message = self.results.get()
+            if message[0] == 'taken':
+                _, pid, keys = message
+                with self.lock:
+                    for key in keys:
+                        if key in self.outstanding:
+                            self.outstanding[key][1] = pid
+                continue
+            _, conn_id, request_id, row, error = message
+            with self.lock:
+                pending = self.outstanding.pop((conn_id, request_id), None)
+            if pending is None:
+                # Already answered as lost; the client has moved on
+                continue
+            self.completed += 1
+            self._send(conn_id, {'id': request_id, 'result': row, 'error': error})
+
+    def _monitor(self):
+        # Replace crashed workers and fail the requests they took down with them
+        while not self.stopping.wait(1):
+            for i, worker in enumerate(self.workers):
+                if not worker.is_alive():
+                    print(f"Skin worker {worker.pid} exited with {worker.exitcode}, restarting")
+                    self.workers[i] = self.start_worker()
+                    self.restarts += 1
+            alive = {worker.pid for worker in self.workers}
+            cutoff = time.monotonic() - LOST_REQUEST_SECONDS
+            with self.lock:
+                lost = [key for key, (submitted, pid) in self.outstanding.items()
+                        if submitted < cutoff or (pid is not None and pid not in alive)]
+                for key in lost:
+                    del self.outstanding[key]
+            self.lost += len(lost)
+            for conn_id, request_id in lost:
+                # The client frees the request's slot when this arrives
+                self._send(conn_id, {'id': request_id, 'result': None,
+                                     'error': 'Skin inference request lost (worker crashed or timed out)'})
+
+
+class Slot:
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=INPUT_BYTES)
+        self.array = np.ndarray(INPUT_SHAPE, dtype=np.float32, buffer=self.shm.buf)
+
+
+class SkinPoolClient:
+    # Used from web workers; one socket connection and slot set per process, made on first use
+    def __init__(self, socket_path=SOCKET_PATH, slots=8):
+        self.socket_path = socket_path
+        self.n_slots = slots
+        self.conn = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.request_ids = itertools.count()
+        self.futures = {}
+        self.slots = []
+        self.free_slots = None
+
+    def _ensure_connected(self):
+        with self.lock:
+            if self.conn is not None and self.pid == os.getpid():
+                return
+            if self.pid != os.getpid():
+                # Slots belong to one process; a forked child makes its own
+                token = os.urandom(4).hex()
+                self.slots = [Slot(f'healix-skin-{os.getpid()}-{token}-{i}') for i in range(self.n_slots)]
+                self.free_slots = queue.Queue()
+                for slot in self.slots:
+                    self.free_slots.put(slot)
+                self.pid = os.getpid()
+                atexit.register(self.close)
+            try:
+                self.conn = Client(self.socket_path, family='AF_UNIX', authkey=AUTHKEY)
+            except (OSError, EOFError) as e:
+                raise PoolUnavailable(f"Skin worker pool not reachable: {e}")
+            threading.Thread(target=self._read_replies, args=(self.conn,), daemon=True).start()
+
+    def _read_replies(self, conn):
+        try:
+            while True:
+                message = conn.recv()
+                future, slot = self.futures.pop(message['id'], (None, None))
+                if slot is not None:
+                    self.free_slots.put(slot)
+                if future is None:
+                    continue
+                if 'health' in message:
+                    future.set_result(message['health'])
+                elif message['error'] == 'busy':
+                    future.set_exception(PoolBusy("Skin worker pool is saturated"))
+                elif message['error']:
+                    future.set_exception(PoolError(message['error']))
+                else:
+                    future.set_result(message['result'])
+        except (OSError, EOFError, TypeError):
+            # TypeError: close() shut the connection in the middle of recv()
+            with self.lock:
+                if self.conn is conn:
+                    self.conn = None
+            for request_id in list(self.futures):
+                future, slot = self.futures.pop(request_id, (None, None))
+                if slot is not None:
+                    self.free_slots.put(slot)
+                if future is not None:
+                    future.set_exception(PoolUnavailable("Skin worker pool connection lost"))
+
+    def _send(self, message, slot=None):
+        future = Future()
+        message['id'] = future.request_id = next(self.request_ids)
+        self.futures[message['id']] = (future, slot)
+        try:
+            with self.send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError, AttributeError) as e:
+            self.futures.pop(message['id'], None)
+            if slot is not None:
+                self.free_slots.put(slot)
+            raise PoolUnavailable(f"Skin worker pool not reachable: {e}")
+        return future
+
+    def submit(self, source):
+        # Decodes source into a free slot; the slot is reused once the reply arrives
+        self._ensure_connected()
+        try:
+            slot = self.free_slots.get_nowait()
+        except queue.Empty:
+            raise PoolBusy("All skin inference slots of this worker are in use")
+        try:
+            skin_preprocessing.preprocess(source, out=slot.array)
+        except Exception:
+            self.free_slots.put(slot)
+            raise
+        return self._send({'op': 'predict', 'shm': slot.shm.name}, slot)
+
+    def wait(self, future, timeout=None):
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            self.abandon(future)
+            raise
+
+    def abandon(self, future):
+        # Stop waiting for a reply; its slot goes back to the free list now, and a late
+        # reply is ignored
+        _, slot = self.futures.pop(future.request_id, (None, None))
+        if slot is not None:
+            self.free_slots.put(slot)
+
+    def predict(self, source, timeout=None):
+        # Raises PoolBusy / PoolUnavailable / PoolError from the pool, FutureTimeoutError, or
+        # the decode error for unreadable images
+        return self.wait(self.submit(source), timeout)
+
+    def health(self, timeout=1):
+        self._ensure_connected()
+        return self.wait(self._send({'op': 'health'}), timeout)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            if self.pid == os.getpid():
+                for slot in self.slots:
+                    slot.array = None
+                    slot.shm.close()
+                    slot.shm.unlink()
+                self.slots = []
+                self.pid = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SKIN_POOL_WORKERS', 2)))
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    parser.add_argument('--max-pending', type=int, default=int(os.environ.get('SKIN_POOL_MAX_PENDING', 64)))
+    parser.add_argument('--max-batch', type=int, default=int(os.environ.get('SKIN_MAX_BATCH', 8)))
+    parser.add_argument('--max-wait-ms', type=float, default=float(os.environ.get('SKIN_MAX_WAIT_MS', 5)))
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="module:factory returning an object with predict_batch()")
+    args = parser.parse_args()
+    SkinPoolServer(args.workers, args.socket, args.max_pending, args.max_batch, args.max_wait_ms / 1000,
+                   args.model).serve_forever()
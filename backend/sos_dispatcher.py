@@ -0,0 +1,201 @@
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import requests
+from executors import ForkSafeExecutor
+from metrics import registry
+
+# SOS alert fan-out. /sos hands every (contact, channel) pair to a per-process thread
+# pool and responds as soon as they are queued; each delivery runs with its channel's
+# timeout and is retried with backoff, so one slow mail server or SMS gateway delays
+# neither the other contacts nor the response. Every attempt is passed to record(),
+# which app.py stores in the sos_delivery table.
+# Time to first delivery (SOS accepted -> first alert handed over to a channel) is
+# tracked per event against first_delivery_target seconds (SOS_FIRST_DELIVERY_TARGET_MS);
+# misses are logged and counted in stats().
+# Channels: SMS through an HTTP gateway (POST {"to", "body"} as JSON), email over SMTP,
+# and a log channel that only prints, used when neither is configured.
+
+
+class SMSChannel:
+    name = 'sms'
+
+    def __init__(self, url, token=None, timeout=3.0, retries=2):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.retries = retries
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                self._session = requests.Session()
+                if self.token:
+                    self._session.headers['Authorization'] = f"Bearer {self.token}"
+                self._pid = os.getpid()
+            return self._session
+
+    def recipient(self, contact):
+        return contact.get('phone')
+
+    def send(self, recipient, subject, body):
+        response = self.session.post(self.url, json={'to': recipient, 'body': body}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class EmailChannel:
+    name = 'email'
+
+    def __init__(self, host, port=25, sender='sos@healix.app', username=None, password=None,
+                 starttls=False, timeout=5.0, retries=2):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.retries = retries
+
+    def recipient(self, contact):
+        return contact.get('email')
+
+    def send(self, recipient, subject, body):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = recipient
+        message['Subject'] = subject
+        message.set_content(body)
+        # timeout bounds the connect and every read and write on the socket
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+class LogChannel:
+    # No SMS gateway or mail server configured: the old behaviour, print the alert
+    name = 'log'
+    timeout = 0
+    retries = 0
+
+    def recipient(self, contact):
+        return contact.get('phone') or contact.get('email')
+
+    def send(self, recipient, subject, body):
+        print(f"SOS alert to {recipient}: {body}")
+
+
+class SOSDispatcher:
+    def __init__(self, channels, record=lambda attempt: None, max_workers=16, first_delivery_target=1.0,
+                 backoff=0.2):
+        # record(attempt) receives one dict per delivery attempt
+        self.channels = channels
+        self.record = record
+        self.max_workers = max_workers
+        self.first_delivery_target = first_delivery_target
+        self.backoff = backoff
+        self.pool = ForkSafeExecutor(max_workers, 'sos', shutdown_at_exit=True)
+        self._lock = threading.Lock()
+        # event id -> [queued at (None once one alert got through), deliveries still running]
+        self._events = {}
+        # Counters for health reporting
+        self.events = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.missed_target = 0
+        self.last_first_delivery_ms = 0.0
+        self.max_first_delivery_ms = 0.0
+
+    def dispatch(self, event_id, contacts, subject, body):
+        # contacts: dicts with id, name, phone, email. Returns the number of deliveries queued.
+        jobs = [(contact, channel, channel.recipient(contact))
+                for contact in contacts for channel in self.channels]
+        jobs = [job for job in jobs if job[2]]
+        if not jobs:
+            return 0
+        pool = self.pool
+        with self._lock:
+            self.events += 1
+            self._events[event_id] = [time.monotonic(), len(jobs)]
+        for contact, channel, recipient in jobs:
+            pool.submit(self._deliver, event_id, contact, channel, recipient, subject, body)
+        return len(jobs)
+
+    def _deliver(self, event_id, contact, channel, recipient, subject, body):
+        delivered = False
+        for attempt in range(1, channel.retries + 2):
+            start = time.monotonic()
+            error = None
+            try:
+                channel.send(recipient, subject, body)
+                delivered = True
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"[:500]
+                registry.inc('healix_upstream_errors_total', service=channel.name)
+            registry.observe('healix_upstream_seconds', time.monotonic() - start, service=channel.name, call='send')
+            self.record({
+                'event_id': event_id,
+                'contact_id': contact.get('id'),
+                'channel': channel.name,
+                'recipient': recipient,
+                'attempt': attempt,
+                'status': 'sent' if delivered else 'failed',
+                'error': error,
+                'latency_ms': round((time.monotonic() - start) * 1000, 1)
+            })
+            if delivered:
+                break
+            if attempt <= channel.retries:
+                self.retried += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+        with self._lock:
+            queued_at, running = self._events[event_id]
+            if delivered:
+                self.sent += 1
+                if queued_at is not None:
+                    # First successful delivery of this event
+                    elapsed = (time.monotonic() - queued_at) * 1000
+                    self.last_first_delivery_ms = elapsed
+                    self.max_first_delivery_ms = max(self.max_first_delivery_ms, elapsed)
+                    if elapsed > self.first_delivery_target * 1000:
+                        self.missed_target += 1
+                        print(f"SOS event {event_id}: first alert took {elapsed:.0f} ms, "
+                              f"target {self.first_delivery_target * 1000:.0f} ms")
+                    self._events[event_id][0] = None
+            else:
+                self.failed += 1
+                print(f"SOS event {event_id}: {channel.name} alert to {recipient} failed: {error}")
+            if running == 1:
+                del self._events[event_id]
+            else:
+                self._events[event_id][1] = running - 1
+
+    def close(self):
+        # Let queued alerts go out before the process exits (gunicorn worker_exit, atexit)
+        self.pool.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            pending = sum(running for _, running in self._events.values())
+        return {
+            'events': self.events,
+            'pending': pending,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'first_delivery_target_ms': round(self.first_delivery_target * 1000),
+            'missed_target': self.missed_target,
+            'last_first_delivery_ms': round(self.last_first_delivery_ms, 1),
+            'max_first_delivery_ms': round(self.max_first_delivery_ms, 1)
+        }
@@ -0,0 +1,116 @@
+import json
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the SOS channels, for testing sos_dispatcher offline:
+#   with SMSSink() as sms, SMTPSink() as smtp:
+#       SMSChannel(sms.url), EmailChannel('127.0.0.1', smtp.port)
+#       ... sms.received / smtp.received: [(monotonic time, recipient, body)]
+# delay (seconds) is added before every answer, delays maps a recipient to its own
+# delay, and the first `fail` requests for each recipient are refused (HTTP 503 / SMTP
+# 451), to exercise timeouts and retries.
+
+
+class Sink:
+    def __init__(self, delay=0.0, delays=None, fail=0):
+        self.delay = delay
+        self.delays = delays or {}
+        self.fail = fail
+        self.received = []
+        self.attempts = {}
+        self.lock = threading.Lock()
+
+    def accept(self, recipient, body):
+        # Whether to take the message; records it if so
+        time.sleep(self.delays.get(recipient, self.delay))
+        with self.lock:
+            self.attempts[recipient] = self.attempts.get(recipient, 0) + 1
+            if self.attempts[recipient] <= self.fail:
+                return False
+            self.received.append((time.monotonic(), recipient, body))
+            return True
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SMSSink(Sink):
+    # SMS gateway: POST {"to": ..., "body": ...}
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                message = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                ok = sink.accept(message['to'], message['body'])
+                try:
+                    self.send_response(200 if ok else 503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/send"
+
+
+class SMTPSink(Sink):
+    # Just enough SMTP for smtplib.send_message: EHLO/HELO, MAIL, RCPT, DATA, QUIT
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode('ascii') + b'\r\n')
+
+            def handle(self):
+                recipient = None
+                try:
+                    self.reply('220 sink ready')
+                    while True:
+                        line = self.rfile.readline()
+                        if not line:
+                            return
+                        command = line.decode('ascii', 'replace').strip().upper()
+                        if command.startswith(('EHLO', 'HELO')):
+                            self.reply('250 sink')
+                        elif command.startswith('MAIL'):
+                            self.reply('250 ok')
+                        elif command.startswith('RCPT'):
+                            recipient = line.decode('ascii').split(':', 1)[1].strip().strip('<>')
+                            self.reply('250 ok')
+                        elif command == 'DATA':
+                            self.reply('354 go ahead')
+                            data = b''
+                            while True:
+                                chunk = self.rfile.readline()
+                                if chunk in (b'.\r\n', b''):
+                                    break
+                                data += chunk
+                            body = message_from_bytes(data).get_payload()
+                            self.reply('250 queued' if sink.accept(recipient, body) else '451 try again')
+                        elif command == 'QUIT':
+                            self.reply('221 bye')
+                            return
+                        else:
+                            self.reply('250 ok')
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
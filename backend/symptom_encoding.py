@@ -0,0 +1,91 @@
+import threading
+from sqlalchemy.exc import IntegrityError
+
+# Normalized storage of Prediction symptoms. Every symptom name gets a permanent id in
+# the symptom table, seeded from the model's symptoms_list in order, so for the shipped
+# vocabulary id i is symptoms_list[i]; symptoms added by later model versions, and any
+# other name a user submits, are appended. A prediction stores its symptoms twice:
+#   symptom_mask        BIGINT with bit i set for symptom id i; MASK_OVERFLOW when an
+#                       id does not fit (the vocabulary has outgrown SYMPTOM_MASK_BITS)
+#   prediction_symptom  one (symptom_id, prediction_id) row per symptom, indexed by
+#                       symptom; the source for overflowed masks
+# NULL symptom_mask marks a row the backfill (migrations.py) has not converted yet.
+# Decoded symptoms come back once each, in id order rather than as submitted.
+
+# Bits of a signed 64-bit column that stay non-negative
+SYMPTOM_MASK_BITS = 63
+MASK_OVERFLOW = -1
+# Longest name the symptom table holds; /predict rejects longer ones
+SYMPTOM_NAME_LENGTH = 100
+
+
+def encode_mask(ids):
+    if any(i >= SYMPTOM_MASK_BITS for i in ids):
+        return MASK_OVERFLOW
+    mask = 0
+    for i in ids:
+        mask |= 1 << i
+    return mask
+
+
+def decode_mask(mask):
+    return [i for i in range(mask.bit_length()) if mask >> i & 1]
+
+
+class SymptomVocabulary:
+    # Symptom name <-> id, cached per process and reloaded when another process has
+    # added symptoms this one has not seen yet
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self.names = []
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def reload(self):
+        names = []
+        for symptom_id, name in self.db.session.query(self.model.id, self.model.name).order_by(self.model.id):
+            names.extend([None] * (symptom_id + 1 - len(names)))
+            names[symptom_id] = name
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names) if name is not None}
+
+    def add(self, names):
+        # Appends names without an id yet, in the given order. Ids are never reused or
+        # renumbered, so stored masks stay valid across model versions.
+        with self.lock:
+            for _ in range(5):
+                missing = [name for name in dict.fromkeys(names) if name not in self.ids]
+                if not missing:
+                    return
+                next_id = (self.db.session.query(self.db.func.max(self.model.id)).scalar() or -1) + 1
+                self.db.session.add_all([self.model(id=next_id + i, name=name) for i, name in enumerate(missing)])
+                try:
+                    self.db.session.commit()
+                except IntegrityError:
+                    # Another worker added symptoms at the same time
+                    self.db.session.rollback()
+                self.reload()
+            raise RuntimeError("Could not add symptoms to the vocabulary")
+
+    def encode(self, symptoms):
+        # Ids of the given symptom names, adding the names not in the table yet, so
+        # history shows every name that was submitted. Empty and over-long names (only
+        # possible in rows stored before /predict checked them) stay in the text column.
+        symptoms = [name for name in symptoms if name and len(name) <= SYMPTOM_NAME_LENGTH]
+        new = [name for name in symptoms if name not in self.ids]
+        if new:
+            self.add(new)
+        return sorted({self.ids[name] for name in symptoms})
+
+    def id_for(self, name):
+        if name not in self.ids:
+            with self.lock:
+                self.reload()
+        return self.ids.get(name)
+
+    def names_for(self, ids):
+        if ids and max(ids) >= len(self.names):
+            with self.lock:
+                self.reload()
+        return [self.names[i] for i in ids]
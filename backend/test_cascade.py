@@ -0,0 +1,68 @@
+import joblib
+import numpy as np
+from inference import DiseaseEnsemble
+
+# Cascade mode: the first model answers confident rows alone, the rest only see the others
+
+models = joblib.load('models/disease_prediction_models.pkl')
+symptoms_list = joblib.load('models/symptoms_list.pkl')
+ORDER = ['SVC', 'NaiveBayes', 'RandomForest']
+
+def cascade(min_confidence, min_margin):
+    ensemble = DiseaseEnsemble(models, symptoms_list)
+    ensemble.set_cascade(ORDER, min_confidence, min_margin)
+    return ensemble
+
+def sample_inputs(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    X = (rng.random((n, len(symptoms_list))) < 0.2).astype(np.float64)
+    X[0] = 0
+    return X
+
+def test_escalation_follows_first_model():
+    X = sample_inputs()
+    ensemble = cascade(0.7, 0.2)
+    full = DiseaseEnsemble(models, symptoms_list).predict(X)
+    result = ensemble.predict_cascade(X)
+
+    first = full.probabilities['SVC']
+    ranked = np.sort(first, axis=1)
+    expected = (ranked[:, -1] < 0.7) | (ranked[:, -1] - ranked[:, -2] < 0.2)
+    assert expected.any() and not expected.all(), "sample should mix confident and unsure rows"
+    assert result.evaluated['SVC'].all()
+    for name in ORDER[1:]:
+        assert (result.evaluated[name] == expected).all()
+        # Escalated rows get the model's real output, the rest stay all zero
+        assert np.allclose(result.probabilities[name][expected], full.probabilities[name][expected])
+        assert not result.probabilities[name][~expected].any()
+
+    # Confident rows are decided by the first model alone, unsure rows by all three
+    assert (result.final_ids[~expected] == full.label_ids['SVC'][~expected]).all()
+    assert (result.final_ids[expected] == full.final_ids[expected]).all()
+    row = int(np.flatnonzero(~expected)[0])
+    assert result.models_evaluated(row) == ['SVC']
+    assert list(result.model_predictions(row)) == ['SVC']
+    assert result.models_evaluated(int(np.flatnonzero(expected)[0])) == ORDER
+
+def test_thresholds():
+    X = sample_inputs(n=100, seed=1)
+    # Nothing is confident enough: the same answer as running every model
+    everything = cascade(1.01, 0).predict_cascade(X)
+    full = DiseaseEnsemble(models, symptoms_list).predict(X)
+    assert all(everything.evaluated[name].all() for name in ORDER)
+    assert (everything.final_ids == full.final_ids).all()
+    # Everything is confident enough: only the first model runs
+    nothing = cascade(0, 0).predict_cascade(X)
+    assert not any(nothing.evaluated[name].any() for name in ORDER[1:])
+    assert (nothing.final_ids == full.label_ids['SVC']).all()
+
+def test_predict_symptoms_uses_cascade():
+    ensemble = cascade(1.01, 0)
+    result = ensemble.predict_symptoms([symptoms_list[:3], []])
+    assert result.evaluated is not None and len(result) == 2
+
+if __name__ == "__main__":
+    test_escalation_follows_first_model()
+    test_thresholds()
+    test_predict_symptoms_uses_cascade()
+    print("SUCCESS: cascade inference works.")
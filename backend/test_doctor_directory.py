@@ -0,0 +1,82 @@
+import csv
+import os
+import tempfile
+import numpy as np
+from conftest import reset_app, logged_in_client
+from app import app, db, Doctor, doctor_directory
+from doctor_directory import CSV_COLUMNS, EARTH_RADIUS_KM, import_csv
+
+# Nearest doctors of a specialty from the local directory, checked against a brute-force
+# great-circle scan, and served by /doctors without a Places API key (see conftest.py)
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+rng = np.random.default_rng(0)
+rows = [{
+    'name': f"Dr. {i}", 'specialty': ['Cardiologist', 'Dermatologist'][i % 2], 'address': f"{i} Main St",
+    'city': 'Springfield' if i < 20 else f"Town {i % 50}", 'phone': f"555-{i:04d}",
+    # Springfield doctors sit around (39.8, -89.6); the rest anywhere, date line included
+    'lat': 39.8 + rng.normal(0, 0.05) if i < 20 else rng.uniform(-80, 80),
+    'lng': -89.6 + rng.normal(0, 0.05) if i < 20 else rng.uniform(-180, 180),
+    'hours': 'Mon-Fri 9-5', 'rating': '4.2'
+} for i in range(4000)]
+rows.append(dict(rows[0], lat='not a number'))
+
+def import_doctors():
+    path = os.path.join(tempfile.mkdtemp(), 'providers.csv')
+    write_csv(path, rows)
+    with app.app_context():
+        imported = import_csv(db, Doctor, path, chunk_size=1000)
+        doctor_directory.reload()
+    return imported
+
+def test_import_and_nearest(fresh_app):
+    assert import_doctors() == 4000
+    assert doctor_directory.stats()['doctors'] == 4000 and doctor_directory.stats()['specialties'] == 2
+
+    cardiologists = [r for r in rows[:4000] if r['specialty'] == 'Cardiologist']
+    lat = np.array([r['lat'] for r in cardiologists])
+    lng = np.array([r['lng'] for r in cardiologists])
+    for p_lat, p_lng in [(39.8, -89.6), (10, 179.9), (-75, 20), (0, 0)]:
+        hits = doctor_directory.nearest(' cardiologist', p_lat, p_lng, k=5)
+        distances = haversine_km(p_lat, p_lng, lat, lng)
+        expected = np.sort(distances)[:5]
+        assert np.allclose([km for _, km in hits], expected, atol=1e-6)
+
+    # Only the Springfield dermatologists are within max_km, however large k is
+    assert len(doctor_directory.nearest('dermatologist', 39.8, -89.6, k=50, max_km=30)) == 10
+    assert doctor_directory.nearest('neurologist', 39.8, -89.6) == []
+
+def test_doctors_endpoint_uses_directory(fresh_app):
+    import_doctors()
+    client, _ = logged_in_client('doctors')
+    # A typed-in city is placed at its doctors' centroid
+    doctors = client.post('/doctors', json={'specialty': 'Cardiologist', 'location': 'Springfield, IL'}).get_json()['doctors']
+    assert len(doctors) == 10
+    assert all(doctor['address'].endswith('Main St') for doctor in doctors)
+    assert [d['distance_km'] for d in doctors] == sorted(d['distance_km'] for d in doctors)
+    assert doctors[0]['distance_km'] < 15 and doctors[0]['phone'].startswith('555-')
+    # Coordinates win over the text
+    doctors = client.post('/doctors', json={'specialty': 'Cardiologist', 'location': 'Springfield',
+                                            'lat': rows[100]['lat'], 'lng': rows[100]['lng']}).get_json()['doctors']
+    assert doctors[0]['name'] == 'Dr. 100' and doctors[0]['distance_km'] == 0
+    assert all(d['distance_km'] <= 100 for d in doctors)
+    # Unknown place: the old mock list
+    doctors = client.post('/doctors', json={'specialty': 'Cardiologist', 'location': 'Atlantis'}).get_json()['doctors']
+    assert doctors[0]['name'] == "Dr. Smith (Cardiologist)"
+    response = client.post('/doctors', json={'specialty': 'Cardiologist', 'location': 'x', 'lat': 'north', 'lng': 1})
+    assert response.status_code == 400
+
+if __name__ == "__main__":
+    test_import_and_nearest(reset_app())
+    test_doctors_endpoint_uses_directory(reset_app())
+    print("SUCCESS: doctor directory works.")
@@ -0,0 +1,40 @@
+import os
+from executors import ForkSafeExecutor
+
+# Per-process thread pools: a forked child builds its own pool instead of queueing on
+# the parent's, whose threads did not survive the fork
+
+def test_pool_rebuilt_after_fork():
+    executor = ForkSafeExecutor(2, 'test')
+    assert executor.submit(os.getpid).result(5) == os.getpid()
+    parent_pool = executor.pool
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = executor.pool is not parent_pool and executor.submit(os.getpid).result(5) == os.getpid()
+            os.write(write_fd, b'1' if ok else b'0')
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    assert os.read(read_fd, 1) == b'1'
+    os.waitpid(pid, 0)
+    assert executor.pool is parent_pool
+
+def test_shutdown():
+    executor = ForkSafeExecutor(1, 'test')
+    # Nothing to shut down before the first submit
+    executor.shutdown()
+    done = []
+    executor.submit(done.append, 1)
+    executor.shutdown(wait=True)
+    assert done == [1]
+    # Used again after shutdown: a fresh pool
+    assert executor.submit(lambda: 2).result(5) == 2
+    executor.shutdown()
+
+if __name__ == "__main__":
+    test_pool_rebuilt_after_fork()
+    test_shutdown()
+    print("SUCCESS: fork-safe executors work.")
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+from conftest import reset_app, logged_in_client
+from app import app, db, Prediction, SkinAnalysisLog, ExerciseLog
+
+# Keyset pagination of the history endpoints
+
+def test_pages_cover_history_once(fresh_app):
+    client, user_id = logged_in_client('history')
+    _, other_id = logged_in_client('history-other')
+    with app.app_context():
+        # Rows sharing a timestamp must not be skipped or repeated across pages
+        for i in range(25):
+            db.session.add(Prediction(user_id=user_id, disease=f'd{i}', symptoms='itching',
+                                      date=datetime(2025, 1, 1 + i // 3)))
+        db.session.add(Prediction(user_id=other_id, disease='other', symptoms='itching'))
+        db.session.commit()
+    everything = client.get('/history?all=1').get_json()
+    assert len(everything['history']) == 25 and everything['next_before'] is None
+
+    seen, before = [], None
+    while True:
+        page = client.get('/history?limit=4' + (f'&before={before}' if before else '')).get_json()
+        assert len(page['history']) <= 4
+        seen += [item['id'] for item in page['history']]
+        before = page['next_before']
+        if before is None:
+            break
+    assert seen == [item['id'] for item in everything['history']]
+    assert len(set(seen)) == 25
+
+    assert client.get('/history?limit=0').status_code == 400
+    assert client.get('/history?before=abc').status_code == 400
+    assert len(client.get('/skin-history').get_json()['history']) == 0
+
+def test_exercise_history_defaults_to_last_week(fresh_app):
+    client, user_id = logged_in_client('exercise-history')
+    with app.app_context():
+        now = datetime.now()
+        for days_ago in (20, 10, 5, 3, 1):
+            db.session.add(ExerciseLog(user_id=user_id, date=now - timedelta(days=days_ago), exercise_type='run',
+                                       duration_minutes=days_ago, calories_burnt=100))
+        db.session.commit()
+
+    # No paging parameters: the tracker chart, last 7 days oldest first, as before pagination
+    for url in ('/exercise/history', '/exercise/history?all=1'):
+        week = client.get(url).get_json()
+        assert [item['duration_minutes'] for item in week['history']] == [5, 3, 1]
+        assert week['next_before'] is None
+
+    first = client.get('/exercise/history?limit=3').get_json()
+    assert [item['duration_minutes'] for item in first['history']] == [1, 3, 5]
+    rest = client.get(f"/exercise/history?before={first['next_before']}").get_json()
+    assert [item['duration_minutes'] for item in rest['history']] == [10, 20]
+    assert client.get('/exercise/history?limit=0').status_code == 400
+
+def test_history_query_uses_index(fresh_app):
+    with app.app_context():
+        for model in (Prediction, SkinAnalysisLog):
+            plan = db.session.execute(db.text(
+                f"EXPLAIN QUERY PLAN SELECT * FROM {model.__tablename__} WHERE user_id = 1 "
+                "AND (date, id) < ('2025-01-02', 5) ORDER BY date DESC, id DESC LIMIT 5"
+            )).all()
+            detail = ' '.join(row[-1] for row in plan)
+            assert f'ix_{model.__tablename__}_user_date' in detail and 'TEMP B-TREE' not in detail, detail
+
+if __name__ == "__main__":
+    test_pages_cover_history_once(reset_app())
+    test_exercise_history_defaults_to_last_week(reset_app())
+    test_history_query_uses_index(reset_app())
+    print("SUCCESS: history pagination works.")
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.naive_bayes import GaussianNB
+from sklearn.svm import SVC
+from inference import DiseaseEnsemble, PredictionLookupTable, build_lookup_table, file_fingerprint
+
+# The precomputed table must answer exactly like live inference for every symptom set.
+# Small stand-in models over 8 symptoms, so the whole space (256 rows) is quick to build.
+
+SYMPTOMS = [f'symptom_{i}' for i in range(8)]
+
+def train_models():
+    rng = np.random.default_rng(0)
+    X = (rng.random((400, len(SYMPTOMS))) < 0.4).astype(np.float64)
+    y = np.array(['Cold', 'Flu', 'Migraine', 'Allergy'])[(X[:, :2] @ [1, 2]).astype(int)]
+    return {
+        'RandomForest': RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y),
+        'SVC': SVC(probability=True, random_state=0).fit(X, y),
+        'NaiveBayes': GaussianNB().fit(X, y)
+    }
+
+def save_table(path, ensemble, models_path):
+    # As build_lookup_table.py does
+    table_path, meta_path = PredictionLookupTable.paths(path)
+    np.save(table_path, build_lookup_table(ensemble))
+    joblib.dump({
+        'symptoms_list': ensemble.symptoms_list,
+        'classes': ensemble.classes,
+        'model_names': list(ensemble.models),
+        'models_fingerprint': file_fingerprint(models_path)
+    }, meta_path)
+
+def all_symptom_sets():
+    return [[s for bit, s in enumerate(SYMPTOMS) if mask >> bit & 1] for mask in range(1 << len(SYMPTOMS))]
+
+def test_parity_with_live_inference():
+    with tempfile.TemporaryDirectory() as path:
+        models_path = os.path.join(path, 'disease_prediction_models.pkl')
+        joblib.dump(train_models(), models_path)
+        ensemble = DiseaseEnsemble(joblib.load(models_path), SYMPTOMS)
+        save_table(path, ensemble, models_path)
+
+        symptom_sets = all_symptom_sets() + [['symptom_3', 'unknown', 'symptom_3']]
+        live = ensemble.predict_symptoms(symptom_sets)
+        ensemble.lookup_table = PredictionLookupTable.load(path, ensemble, file_fingerprint(models_path))
+        assert ensemble.lookup_table is not None
+        looked_up = ensemble.predict_symptoms(symptom_sets)
+
+        assert (looked_up.final_predictions == live.final_predictions).all()
+        for name in ensemble.models:
+            assert (looked_up.label_ids[name] == live.label_ids[name]).all()
+            # Stored as float16
+            assert np.allclose(looked_up.confidences[name], live.confidences[name], atol=1e-3)
+        for row in (0, 37, len(symptom_sets) - 1):
+            assert looked_up.model_predictions(row).keys() == live.model_predictions(row).keys()
+
+        # Differentials need per-class probabilities, so they bypass the table
+        assert ensemble.predict_symptoms(symptom_sets[:2], need_probabilities=True).probabilities is not None
+
+def test_stale_table_ignored():
+    with tempfile.TemporaryDirectory() as path:
+        models_path = os.path.join(path, 'disease_prediction_models.pkl')
+        joblib.dump(train_models(), models_path)
+        ensemble = DiseaseEnsemble(joblib.load(models_path), SYMPTOMS)
+        save_table(path, ensemble, models_path)
+        assert PredictionLookupTable.load(path, ensemble, 'other models') is None
+        assert PredictionLookupTable.load(path, DiseaseEnsemble(ensemble.models, SYMPTOMS[::-1]),
+                                          file_fingerprint(models_path)) is None
+
+if __name__ == "__main__":
+    test_parity_with_live_inference()
+    test_stale_table_ignored()
+    print("SUCCESS: lookup table matches live inference.")
@@ -0,0 +1,135 @@
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import requests as http
+from conftest import reset_app, logged_in_client
+from app import app, db, model_registry
+from metrics import MetricsRegistry, current_timings
+from sqlalchemy.exc import OperationalError
+
+# Server-Timing spans on responses, and /metrics totals that add up across processes
+
+PORT = 8767
+
+def sample(text, metric, **labels):
+    # Value of one series in a /metrics page
+    wanted = ','.join(f'{name}="{value}"' for name, value in labels.items())
+    for line in text.splitlines():
+        name, _, value = line.rpartition(' ')
+        if name.split('{')[0] == metric and all(part in name for part in wanted.split(',')):
+            return float(value)
+    return None
+
+def test_registry_adds_up_processes():
+    directory = tempfile.mkdtemp()
+    child = subprocess.run([sys.executable, '-c', (
+        "from metrics import MetricsRegistry\n"
+        f"r = MetricsRegistry({directory!r})\n"
+        "r.inc('jobs_total', 3, kind='a')\n"
+        "r.observe('job_seconds', 0.004, kind='a')\n"
+        "r.flush()\n"
+    )])
+    assert child.returncode == 0
+    registry = MetricsRegistry(directory)
+    registry.inc('jobs_total', 2, kind='a')
+    registry.inc('jobs_total', kind='b')
+    registry.observe('job_seconds', 0.2, kind='a')
+    text = registry.render()
+    assert sample(text, 'jobs_total', kind='a') == 5 and sample(text, 'jobs_total', kind='b') == 1
+    assert sample(text, 'job_seconds_count', kind='a') == 2
+    assert sample(text, 'job_seconds_bucket', kind='a', le='0.005') == 1
+    assert sample(text, 'job_seconds_bucket', kind='a', le='+Inf') == 2
+    assert abs(sample(text, 'job_seconds_sum', kind='a') - 0.204) < 1e-9
+
+def test_server_timing_and_metrics(fresh_app):
+    # fresh_app also clears the metrics earlier tests left in this process
+    known = model_registry.current.symptoms_list
+    client, _ = logged_in_client('timing')
+
+    # top_k asks for live inference, so every model runs
+    response = client.post('/predict', json={'symptoms': known[:3], 'top_k': 3})
+    assert response.status_code == 200
+    spans = dict(re.findall(r'([\w-]+);dur=([\d.]+)', response.headers['Server-Timing']))
+    for name in ['auth', 'vectorize', 'serialize', 'total'] + [f'model-{m}' for m in model_registry.current.models]:
+        assert name in spans, name
+    assert float(spans['total']) >= float(spans['auth'])
+
+    response = client.get('/history')
+    assert {'auth', 'db', 'serialize'} <= set(re.findall(r'([\w-]+);dur=', response.headers['Server-Timing']))
+    assert client.post('/predict', json={'symptoms': 5}).status_code == 400
+    # A failing model: the request ends in an unhandled error
+    ensemble = model_registry.current.ensemble
+    def broken(*args, **kwargs):
+        raise RuntimeError("model failed")
+    ensemble.predict_symptoms = broken
+    try:
+        assert client.post('/predict', json={'symptoms': known[:3]}).status_code == 500
+    finally:
+        del ensemble.predict_symptoms
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert sample(text, 'healix_http_requests_total', route='/predict', method='POST', status='200') == 1
+    assert sample(text, 'healix_http_errors_total', route='/predict', method='POST', status='500') == 1
+    assert sample(text, 'healix_http_requests_total', route='/predict', method='POST', status='400') == 1
+    assert sample(text, 'healix_http_request_duration_seconds_count', route='/history', method='GET') == 1
+    for name in model_registry.current.models:
+        assert sample(text, 'healix_model_inference_seconds_count', model=name) >= 1
+    assert '# TYPE healix_http_request_duration_seconds histogram' in text
+
+def test_failed_statement_not_timed(fresh_app):
+    with app.app_context():
+        timings = {}
+        token = current_timings.set(timings)
+        try:
+            try:
+                db.session.execute(db.text('SELECT * FROM no_such_table'))
+                assert False, "expected a database error"
+            except OperationalError:
+                db.session.rollback()
+            assert 'db' not in timings
+            time.sleep(0.2)
+            # Timed from its own start, not from the statement that failed
+            db.session.execute(db.text('SELECT 1'))
+        finally:
+            current_timings.reset(token)
+        assert timings['db'][1] == 1 and timings['db'][0] < 0.1
+
+def test_metrics_summed_across_gunicorn_workers():
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'workers.db'),
+               WEB_CONCURRENCY='3', METRICS_DIR=tempfile.mkdtemp(), METRICS_FLUSH_SECONDS='0.1')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{PORT}', 'app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                http.get(f'http://127.0.0.1:{PORT}/', timeout=5)
+                break
+            except http.ConnectionError:
+                assert time.monotonic() < deadline, "gunicorn did not start"
+                time.sleep(0.2)
+        for _ in range(59):
+            # New connections, so the requests spread over the workers
+            http.get(f'http://127.0.0.1:{PORT}/', timeout=5)
+        time.sleep(0.5)
+        # Whichever worker answers, it reports the same total for all of them
+        totals = set()
+        for _ in range(6):
+            text = http.get(f'http://127.0.0.1:{PORT}/metrics', timeout=5).text
+            totals.add(sample(text, 'healix_http_requests_total', route='/', method='GET', status='200'))
+        assert totals == {60}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+if __name__ == "__main__":
+    test_registry_adds_up_processes()
+    test_server_timing_and_metrics(reset_app())
+    test_failed_statement_not_timed(reset_app())
+    test_metrics_summed_across_gunicorn_workers()
+    print("SUCCESS: metrics work.")
@@ -0,0 +1,97 @@
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import numpy as np
+from inference import MicroBatcher, BatcherBusy
+
+# MicroBatcher groups concurrent requests and routes each result back to its caller
+
+def run_concurrently(batcher, items):
+    results = [None] * len(items)
+    def call(i):
+        results[i] = batcher.predict(items[i], timeout=5)
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(items))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def test_results_routed_to_callers():
+    batch_sizes = []
+    def predict_batch(x):
+        batch_sizes.append(len(x))
+        time.sleep(0.01)
+        return list(x.sum(axis=(1, 2)))
+    batcher = MicroBatcher(predict_batch, max_batch_size=8, max_wait=0.02)
+    items = [np.full((4, 4), i, dtype=np.float32) for i in range(40)]
+    results = run_concurrently(batcher, items)
+    assert results == [16.0 * i for i in range(40)]
+    assert max(batch_sizes) <= 8
+    assert sum(batch_sizes) == 40
+    # Concurrent callers share forward passes
+    assert len(batch_sizes) < 40
+
+def test_single_request_waits_at_most_max_wait():
+    batcher = MicroBatcher(lambda x: list(x), max_batch_size=16, max_wait=0.005)
+    batcher.predict(np.zeros(3))  # start the worker
+    start = time.perf_counter()
+    assert (batcher.predict(np.ones(3), timeout=1) == 1).all()
+    assert time.perf_counter() - start < 0.5
+
+def test_errors_reach_every_caller():
+    def predict_batch(x):
+        raise RuntimeError("model failed")
+    batcher = MicroBatcher(predict_batch, max_batch_size=4, max_wait=0.01)
+    try:
+        batcher.predict(np.zeros(2), timeout=1)
+        assert False, "expected the model error"
+    except RuntimeError as e:
+        assert str(e) == "model failed"
+
+def test_abandoned_item_never_inferred():
+    seen = []
+    release = threading.Event()
+    def predict_batch(x):
+        seen.extend(x.tolist())
+        release.wait(5)
+        return list(x)
+    batcher = MicroBatcher(predict_batch, max_batch_size=1, max_wait=0)
+    first = batcher.submit(np.array(1))
+    time.sleep(0.05)  # the worker is now busy with the first item
+    try:
+        batcher.predict(np.array(2), timeout=0.05)
+        assert False, "expected TimeoutError"
+    except FutureTimeoutError:
+        pass
+    release.set()
+    assert first.result(5) == 1
+    assert batcher.predict(np.array(3), timeout=5) == 3
+    assert seen == [1, 3]
+
+def test_full_queue_fails_fast():
+    release = threading.Event()
+    def predict_batch(x):
+        release.wait(5)
+        return list(x)
+    batcher = MicroBatcher(predict_batch, max_batch_size=1, max_wait=0, max_queue=1, queue_timeout=0.05)
+    first = batcher.submit(np.array(1))
+    time.sleep(0.05)  # the worker is busy with the first item
+    second = batcher.submit(np.array(2))  # waits in the only queue place
+    start = time.monotonic()
+    try:
+        batcher.submit(np.array(3))
+        assert False, "expected BatcherBusy"
+    except BatcherBusy:
+        pass
+    assert time.monotonic() - start < 1 and batcher.rejected == 1
+    release.set()
+    assert first.result(5) == 1 and second.result(5) == 2
+
+if __name__ == "__main__":
+    test_results_routed_to_callers()
+    test_single_request_waits_at_most_max_wait()
+    test_errors_reach_every_caller()
+    test_abandoned_item_never_inferred()
+    test_full_queue_fails_fast()
+    print("SUCCESS: micro-batching works.")
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import joblib
+from model_registry import (ModelRegistry, LEGACY_VERSION, MODELS_FILE, SYMPTOMS_FILE, SMOKE_TEST_FILE,
+                            publish_version)
+
+# Loading, smoke testing and swapping model versions
+
+def copy_legacy_models():
+    # The repo's flat models/ layout in a scratch directory
+    directory = tempfile.mkdtemp()
+    for name in (MODELS_FILE, SYMPTOMS_FILE):
+        shutil.copy(os.path.join('models', name), directory)
+    return directory
+
+def good_artifacts(path):
+    for name in (MODELS_FILE, SYMPTOMS_FILE):
+        shutil.copy(os.path.join('models', name), path)
+
+def corrupt_artifacts(path):
+    good_artifacts(path)
+    with open(os.path.join(path, MODELS_FILE), 'wb') as f:
+        f.write(b'not a pickle')
+
+def inaccurate_artifacts(path):
+    # Loads fine, but fails the labelled smoke test saved next to the models
+    good_artifacts(path)
+    joblib.dump({'symptom_sets': [['fever']], 'expected': ['No such disease'], 'min_accuracy': 0.5},
+                os.path.join(path, SMOKE_TEST_FILE))
+
+def test_swaps_to_new_versions():
+    models_dir = copy_legacy_models()
+    publish_version(models_dir, good_artifacts, '20250101-000000')
+    registry = ModelRegistry(models_dir, poll_interval=0, use_kernels=False)
+    first = registry.load_initial()
+    assert registry.version == '20250101-000000'
+    assert not registry.check_for_update()
+
+    publish_version(models_dir, good_artifacts, '20250102-000000')
+    assert registry.check_for_update()
+    assert registry.version == '20250102-000000'
+    # A request that picked up the old version before the swap can still finish with it
+    assert len(first.ensemble.predict_symptoms([first.symptoms_list[:2]])) == 1
+
+def test_rejects_bad_versions():
+    models_dir = copy_legacy_models()
+    publish_version(models_dir, good_artifacts, '20250101-000000')
+    registry = ModelRegistry(models_dir, poll_interval=0, use_kernels=False)
+    registry.load_initial()
+    for version, write in (('20250102-000000', corrupt_artifacts), ('20250103-000000', inaccurate_artifacts)):
+        publish_version(models_dir, write, version)
+        assert not registry.check_for_update()
+        assert version in registry.rejected
+        assert registry.version == '20250101-000000'
+    # Rejected versions are not loaded again on every poll
+    assert not registry.check_for_update()
+
+def test_startup_falls_back():
+    models_dir = copy_legacy_models()
+    publish_version(models_dir, good_artifacts, '20250101-000000')
+    publish_version(models_dir, corrupt_artifacts, '20250102-000000')
+    registry = ModelRegistry(models_dir, poll_interval=0, use_kernels=False)
+    registry.load_initial()
+    assert registry.version == '20250101-000000' and registry.rejected == {'20250102-000000'}
+
+    # Nothing versioned loads: the flat layout
+    models_dir = copy_legacy_models()
+    publish_version(models_dir, inaccurate_artifacts, '20250101-000000')
+    registry = ModelRegistry(models_dir, poll_interval=0, use_kernels=False)
+    registry.load_initial()
+    assert registry.version == LEGACY_VERSION
+
+    # A pinned version is used as is and never swapped
+    models_dir = copy_legacy_models()
+    publish_version(models_dir, good_artifacts, '20250101-000000')
+    registry = ModelRegistry(models_dir, poll_interval=0, use_kernels=False, pinned_version=LEGACY_VERSION)
+    registry.load_initial()
+    assert registry.version == LEGACY_VERSION and not registry.check_for_update()
+
+    # Nothing loads at all
+    registry = ModelRegistry(tempfile.mkdtemp(), poll_interval=0, use_kernels=False)
+    assert registry.load_initial() is None and registry.version is None
+
+def test_loads_in_cascade_mode():
+    # Cascade leaves rows a model was not asked about all zero; the smoke test must allow that
+    models_dir = copy_legacy_models()
+    registry = ModelRegistry(models_dir, poll_interval=0, use_kernels=False,
+                             configure=lambda e: e.set_cascade(['SVC', 'NaiveBayes', 'RandomForest'], 0.7, 0.2))
+    current = registry.load_initial()
+    assert current is not None and current.version == LEGACY_VERSION
+    assert LEGACY_VERSION not in registry.rejected
+    result = current.ensemble.predict_symptoms([current.symptoms_list[:3]])
+    assert len(result.final_predictions) == 1
+
+if __name__ == "__main__":
+    test_swaps_to_new_versions()
+    test_rejects_bad_versions()
+    test_startup_falls_back()
+    test_loads_in_cascade_mode()
+    print("SUCCESS: model registry works.")
@@ -0,0 +1,52 @@
+import joblib
+import numpy as np
+from scipy import sparse
+from numpy_scoring import export_models, KERNELS
+
+# Parity check: the NumPy kernels must reproduce sklearn's predict_proba
+TOLERANCE = 1e-5
+
+models = joblib.load('models/disease_prediction_models.pkl')
+symptoms_list = joblib.load('models/symptoms_list.pkl')
+kernels = {name: KERNELS[arrays['kind']](arrays) for name, arrays in export_models(models).items()}
+
+def sample_inputs(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = (rng.random((n, len(symptoms_list))) < 0.25).astype(np.float64)
+    X[0] = 0  # no symptoms at all
+    X[1] = 1  # every symptom
+    return X
+
+def test_probability_parity():
+    X = sample_inputs()
+    for name, model in models.items():
+        expected = model.predict_proba(X)
+        actual = kernels[name].predict_proba(X)
+        max_diff = np.abs(expected - actual).max()
+        print(f"{name}: max |diff| = {max_diff:.2e}")
+        assert max_diff < TOLERANCE
+
+def test_label_parity():
+    X = sample_inputs(seed=1)
+    for name, model in models.items():
+        expected = model.classes_[np.argmax(model.predict_proba(X), axis=1)]
+        assert (kernels[name].predict(X) == expected).all()
+
+def test_single_row():
+    X = sample_inputs(n=5, seed=2)
+    for name, model in models.items():
+        for row in X:
+            assert np.allclose(model.predict_proba(row[None, :]), kernels[name].predict_proba(row[None, :]), atol=TOLERANCE)
+
+def test_sparse_input():
+    # CSR input must give the same probabilities as the dense rows
+    X = sample_inputs(n=500, seed=3)
+    for name, kernel in kernels.items():
+        assert np.allclose(kernel.predict_proba(sparse.csr_matrix(X)), kernel.predict_proba(X), atol=TOLERANCE)
+
+if __name__ == "__main__":
+    test_probability_parity()
+    test_label_parity()
+    test_single_row()
+    test_sparse_input()
+    print("SUCCESS: NumPy kernels match sklearn.")
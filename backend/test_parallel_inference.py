@@ -0,0 +1,77 @@
+import time
+import joblib
+import numpy as np
+from inference import DiseaseEnsemble, InferenceExecutor, InferenceTimeout
+from metrics import current_timings
+
+# Models run side by side on the shared executor; one that misses the deadline is left
+# out of the vote instead of holding the request
+
+models = joblib.load('models/disease_prediction_models.pkl')
+symptoms_list = joblib.load('models/symptoms_list.pkl')
+
+class SlowModel:
+    # Wraps a model and delays its answers
+    def __init__(self, model, seconds):
+        self.model = model
+        self.seconds = seconds
+        self.classes_ = model.classes_
+
+    def predict_proba(self, X):
+        time.sleep(self.seconds)
+        return self.model.predict_proba(X)
+
+def sample_inputs(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((n, len(symptoms_list))) < 0.2).astype(np.float64)
+
+def test_same_result_as_sequential():
+    X = sample_inputs()
+    sequential = DiseaseEnsemble(models, symptoms_list).predict(X)
+    ensemble = DiseaseEnsemble(models, symptoms_list)
+    ensemble.executor = InferenceExecutor(max_workers=3, deadline=30)
+    parallel = ensemble.predict(X)
+    assert parallel.timed_out == []
+    assert list(parallel.probabilities) == list(models)
+    for name in models:
+        assert np.array_equal(parallel.probabilities[name], sequential.probabilities[name])
+    assert (parallel.final_ids == sequential.final_ids).all()
+
+def test_slow_model_dropped_at_deadline():
+    slow = dict(models, RandomForest=SlowModel(models['RandomForest'], 1.0))
+    ensemble = DiseaseEnsemble(slow, symptoms_list)
+    ensemble.executor = InferenceExecutor(max_workers=3, deadline=0.3)
+    start = time.perf_counter()
+    result = ensemble.predict_symptoms([symptoms_list[:3]])
+    assert time.perf_counter() - start < 0.9
+    assert result.timed_out == ['RandomForest']
+    assert set(result.models_evaluated(0)) == set(models) - {'RandomForest'}
+    assert 'RandomForest' not in result.model_predictions(0)
+
+def test_all_models_late():
+    slow = {name: SlowModel(model, 0.5) for name, model in models.items()}
+    ensemble = DiseaseEnsemble(slow, symptoms_list)
+    ensemble.executor = InferenceExecutor(max_workers=3, deadline=0.1)
+    try:
+        ensemble.predict(sample_inputs(n=1))
+        assert False, "expected InferenceTimeout"
+    except InferenceTimeout:
+        pass
+
+def test_model_spans_reach_the_caller():
+    ensemble = DiseaseEnsemble(models, symptoms_list)
+    ensemble.executor = InferenceExecutor(max_workers=3, deadline=30)
+    timings = {}
+    token = current_timings.set(timings)
+    try:
+        ensemble.predict(sample_inputs(n=5))
+    finally:
+        current_timings.reset(token)
+    assert {f'model-{name}' for name in models} <= set(timings)
+
+if __name__ == "__main__":
+    test_same_result_as_sequential()
+    test_slow_model_dropped_at_deadline()
+    test_all_models_late()
+    test_model_spans_reach_the_caller()
+    print("SUCCESS: parallel inference works.")
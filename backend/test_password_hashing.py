@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+from flask import Flask
+from flask_bcrypt import Bcrypt
+from password_hashing import PasswordHasher, HasherBusy, default_threads, hash_rounds
+
+# bcrypt on a bounded pool: results as inline, extra callers queued then rejected, cost upgrades detected
+
+bcrypt = Bcrypt(Flask(__name__))
+
+class SlowBcrypt:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def check_password_hash(self, pw_hash, password):
+        time.sleep(self.seconds)
+        return pw_hash == password
+
+def test_hash_and_check():
+    for threads in (0, 1):
+        hasher = PasswordHasher(bcrypt, rounds=4, max_workers=threads)
+        pw_hash = hasher.hash('secret')
+        assert hash_rounds(pw_hash) == 4
+        assert hasher.check(pw_hash, 'secret')
+        assert not hasher.check(pw_hash, 'wrong')
+
+def test_rehash_when_cost_changes():
+    old_hash = PasswordHasher(bcrypt, rounds=4).hash('secret')
+    hasher = PasswordHasher(bcrypt, rounds=5)
+    assert hasher.needs_rehash(old_hash)
+    new_hash = hasher.hash('secret')
+    assert not hasher.needs_rehash(new_hash) and hasher.check(new_hash, 'secret')
+
+def concurrent_logins(hasher, n):
+    outcomes = []
+    def login():
+        try:
+            outcomes.append(hasher.check('pw', 'pw'))
+        except HasherBusy:
+            outcomes.append('busy')
+    threads = [threading.Thread(target=login) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(outcomes, key=str)
+
+def test_excess_callers_wait_for_a_place():
+    hasher = PasswordHasher(SlowBcrypt(0.2), max_workers=1, max_pending=1, queue_timeout=2)
+    # One running, one queued, two waiting for a place; all get their answer
+    assert concurrent_logins(hasher, 4) == [True] * 4
+    assert hasher.rejected == 0
+
+def test_excess_callers_rejected_after_queue_timeout():
+    hasher = PasswordHasher(SlowBcrypt(0.3), max_workers=1, max_pending=1, queue_timeout=0.1)
+    start = time.perf_counter()
+    assert concurrent_logins(hasher, 4) == [True, True, 'busy', 'busy']
+    assert hasher.rejected == 2
+    assert time.perf_counter() - start < 1
+    assert hasher.check('pw', 'pw')
+
+def test_default_sizing():
+    cpus = os.cpu_count() or 1
+    assert default_threads() == cpus and default_threads(web_workers=2 * cpus) == 1
+    hasher = PasswordHasher(bcrypt)
+    assert hasher.max_workers == cpus and hasher.max_pending == 2 * cpus
+
+if __name__ == "__main__":
+    test_hash_and_check()
+    test_rehash_when_cost_changes()
+    test_excess_callers_wait_for_a_place()
+    test_excess_callers_rejected_after_queue_timeout()
+    test_default_sizing()
+    print("SUCCESS: password hashing works.")
@@ -0,0 +1,179 @@
+import threading
+import time
+from places_client import PlacesClient, PlacesError, search_key
+from places_stand_in import PlacesStandIn
+
+# Text Search through the cache against a local stand-in: hits, timeouts, stale answers
+# and a single upstream call for concurrent misses
+
+def test_normalized_key_hits_cache():
+    with PlacesStandIn() as stand_in:
+        client = PlacesClient('test-key', base_url=stand_in.base_url)
+        first = client.search('Cardiologist', 'New York,NY')
+        second = client.search(' cardiologist ', 'new  york, ny')
+        assert second == first and len(first) == 3
+        assert stand_in.calls == {'textsearch/json': 1}
+        path, params = stand_in.queries[0]
+        assert params['key'] == 'test-key' and params['query'] == 'Cardiologist doctors in New York,NY'
+        assert search_key('A', 'b,c') == search_key('a ', 'B, c')
+        assert client.stats()['hits'] == 1
+
+def test_read_timeout():
+    with PlacesStandIn(delay=1.0) as stand_in:
+        client = PlacesClient('test-key', base_url=stand_in.base_url, read_timeout=0.2)
+        start = time.perf_counter()
+        try:
+            client.search('dentist', 'Boston')
+            assert False, "expected a timeout"
+        except PlacesError:
+            pass
+        assert time.perf_counter() - start < 0.8
+        assert client.stats()['entries'] == 0
+
+def test_api_errors_not_cached():
+    with PlacesStandIn(status='OVER_QUERY_LIMIT') as stand_in:
+        client = PlacesClient('test-key', base_url=stand_in.base_url)
+        for _ in range(2):
+            try:
+                client.search('dentist', 'Boston')
+                assert False, "expected an API error"
+            except PlacesError:
+                pass
+        assert stand_in.calls['textsearch/json'] == 2
+
+def test_concurrent_misses_coalesced():
+    with PlacesStandIn(delay=0.3) as stand_in:
+        client = PlacesClient('test-key', base_url=stand_in.base_url)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.search('GP', 'Leeds')))
+                   for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(results) == 10 and all(r == results[0] for r in results)
+        assert stand_in.calls['textsearch/json'] == 1
+        assert client.stats()['coalesced'] == 9
+
+def test_follower_timeout_is_places_error():
+    # The leader's call outlasts what a coalesced caller is willing to wait
+    client = PlacesClient('test-key', connect_timeout=0.1, read_timeout=0.1)
+    client._text_search = lambda specialty, location: time.sleep(2) or []
+    leader = threading.Thread(target=client.search, args=('GP', 'Leeds'))
+    leader.start()
+    time.sleep(0.05)
+    try:
+        client.search('GP', 'Leeds')
+        assert False, "expected PlacesError"
+    except PlacesError:
+        pass
+    leader.join()
+
+def test_malformed_results():
+    client = PlacesClient('test-key')
+    client.get_json = lambda path, params: {'status': 'OK', 'results': [
+        {'place_id': 'a', 'name': 'No geometry'},
+        {'place_id': 'b', 'geometry': {'location': {'lat': None, 'lng': 1}}},
+        {'place_id': 'c', 'geometry': {'location': {'lat': 51.5, 'lng': -0.1}}}
+    ]}
+    assert [place['place_id'] for place in client.search('GP', 'London')] == ['c']
+    client.get_json = lambda path, params: {'status': 'OK', 'results': 'oops'}
+    try:
+        client.search('GP', 'Paris')
+        assert False, "expected PlacesError"
+    except PlacesError:
+        pass
+
+def test_stale_while_revalidate():
+    with PlacesStandIn() as stand_in:
+        client = PlacesClient('test-key', base_url=stand_in.base_url, ttl=0.3, stale_ttl=60)
+        first = client.search('GP', 'Leeds')
+        time.sleep(0.35)
+        stand_in.delay = 0.2
+        # Expired: answered from the cache at once, refreshed in the background
+        start = time.perf_counter()
+        assert client.search('GP', 'Leeds') == first
+        assert time.perf_counter() - start < 0.1
+        deadline = time.monotonic() + 5
+        while stand_in.calls['textsearch/json'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.25)
+        assert client.stats()['stale_hits'] == 1
+        # The refresh made the entry fresh again
+        client.search('GP', 'Leeds')
+        assert stand_in.calls['textsearch/json'] == 2 and client.stats()['hits'] == 1
+        # A failed refresh keeps the stale results
+        time.sleep(0.35)
+        stand_in.delay = 0
+        stand_in.status = 'UNKNOWN_ERROR'
+        assert client.search('GP', 'Leeds') == first
+        time.sleep(0.1)
+        assert client.stats()['upstream_errors'] == 1
+        assert client.search('GP', 'Leeds') == first
+
+def test_details_fetched_concurrently():
+    delays = {f"place{i}": 0.1 + 0.05 * i for i in range(6)}
+    with PlacesStandIn(delays=delays) as stand_in:
+        client = PlacesClient('test-key', base_url=stand_in.base_url, details_workers=6)
+        start = time.perf_counter()
+        details = client.place_details(list(delays), deadline=2)
+        elapsed = time.perf_counter() - start
+        # Serially this would take 1.35s; in parallel about the slowest call (0.35s)
+        assert sorted(details) == sorted(delays) and elapsed < 0.6
+        assert details['place0']['formatted_phone_number']
+        path, params = next(q for q in stand_in.queries if q[0] == 'details/json')
+        assert 'formatted_phone_number' in params['fields']
+        # Cached per place_id: no second round of calls
+        start = time.perf_counter()
+        assert client.place_details(list(delays), deadline=2) == details
+        assert time.perf_counter() - start < 0.05
+        assert stand_in.calls['details/json'] == 6
+
+def test_details_deadline():
+    with PlacesStandIn(delays={'slow': 1.0}) as stand_in:
+        client = PlacesClient('test-key', base_url=stand_in.base_url, details_workers=4)
+        start = time.perf_counter()
+        details = client.place_details(['a', 'slow', 'b'], deadline=0.3)
+        assert sorted(details) == ['a', 'b']
+        assert time.perf_counter() - start < 0.5
+        assert client.stats()['details_late'] == 1
+        # The late answer still lands in the cache
+        time.sleep(1)
+        assert sorted(client.place_details(['a', 'slow', 'b'], deadline=0.3)) == ['a', 'b', 'slow']
+        assert stand_in.calls['details/json'] == 3
+
+def test_malformed_details_not_cached():
+    client = PlacesClient('test-key', details_workers=2)
+    answers = {'a': {'status': 'OK', 'result': ['oops']}, 'b': {'status': 'OK'},
+               'c': {'status': 'OK', 'result': {'formatted_phone_number': '0113 000 0000'}}}
+    client.get_json = lambda path, params: answers[params['place_id']]
+    assert client.place_details(['a', 'b', 'c'], deadline=2) == {'c': answers['c']['result']}
+    assert client.stats()['upstream_errors'] == 2
+    answers['a'] = {'status': 'OK', 'result': {'website': 'https://example.com'}}
+    assert sorted(client.place_details(['a', 'c'], deadline=2)) == ['a', 'c']
+
+def test_details_parallelism_bounded():
+    places = [f"p{i}" for i in range(8)]
+    with PlacesStandIn(delay=0.2) as stand_in:
+        client = PlacesClient('test-key', base_url=stand_in.base_url, details_workers=2)
+        start = time.perf_counter()
+        details = client.place_details(places, deadline=0.5)
+        # Two at a time: only the first two rounds fit in the deadline, the queued rest is dropped
+        assert len(details) == 4
+        assert time.perf_counter() - start < 0.7
+        time.sleep(0.3)
+        assert stand_in.calls['details/json'] <= 6
+
+if __name__ == "__main__":
+    test_normalized_key_hits_cache()
+    test_read_timeout()
+    test_api_errors_not_cached()
+    test_concurrent_misses_coalesced()
+    test_follower_timeout_is_places_error()
+    test_malformed_results()
+    test_stale_while_revalidate()
+    test_details_fetched_concurrently()
+    test_details_deadline()
+    test_malformed_details_not_cached()
+    test_details_parallelism_bounded()
+    print("SUCCESS: Places client works.")
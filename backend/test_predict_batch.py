@@ -0,0 +1,44 @@
+from conftest import reset_app, logged_in_client
+import app as app_module
+from app import app, Prediction, audit_writer, model_registry
+
+# /predict/batch: one result per symptom set, matching /predict, and a cap on the batch size
+
+def test_rows_match_single_predictions(fresh_app):
+    known = model_registry.current.symptoms_list
+    client, user_id = logged_in_client('batch')
+    symptom_sets = [known[:3], [known[5]], [], [known[1], 'not_a_symptom'], known[10:14]]
+    response = client.post('/predict/batch', json={'symptom_sets': symptom_sets, 'top_k': 2})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['model_version'] == model_registry.version
+    assert len(body['results']) == len(symptom_sets)
+    for symptoms, row in zip(symptom_sets, body['results']):
+        single = client.post('/predict', json={'symptoms': symptoms, 'top_k': 2}).get_json()
+        for key in ('final_prediction', 'predictions', 'models_evaluated', 'remedies', 'exercises'):
+            assert row[key] == single[key], (symptoms, key)
+        assert len(row['differential']) == 2
+
+    # One history row per symptom set (plus the single predictions above)
+    audit_writer.flush()
+    with app.app_context():
+        assert Prediction.query.filter_by(user_id=user_id).count() == 2 * len(symptom_sets)
+
+def test_batch_limits(fresh_app):
+    client, _ = logged_in_client('batch-limits')
+    assert client.post('/predict/batch', json={'symptom_sets': []}).get_json() == {'results': []}
+    assert client.post('/predict/batch', json={'symptom_sets': 'fever'}).status_code == 400
+    assert client.post('/predict/batch', json={'symptom_sets': [['fever'], 'cough']}).status_code == 400
+    limit = app_module.MAX_PREDICT_BATCH
+    app_module.MAX_PREDICT_BATCH = 3
+    try:
+        assert client.post('/predict/batch', json={'symptom_sets': [[]] * 3}).status_code == 200
+        response = client.post('/predict/batch', json={'symptom_sets': [[]] * 4})
+        assert response.status_code == 413 and '3' in response.get_json()['error']
+    finally:
+        app_module.MAX_PREDICT_BATCH = limit
+
+if __name__ == "__main__":
+    test_rows_match_single_predictions(reset_app())
+    test_batch_limits(reset_app())
+    print("SUCCESS: batch prediction works.")
@@ -0,0 +1,62 @@
+import io
+import numpy as np
+from PIL import Image
+from skin_cache import SkinResultCache, perceptual_hash
+
+# Repeat uploads are answered from the cache: byte-identical ones by SHA-256, re-encoded
+# ones by perceptual hash, and only for the model version that produced the result
+
+RESULTS = [{'name': 'Eczema', 'probability': 80.0, 'recommendation': ''}]
+
+def photo(seed=0, quality=90, size=(640, 480)):
+    # Smooth random blobs, so re-encoding changes bytes but not the picture
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize(size, Image.BICUBIC)
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+def test_exact_and_recompressed_hits():
+    cache = SkinResultCache(max_entries=16)
+    original = photo()
+    results, keys, _ = cache.lookup(original, 'v1')
+    assert results is None
+    cache.store(keys, 'v1', RESULTS)
+
+    assert cache.lookup(original, 'v1')[0] == RESULTS
+    recompressed = photo(quality=60)
+    assert recompressed != original
+    assert cache.lookup(recompressed, 'v1')[0] == RESULTS
+    resized = photo(size=(320, 240))
+    assert cache.lookup(resized, 'v1')[0] == RESULTS
+
+    # A different picture is a miss
+    assert cache.lookup(photo(seed=1), 'v1')[0] is None
+    stats = cache.stats()
+    assert (stats['exact_hits'], stats['perceptual_hits'], stats['misses']) == (1, 2, 2)
+    assert stats['hit_rate'] == 0.6
+
+def test_model_version_isolation():
+    cache = SkinResultCache(max_entries=16)
+    data = photo()
+    cache.store(cache.lookup(data, 'v1')[1], 'v1', RESULTS)
+    assert cache.lookup(data, 'v2')[0] is None
+
+def test_lru_eviction():
+    cache = SkinResultCache(max_entries=2, max_distance=0)
+    uploads = [photo(seed) for seed in range(3)]
+    assert len({perceptual_hash(data) for data in uploads}) == 3
+    for data in uploads[:2]:
+        cache.store(cache.lookup(data, 'v1')[1], 'v1', RESULTS)
+    cache.lookup(uploads[0], 'v1')  # now the most recently used
+    cache.store(cache.lookup(uploads[2], 'v1')[1], 'v1', RESULTS)
+    assert cache.lookup(uploads[0], 'v1')[0] == RESULTS
+    assert cache.lookup(uploads[1], 'v1')[0] is None
+    assert cache.stats()['evictions'] == 1
+
+if __name__ == "__main__":
+    test_exact_and_recompressed_hits()
+    test_model_version_isolation()
+    test_lru_eviction()
+    print("SUCCESS: skin result cache works.")
@@ -0,0 +1,62 @@
+import io
+import numpy as np
+from PIL import Image
+import skin_preprocessing
+
+# In-memory decode of skin uploads into the MobileNetV2 input tensor
+
+def jpeg_bytes(width=1600, height=1200, mode='RGB'):
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).convert(mode)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+def test_input_tensor():
+    x = skin_preprocessing.preprocess(jpeg_bytes())
+    assert x.shape == (224, 224, 3)
+    assert x.dtype == np.float32
+    assert -1 <= x.min() and x.max() <= 1
+
+def test_bytes_stream_and_path_agree(tmp_path):
+    data = jpeg_bytes()
+    path = tmp_path / 'upload.jpg'
+    path.write_bytes(data)
+    from_bytes = skin_preprocessing.preprocess(data)
+    assert np.array_equal(from_bytes, skin_preprocessing.preprocess(io.BytesIO(data)))
+    assert np.array_equal(from_bytes, skin_preprocessing.preprocess(str(path)))
+
+def test_large_jpeg_decoded_at_reduced_scale():
+    img = skin_preprocessing.open_image(jpeg_bytes(4000, 3000))
+    img.draft('RGB', skin_preprocessing.INPUT_SIZE)
+    # 1/8 scale is the smallest DCT scale that still covers 224x224
+    assert img.size == (500, 375)
+
+def test_writes_into_batch_buffer():
+    batch = np.zeros((2, 224, 224, 3), dtype=np.float32)
+    out = skin_preprocessing.preprocess(jpeg_bytes(), out=batch[1])
+    assert np.shares_memory(out, batch)
+    assert batch[1].any() and not batch[0].any()
+
+def test_exif_orientation_and_grayscale():
+    # Left half white; EXIF orientation 6 displays it rotated 90 degrees clockwise,
+    # which puts the white half on top
+    pixels = np.zeros((320, 640, 3), dtype=np.uint8)
+    pixels[:, :320] = 255
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.fromarray(pixels).save(buffer, format='JPEG', exif=exif.tobytes())
+    x = skin_preprocessing.preprocess(buffer.getvalue())
+    assert x[:100].mean() > 0.9 and x[-100:].mean() < -0.9
+    assert skin_preprocessing.preprocess(jpeg_bytes(mode='L')).shape == (224, 224, 3)
+
+if __name__ == "__main__":
+    import pathlib, tempfile
+    test_input_tensor()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_bytes_stream_and_path_agree(pathlib.Path(tmp))
+    test_large_jpeg_decoded_at_reduced_scale()
+    test_writes_into_batch_buffer()
+    test_exif_orientation_and_grayscale()
+    print("SUCCESS: skin preprocessing works.")
@@ -0,0 +1,147 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from PIL import Image
+from skin_worker_pool import SkinPoolServer, SkinPoolClient, PoolBusy, PoolError, PoolUnavailable
+
+# The pool runs a small stand-in model in separate processes; the tensor reaches it
+# through shared memory and the result comes back to the caller that sent it
+
+class MeanModel:
+    # Reports each image's mean value; delay simulates a slow forward pass
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def predict_batch(self, x):
+        time.sleep(self.delay)
+        return [[{'name': 'mean', 'probability': float(row.mean()), 'recommendation': ''}] for row in x]
+
+def solid_jpeg(value):
+    out = io.BytesIO()
+    Image.new('RGB', (300, 200), (value, value, value)).save(out, format='JPEG')
+    return out.getvalue()
+
+def start_pool(tmp, **kwargs):
+    socket_path = os.path.join(tmp, 'skin.sock')
+    server = SkinPoolServer(kwargs.pop('size', 2), socket_path, model='test_skin_worker_pool:MeanModel', **kwargs)
+    server.start()
+    return server, socket_path
+
+def test_results_routed_to_callers():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, socket_path = start_pool(tmp)
+        client = SkinPoolClient(socket_path, slots=16)
+        try:
+            values = list(range(0, 256, 16))
+            results = [None] * len(values)
+            def call(i):
+                results[i] = client.predict(solid_jpeg(values[i]), timeout=60)
+            threads = [threading.Thread(target=call, args=(i,)) for i in range(len(values))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            for value, result in zip(values, results):
+                assert abs(result[0]['probability'] - (value / 127.5 - 1)) < 0.05
+            health = client.health()
+            assert health['healthy'] and health['workers_alive'] == 2
+            assert health['completed'] == len(values) and health['pending'] == 0
+        finally:
+            client.close()
+            server.stop()
+
+def test_saturated_pool_fails_fast():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, socket_path = start_pool(tmp, size=1, max_pending=2, max_batch=1,
+                                         model_kwargs={'delay': 0.5})
+        client = SkinPoolClient(socket_path, slots=8)
+        try:
+            client.predict(solid_jpeg(0), timeout=60)  # wait for the worker to load
+            futures = [client.submit(solid_jpeg(0)) for _ in range(2)]
+            start = time.perf_counter()
+            try:
+                client.predict(solid_jpeg(0), timeout=5)
+                assert False, "expected PoolBusy from the server"
+            except PoolBusy:
+                assert time.perf_counter() - start < 0.4
+            for future in futures:
+                future.result(5)
+            health = client.health()
+            assert health['rejected'] == 1 and health['pending'] == 0
+        finally:
+            client.close()
+
+        # A web worker also refuses once all of its own slots are waiting for replies
+        client = SkinPoolClient(socket_path, slots=1)
+        try:
+            future = client.submit(solid_jpeg(0))
+            try:
+                client.submit(solid_jpeg(0))
+                assert False, "expected PoolBusy from the client"
+            except PoolBusy:
+                pass
+            future.result(5)
+        finally:
+            client.close()
+            server.stop()
+
+def test_crashed_worker_frees_slot():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, socket_path = start_pool(tmp, size=1, max_batch=1, model_kwargs={'delay': 3})
+        client = SkinPoolClient(socket_path, slots=1)
+        try:
+            client.predict(solid_jpeg(0), timeout=60)  # wait for the worker to load
+            future = client.submit(solid_jpeg(0))
+            time.sleep(0.5)
+            server.workers[0].kill()
+            try:
+                client.wait(future, timeout=10)
+                assert False, "expected the crashed worker's request to fail"
+            except PoolError as e:
+                assert 'lost' in str(e)
+            # The only slot is free again and the restarted worker answers
+            assert client.predict(solid_jpeg(0), timeout=60)[0]['name'] == 'mean'
+            health = client.health()
+            assert health['lost'] == 1 and health['restarts'] == 1 and health['pending'] == 0
+        finally:
+            client.close()
+            server.stop()
+
+def test_timed_out_wait_frees_slot():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, socket_path = start_pool(tmp, size=1, max_batch=1, model_kwargs={'delay': 1})
+        client = SkinPoolClient(socket_path, slots=1)
+        try:
+            client.predict(solid_jpeg(0), timeout=60)
+            try:
+                client.predict(solid_jpeg(0), timeout=0.1)
+                assert False, "expected TimeoutError"
+            except FutureTimeoutError:
+                pass
+            # Not PoolBusy: the slot came back when the caller gave up; the late reply is dropped
+            assert client.predict(solid_jpeg(0), timeout=10)[0]['name'] == 'mean'
+        finally:
+            client.close()
+            server.stop()
+
+def test_unreachable_pool():
+    with tempfile.TemporaryDirectory() as tmp:
+        client = SkinPoolClient(os.path.join(tmp, 'missing.sock'), slots=1)
+        try:
+            client.predict(solid_jpeg(0), timeout=1)
+            assert False, "expected PoolUnavailable"
+        except PoolUnavailable:
+            pass
+        finally:
+            client.close()
+
+if __name__ == "__main__":
+    test_results_routed_to_callers()
+    test_saturated_pool_fails_fast()
+    test_crashed_worker_frees_slot()
+    test_timed_out_wait_frees_slot()
+    test_unreachable_pool()
+    print("SUCCESS: skin worker pool works.")
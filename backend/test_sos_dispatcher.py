@@ -0,0 +1,102 @@
+import time
+from conftest import reset_app, logged_in_client
+from app import app, db, EmergencyContact, sos_dispatcher
+from sos_dispatcher import SOSDispatcher, SMSChannel, EmailChannel
+from sos_stand_in import SMSSink, SMTPSink
+
+# SOS alerts fan out to stand-in SMS and SMTP sinks: queued without waiting, sent in
+# parallel, slow channels timed out and retried, every attempt recorded
+
+# Time from accepting an SOS to the first alert handed to a channel
+FIRST_DELIVERY_TARGET = 0.5
+
+def contacts(count):
+    return [{'id': i, 'name': f"Contact {i}", 'phone': f"+1555{i:07d}", 'email': f"c{i}@example.com"}
+            for i in range(count)]
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_fan_out_is_parallel():
+    with SMSSink(delay=0.2) as sms, SMTPSink(delay=0.2) as smtp:
+        attempts = []
+        dispatcher = SOSDispatcher([SMSChannel(sms.url), EmailChannel('127.0.0.1', smtp.port)],
+                                   record=attempts.append, max_workers=40,
+                                   first_delivery_target=FIRST_DELIVERY_TARGET)
+        start = time.monotonic()
+        assert dispatcher.dispatch(1, contacts(20), "SOS", "help") == 40
+        # Returns once queued, before any alert is out (each sink takes 0.2s); a wall-clock
+        # bound here fails whenever the machine is busy
+        assert not sms.received and not smtp.received
+        assert wait_for(lambda: len(sms.received) + len(smtp.received) == 40)
+        first = min(t for t, _, _ in sms.received + smtp.received) - start
+        last = max(t for t, _, _ in sms.received + smtp.received) - start
+        # Serially this would take 40 x 0.2s = 8s
+        assert first < FIRST_DELIVERY_TARGET and last < 1.5
+        assert wait_for(lambda: dispatcher.stats()['pending'] == 0)
+        stats = dispatcher.stats()
+        assert stats['sent'] == 40 and stats['missed_target'] == 0
+        assert stats['last_first_delivery_ms'] < FIRST_DELIVERY_TARGET * 1000
+        assert len(attempts) == 40 and {a['status'] for a in attempts} == {'sent'}
+        assert smtp.received[0][2].strip() == 'help'
+        dispatcher.close()
+
+def test_slow_channel_times_out_without_delaying_others():
+    slow = contacts(4)[3]
+    with SMSSink(delays={slow['phone']: 2}) as sms, SMTPSink(delays={slow['email']: 2}) as smtp:
+        attempts = []
+        dispatcher = SOSDispatcher([SMSChannel(sms.url, timeout=0.3, retries=1),
+                                    EmailChannel('127.0.0.1', smtp.port, timeout=0.3, retries=1)],
+                                   record=attempts.append, backoff=0.01)
+        start = time.monotonic()
+        dispatcher.dispatch(7, contacts(4), "SOS", "help")
+        assert wait_for(lambda: len(sms.received) + len(smtp.received) == 6)
+        assert max(t for t, _, _ in sms.received + smtp.received) - start < 0.5
+        assert wait_for(lambda: dispatcher.stats()['pending'] == 0)
+        # Two timed-out attempts per channel for the slow contact, then given up
+        failed = [a for a in attempts if a['status'] == 'failed']
+        assert sorted((a['channel'], a['attempt']) for a in failed) == \
+            [('email', 1), ('email', 2), ('sms', 1), ('sms', 2)]
+        assert all(a['contact_id'] == 3 and a['latency_ms'] < 1000 for a in failed)
+        assert dispatcher.stats()['failed'] == 2 and dispatcher.stats()['sent'] == 6
+        dispatcher.close()
+
+def test_refused_delivery_retried():
+    with SMSSink(fail=1) as sms:
+        attempts = []
+        dispatcher = SOSDispatcher([SMSChannel(sms.url, retries=2)], record=attempts.append, backoff=0.01)
+        dispatcher.dispatch(3, contacts(1), "SOS", "help")
+        assert wait_for(lambda: dispatcher.stats()['pending'] == 0)
+        assert [(a['attempt'], a['status']) for a in attempts] == [(1, 'failed'), (2, 'sent')]
+        assert 'HTTPError' in attempts[0]['error'] and len(sms.received) == 1
+        dispatcher.close()
+
+def test_sos_endpoint_records_deliveries(fresh_app):
+    client, user_id = logged_in_client('sos')
+    other, _ = logged_in_client('sos-other')
+    with SMSSink() as sms, SMTPSink() as smtp, app.app_context():
+        sos_dispatcher.channels = [SMSChannel(sms.url), EmailChannel('127.0.0.1', smtp.port)]
+        db.session.add_all([EmergencyContact(user_id=user_id, name='Mum', phone='+15550001', email='mum@example.com'),
+                            EmergencyContact(user_id=user_id, name='Neighbour', phone='+15550002')])
+        db.session.commit()
+
+        response = client.post('/sos', json={'latitude': 51.5, 'longitude': -0.12})
+        assert response.status_code == 200
+        event_id = response.get_json()['event_id']
+        status = lambda: client.get(f'/sos/{event_id}').get_json()
+        assert wait_for(lambda: status()['delivered'] == 3)
+        assert status()['queued'] == 3
+        assert sorted(a['recipient'] for a in status()['attempts']) == ['+15550001', '+15550002', 'mum@example.com']
+        assert '51.5,-0.12' in sms.received[0][2]
+
+        assert other.get(f'/sos/{event_id}').status_code == 403
+
+if __name__ == "__main__":
+    test_fan_out_is_parallel()
+    test_slow_channel_times_out_without_delaying_others()
+    test_refused_delivery_retried()
+    test_sos_endpoint_records_deliveries(reset_app())
+    print("SUCCESS: SOS dispatcher works.")
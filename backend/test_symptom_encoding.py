@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from conftest import reset_app, logged_in_client
+from app import (app, db, Prediction, prediction_symptom, symptom_vocabulary, add_predictions, audit_writer,
+                 model_registry)
+from migrations import backfill_prediction_symptoms
+from symptom_encoding import SYMPTOM_MASK_BITS, SYMPTOM_NAME_LENGTH, MASK_OVERFLOW, encode_mask, decode_mask
+
+# Prediction symptoms stored as a bitmask plus prediction_symptom rows, and decoded back
+
+def test_mask_round_trip():
+    for ids in ([], [0], [3, 9, 19], list(range(0, SYMPTOM_MASK_BITS, 7)), [SYMPTOM_MASK_BITS - 1]):
+        assert decode_mask(encode_mask(ids)) == ids
+    # Fits a signed BIGINT
+    assert 0 <= encode_mask(list(range(SYMPTOM_MASK_BITS))) < 2 ** 63
+    assert encode_mask([SYMPTOM_MASK_BITS]) == MASK_OVERFLOW
+
+def test_history_decodes_and_filters(fresh_app):
+    known = model_registry.current.symptoms_list
+    client, user_id = logged_in_client('symptoms')
+    with app.app_context():
+        add_predictions(user_id, ['Flu', 'Acne'], [[known[2], known[0], 'not_a_symptom'], [known[5]]])
+        # Stored before the mask existed; the backfill encodes it from the text
+        db.session.add(Prediction(user_id=user_id, disease='Cold', symptoms=f'{known[5]},{known[1]}'))
+        db.session.commit()
+        backfill_prediction_symptoms(db, Prediction, prediction_symptom, symptom_vocabulary)
+        # A vocabulary grown past the mask: ids over 62 are stored in prediction_symptom only
+        extra = [f'extra_{i}' for i in range(SYMPTOM_MASK_BITS)]
+        symptom_vocabulary.add(extra)
+        rare = add_predictions(user_id, ['Rare'], [[known[5], extra[-1]]])[0]
+        db.session.commit()
+        assert rare.symptom_mask == MASK_OVERFLOW
+        assert Prediction.query.filter(Prediction.symptom_mask.is_(None)).count() == 0
+
+    history = {item['disease']: item['symptoms'] for item in client.get('/history').get_json()['history']}
+    # Every submitted name, including ones the model does not know, in vocabulary order
+    assert history == {'Flu': [known[0], known[2], 'not_a_symptom'], 'Acne': [known[5]], 'Cold': [known[1], known[5]],
+                       'Rare': [known[5], extra[-1]]}
+
+    with_symptom = client.get(f'/history?symptom={known[5]}').get_json()['history']
+    assert sorted(item['disease'] for item in with_symptom) == ['Acne', 'Cold', 'Rare']
+    assert [item['disease'] for item in client.get(f'/history?symptom={known[2]}').get_json()['history']] == ['Flu']
+    assert [item['disease'] for item in client.get(f'/history?symptom={extra[-1]}').get_json()['history']] == ['Rare']
+    assert [item['disease'] for item in client.get('/history?symptom=not_a_symptom').get_json()['history']] == ['Flu']
+    assert client.get('/history?symptom=unknown').get_json()['history'] == []
+
+    prediction_id = next(item['id'] for item in with_symptom if item['disease'] == 'Acne')
+    assert client.delete(f'/history/{prediction_id}').status_code == 200
+    with app.app_context():
+        links = db.session.execute(db.select(prediction_symptom).where(
+            prediction_symptom.c.prediction_id == prediction_id)).all()
+        assert links == []
+
+def test_predict_stores_every_name(fresh_app):
+    known = model_registry.current.symptoms_list
+    client, _ = logged_in_client('submitted')
+    assert client.post('/predict', json={'symptoms': [known[3], 'my own words', known[1]]}).status_code == 200
+    audit_writer.flush()
+    [item] = client.get('/history').get_json()['history']
+    assert item['symptoms'] == [known[1], known[3], 'my own words']
+    # Names the symptom table cannot hold are refused up front
+    for symptoms in (['x' * (SYMPTOM_NAME_LENGTH + 1)], [known[1], 7]):
+        assert client.post('/predict', json={'symptoms': symptoms}).status_code == 400
+        assert client.post('/predict/batch', json={'symptom_sets': [symptoms]}).status_code == 400
+
+def test_import_does_not_migrate():
+    # Schema changes and the backfill run once at startup (prepare_database), not in every
+    # worker that imports the app
+    path = os.path.join(tempfile.mkdtemp(), 'fresh.db')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path)
+    assert subprocess.run([sys.executable, '-c', 'import app'], env=env, capture_output=True).returncode == 0
+    assert not os.path.exists(path) or sqlite3.connect(path).execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'table'").fetchone() == (0,)
+    assert subprocess.run([sys.executable, 'migrations.py'], env=env, capture_output=True).returncode == 0
+    tables = {name for name, in sqlite3.connect(path).execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'prediction', 'symptom', 'prediction_symptom'} <= tables
+
+if __name__ == "__main__":
+    test_mask_round_trip()
+    test_history_decodes_and_filters(reset_app())
+    test_predict_stores_every_name(reset_app())
+    test_import_does_not_migrate()
+    print("SUCCESS: symptom encoding works.")
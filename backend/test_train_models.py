@@ -0,0 +1,32 @@
+import numpy as np
+from sklearn.metrics import accuracy_score
+from train_models import generate_synthetic_ids, deduplicate, fit_weights, model_fit_args, build_models, fit_model, predict_labels, disease_names
+
+# Deduplicated training (--dedupe) must score like fitting every row: the counts are
+# rescaled to mean 1, so the SVC keeps its effective C
+
+def fit_and_score(X_train, train_ids, weights, X_test, y_test):
+    fit_args = model_fit_args(X_train, disease_names[train_ids], weights, svc_samples=2000, seed=0)
+    return {
+        name: accuracy_score(y_test, predict_labels(fit_model(name, model, *fit_args[name])[1], X_test))
+        for name, model in build_models(1).items()
+    }
+
+def test_dedupe_matches_full_fit():
+    X, disease_ids = generate_synthetic_ids(6000, seed=3)
+    X_test, y_test = X[5000:], disease_names[disease_ids[5000:]]
+    full = fit_and_score(X[:5000], disease_ids[:5000], None, X_test, y_test)
+    deduped = fit_and_score(*deduplicate(X[:5000], disease_ids[:5000]), X_test, y_test)
+    for name in full:
+        assert abs(full[name] - deduped[name]) <= 0.02, (name, full[name], deduped[name])
+
+def test_fit_weights_mean_one():
+    assert fit_weights(None) is None
+    weights = fit_weights(np.array([1.0, 3.0, 8.0]))
+    assert np.isclose(weights.mean(), 1)
+    assert np.allclose(weights / weights[0], [1, 3, 8])
+
+if __name__ == "__main__":
+    test_dedupe_matches_full_fit()
+    test_fit_weights_mean_one()
+    print("SUCCESS: deduplicated training matches fitting every row.")
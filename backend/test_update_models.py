@@ -0,0 +1,36 @@
+from conftest import reset_app
+from app import app, db, Prediction
+from update_models import stream_new_predictions, recent_ids
+
+# The update job's checkpoint: rows that commit after a run with an id below its
+# checkpoint are picked up by the next run, rows already folded in are not read twice
+
+def add(*ids):
+    with app.app_context():
+        db.session.add_all([Prediction(id=i, user_id=1, disease='Flu', symptoms='cough') for i in ids])
+        db.session.commit()
+
+def run(last_id, folded, window, chunk_size=2):
+    # One job run: (new checkpoint, ids folded in, ids to list in the checkpoint)
+    with app.app_context():
+        ids = [row.id for rows in stream_new_predictions(last_id, chunk_size, window, folded) for row in rows]
+    last_id = max([last_id] + ids)
+    return last_id, ids, set(recent_ids(last_id, folded.union(ids), window))
+
+def test_late_commits_picked_up(fresh_app):
+    # 3 and 6 got their ids first but commit after the first run
+    add(1, 2, 4, 5, 7)
+    last_id, ids, folded = run(0, set(), window=5)
+    assert ids == [1, 2, 4, 5, 7] and last_id == 7 and folded == {4, 5, 7}
+    add(3, 6, 8)
+    last_id, ids, folded = run(last_id, folded, window=5)
+    assert ids == [3, 6, 8] and last_id == 8 and folded == {4, 5, 6, 7, 8}
+    # Nothing new: nothing read twice
+    assert run(last_id, folded, window=5)[1] == []
+    # Without a window (checkpoints from before it) only ids above the checkpoint
+    add(9)
+    assert run(last_id, set(), window=0)[1] == [9]
+
+if __name__ == "__main__":
+    test_late_commits_picked_up(reset_app())
+    print("SUCCESS: update checkpoint works.")
@@ -0,0 +1,116 @@
+import threading
+import time
+from write_behind import WriteBehindQueue
+
+# Buffered rows reach write_batch in batches, on size, on time and on close
+
+class Recorder:
+    def __init__(self, fail=None):
+        self.batches = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        if self.fail:
+            self.fail(batch)
+        with self.lock:
+            self.batches.append(list(batch))
+
+    @property
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+def test_flush_on_size():
+    writes = Recorder()
+    queue = WriteBehindQueue(writes, max_batch=10, max_delay=60)
+    for i in range(25):
+        queue.put(i)
+    deadline = time.monotonic() + 5
+    while len(writes.rows) < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writes.batches[:2] == [list(range(10)), list(range(10, 20))]
+    assert queue.stats()['depth'] == 5
+    queue.close()
+    assert writes.rows == list(range(25))
+
+def test_flush_on_time():
+    writes = Recorder()
+    queue = WriteBehindQueue(writes, max_batch=1000, max_delay=0.05)
+    start = time.monotonic()
+    queue.put('row')
+    while not writes.rows and time.monotonic() - start < 5:
+        time.sleep(0.005)
+    assert writes.rows == ['row']
+    assert time.monotonic() - start < 1
+    stats = queue.stats()
+    assert stats['written'] == 1 and stats['flushes'] == 1 and stats['depth'] == 0
+    queue.close()
+
+def test_sync_mode_writes_before_returning():
+    writes = Recorder()
+    queue = WriteBehindQueue(writes, mode='sync')
+    queue.put('row')
+    assert writes.rows == ['row']
+
+def test_transient_errors_retried_bad_rows_dropped():
+    attempts = []
+    def fail(batch):
+        attempts.append(len(batch))
+        if len(attempts) == 1:
+            raise ConnectionError("database restarting")
+        if 'bad' in batch:
+            raise ValueError("constraint violated")
+    writes = Recorder(fail)
+    queue = WriteBehindQueue(writes, max_batch=10, max_delay=60, mode='async',
+                             is_transient=lambda e: isinstance(e, ConnectionError))
+    for row in ('a', 'bad', 'b'):
+        queue.put(row)
+    queue.close()
+    assert writes.rows == ['a', 'b']
+    assert queue.stats()['dropped'] == 1
+
+def test_outage_keeps_batch_whole():
+    # More failures than max_retries: the writer waits the outage out instead of
+    # splitting the batch into single-row retries
+    attempts = []
+    def fail(batch):
+        attempts.append(len(batch))
+        if len(attempts) <= 6:
+            raise ConnectionError("database down")
+    writes = Recorder(fail)
+    queue = WriteBehindQueue(writes, max_batch=10, max_delay=0.01, max_retries=2, backoff=0.001,
+                             is_transient=lambda e: isinstance(e, ConnectionError))
+    for row in ('a', 'b', 'c'):
+        queue.put(row)
+    deadline = time.monotonic() + 5
+    while not writes.rows and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writes.batches == [['a', 'b', 'c']]
+    assert attempts == [3] * 7
+    assert queue.stats()['dropped'] == 0
+    queue.close()
+
+def test_full_buffer_sheds_without_blocking():
+    release = threading.Event()
+    writes = Recorder(lambda batch: release.wait(5))
+    queue = WriteBehindQueue(writes, max_batch=1, max_delay=0, max_queue=3)
+    queue.put(0)
+    time.sleep(0.05)  # the writer is now stuck on row 0
+    start = time.monotonic()
+    for i in range(1, 11):
+        queue.put(i)
+    assert time.monotonic() - start < 0.5
+    stats = queue.stats()
+    assert stats['shed'] == 7 and stats['depth'] == 3
+    release.set()
+    queue.close()
+    assert writes.rows == [0, 1, 2, 3]
+
+if __name__ == "__main__":
+    test_flush_on_size()
+    test_flush_on_time()
+    test_sync_mode_writes_before_returning()
+    test_transient_errors_retried_bad_rows_dropped()
+    test_outage_keeps_batch_whole()
+    test_full_buffer_sheds_without_blocking()
+    print("SUCCESS: write-behind queue works.")
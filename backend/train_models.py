@@ -1,12 +1,18 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.svm import SVC
 from sklearn.naive_bayes import GaussianNB
 from sklearn.metrics import accuracy_score
+from joblib import Parallel, delayed
+from scipy import sparse
+import argparse
 import joblib
 import os
+import time
+from model_registry import publish_version, MODELS_FILE, SYMPTOMS_FILE, KERNELS_FILE, SMOKE_TEST_FILE
+from numpy_scoring import save_kernels
+from inference import file_fingerprint, accepts_sparse, dense_chunks, densify, model_input
 
 # Define symptoms and diseases
 # This is a simplified synthetic dataset for demonstration
@@ -31,65 +37,222 @@ extra_symptoms = ['runny_nose', 'sneezing', 'stomach_pain', 'sensitivity_to_ligh
 symptoms_list.extend(extra_symptoms)
 symptoms_list = sorted(list(set(symptoms_list)))
 
-def generate_synthetic_data(num_samples=1000):
-    data = []
-    labels = []
-    
-    for _ in range(num_samples):
-        disease = np.random.choice(list(diseases.keys()))
-        disease_symptoms = diseases[disease]
-        
-        # Create a sample vector
-        sample = {symptom: 0 for symptom in symptoms_list}
-        
-        # Randomly select some symptoms from the disease profile
-        # We assume a patient has most but maybe not all symptoms
-        num_present = np.random.randint(1, len(disease_symptoms) + 1)
-        present_symptoms = np.random.choice(disease_symptoms, num_present, replace=False)
-        
-        for s in present_symptoms:
-            if s in sample:
-                sample[s] = 1
-                
-        # Add some noise (random unrelated symptoms) - very low probability
-        if np.random.random() < 0.1:
-            random_symptom = np.random.choice(symptoms_list)
-            sample[random_symptom] = 1
-            
-        data.append(list(sample.values()))
-        labels.append(disease)
-        
-    return np.array(data), np.array(labels)
-
-def train_models():
-    print("Generating synthetic data...")
-    X, y = generate_synthetic_data()
-    
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    models = {
-        'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42),
+# Profile slots per disease as symptom column ids (padded with -1), for vectorized sampling
+disease_names = np.array(list(diseases.keys()), dtype=object)
+profile_lengths = np.array([len(diseases[d]) for d in disease_names])
+profile_columns = np.full((len(diseases), profile_lengths.max()), -1)
+for i, d in enumerate(disease_names):
+    profile_columns[i, :len(diseases[d])] = [symptoms_list.index(s) if s in symptoms_list else -1 for s in diseases[d]]
+
+# Rows of CSR input densified at a time for models that need dense input
+DENSIFY_CHUNK_ROWS = 10000
+
+def vocabulary(size=None):
+    # The disease symptoms padded with placeholder findings, to exercise large vocabularies
+    if size is None or size <= len(symptoms_list):
+        return list(symptoms_list)
+    return symptoms_list + [f'finding_{i:05d}' for i in range(size - len(symptoms_list))]
+
+def generate_chunk(rng, n, n_symptoms=None, as_sparse=False):
+    # Same sampling scheme as before, for n samples at once
+    n_symptoms = n_symptoms or len(symptoms_list)
+    disease_ids = rng.integers(len(disease_names), size=n)
+    lengths = profile_lengths[disease_ids]
+
+    # A patient has a random non-empty subset of the disease profile: rank random keys
+    # per profile slot and keep the num_present lowest (padding slots always rank last)
+    num_present = rng.integers(1, lengths + 1)
+    keys = rng.random((n, profile_columns.shape[1]))
+    keys[np.arange(profile_columns.shape[1]) >= lengths[:, None]] = np.inf
+    chosen = keys.argsort(axis=1).argsort(axis=1) < num_present[:, None]
+
+    rows, slots = np.nonzero(chosen)
+    columns = profile_columns[disease_ids[rows], slots]
+    rows, columns = rows[columns >= 0], columns[columns >= 0]
+
+    # Add some noise (random unrelated symptoms) - very low probability
+    noisy = np.flatnonzero(rng.random(n) < 0.1)
+    rows = np.concatenate([rows, noisy])
+    columns = np.concatenate([columns, rng.integers(n_symptoms, size=len(noisy))])
+
+    if as_sparse:
+        X = sparse.csr_matrix((np.ones(len(rows), dtype=np.uint8), (rows, columns)), shape=(n, n_symptoms))
+        X.sum_duplicates()
+        X.data[:] = 1
+        return X, disease_ids
+    X = np.zeros((n, n_symptoms), dtype=np.uint8)
+    X[rows, columns] = 1
+    return X, disease_ids
+
+def generate_synthetic_ids(num_samples=1000, seed=None, chunk_size=1_000_000, n_symptoms=None, as_sparse=False):
+    # Chunked so the temporary sampling arrays stay bounded whatever num_samples is
+    rng = np.random.default_rng(seed)
+    n_symptoms = n_symptoms or len(symptoms_list)
+    chunks = []
+    for start in range(0, num_samples, chunk_size):
+        chunks.append(generate_chunk(rng, min(chunk_size, num_samples - start), n_symptoms, as_sparse))
+    if not chunks:
+        X = sparse.csr_matrix((0, n_symptoms), dtype=np.uint8) if as_sparse else np.zeros((0, n_symptoms), dtype=np.uint8)
+        return X, np.zeros(0, dtype=np.uint8)
+    disease_ids = np.concatenate([ids for _, ids in chunks]).astype(np.uint8)
+    if as_sparse:
+        return sparse.vstack([X for X, _ in chunks], format='csr'), disease_ids
+    return np.concatenate([X for X, _ in chunks]), disease_ids
+
+def generate_synthetic_data(num_samples=1000, seed=None, chunk_size=1_000_000, n_symptoms=None, as_sparse=False):
+    X, disease_ids = generate_synthetic_ids(num_samples, seed, chunk_size, n_symptoms, as_sparse)
+    return X, disease_names[disease_ids]
+
+def row_keys(X, disease_ids):
+    # One fixed-width key per (symptom vector, disease) row, compared with np.unique
+    if sparse.issparse(X):
+        # Sorted column ids padded with -1; rows only have a handful of symptoms each
+        X = sparse.csr_matrix(X)
+        X.sort_indices()
+        nnz = np.diff(X.indptr)
+        keys = np.full((X.shape[0], nnz.max(initial=0) + 1), -1, dtype=np.int64)
+        rows = np.repeat(np.arange(X.shape[0]), nnz)
+        keys[rows, np.arange(len(rows)) - X.indptr[rows]] = X.indices
+        keys[:, -1] = disease_ids
+        return keys
+    packed = np.packbits(X, axis=1, bitorder='little')
+    if packed.shape[1] < 8:
+        # Small vocabularies pack into a single uint64 per row
+        keys = np.zeros((len(X), 8), dtype=np.uint8)
+        keys[:, :packed.shape[1]] = packed
+        keys[:, 7] = disease_ids
+        return keys.view(np.uint64).ravel()
+    return np.hstack([packed, disease_ids[:, None]])
+
+def deduplicate(X, disease_ids):
+    # Binary symptom vectors repeat a lot: reduce to unique (vector, disease) pairs with
+    # their counts, which are used as sample weights so fitting follows the number of
+    # patterns rather than rows. Opt-in (--dedupe); see fit_weights.
+    keys = row_keys(X, disease_ids)
+    _, first, counts = np.unique(keys, axis=0 if keys.ndim == 2 else None, return_index=True, return_counts=True)
+    return X[first], disease_ids[first], counts.astype(np.float64)
+
+def fit_weights(weights):
+    # Counts rescaled to mean 1 for each fit: sample_weight multiplies the SVC's C, so raw
+    # counts would loosen its regularization compared with fitting every row
+    return None if weights is None else weights / weights.mean()
+
+def model_fit_args(X_train, y_train, weights, svc_samples, seed):
+    # The SVC scales quadratically in rows, so it trains on a bounded random subsample
+    svc_rows = np.random.default_rng(seed).permutation(X_train.shape[0])[:svc_samples]
+    return {
+        name: (X_train[svc_rows], y_train[svc_rows], None if weights is None else fit_weights(weights[svc_rows]))
+        if name == 'SVC' else (X_train, y_train, fit_weights(weights))
+        for name in ('RandomForest', 'SVC', 'NaiveBayes')
+    }
+
+def build_models(jobs):
+    return {
+        'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=jobs),
         'SVC': SVC(probability=True, random_state=42),
         'NaiveBayes': GaussianNB()
     }
-    
-    trained_models = {}
-    
+
+def fit_model(name, model, X, y, sample_weight):
+    start = time.perf_counter()
+    if sparse.issparse(X) and not accepts_sparse(model):
+        # Densify step for models without CSR support (GaussianNB): feed bounded dense
+        # chunks through partial_fit so a large vocabulary never needs one dense matrix
+        classes = np.unique(y)
+        for offset, X_dense in dense_chunks(X, DENSIFY_CHUNK_ROWS):
+            end = offset + X_dense.shape[0]
+            model.partial_fit(X_dense, y[offset:end], classes=classes,
+                              sample_weight=None if sample_weight is None else sample_weight[offset:end])
+    else:
+        model.fit(X, y, sample_weight=sample_weight)
+    return name, model, time.perf_counter() - start
+
+def predict_labels(model, X):
+    # Chunked so densified CSR input stays bounded
+    return np.concatenate([
+        model.predict(model_input(model, X[start:start + DENSIFY_CHUNK_ROWS]))
+        for start in range(0, max(X.shape[0], 1), DENSIFY_CHUNK_ROWS)
+    ])
+
+def train_models(num_samples=1000, jobs=1, seed=42, svc_samples=20000, dedupe=False, as_sparse=False, vocabulary_size=None):
+    timings = {}
+
+    def stage(name, start):
+        timings[name] = time.perf_counter() - start
+        print(f"  {name}: {timings[name]:.2f}s")
+
+    symptoms = vocabulary(vocabulary_size)
+    print(f"Generating {num_samples} synthetic samples over {len(symptoms)} symptoms...")
+    start = time.perf_counter()
+    X, disease_ids = generate_synthetic_ids(num_samples, seed=seed, n_symptoms=len(symptoms), as_sparse=as_sparse)
+    stage('generate', start)
+
+    start = time.perf_counter()
+    order = np.random.default_rng(seed).permutation(num_samples)
+    n_test = int(num_samples * 0.2)
+    test_rows, train_rows = order[:n_test], order[n_test:]
+    if dedupe:
+        X_train, train_ids, weights = deduplicate(X[train_rows], disease_ids[train_rows])
+        X_test, test_ids, test_weights = deduplicate(X[test_rows], disease_ids[test_rows])
+    else:
+        X_train, train_ids, weights = X[train_rows], disease_ids[train_rows], None
+        X_test, test_ids, test_weights = X[test_rows], disease_ids[test_rows], None
+    y_train, y_test = disease_names[train_ids], disease_names[test_ids]
+    stage('prepare', start)
+    print(f"  {X_train.shape[0]} training rows" + (f" ({int(weights.sum())} samples)" if dedupe else ""))
+
+    fit_args = model_fit_args(X_train, y_train, weights, svc_samples, seed)
+
+    # One process per model; the forest also builds its trees on the remaining cores
     print("Training models...")
-    for name, model in models.items():
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
-        acc = accuracy_score(y_test, y_pred)
-        print(f"{name} Accuracy: {acc:.4f}")
+    start = time.perf_counter()
+    models = build_models(max(1, jobs - 2))
+    fitted = Parallel(n_jobs=min(jobs, len(models)))(
+        delayed(fit_model)(name, model, *fit_args[name]) for name, model in models.items()
+    )
+    stage('fit', start)
+
+    # With deduplication the weighted accuracy over unique patterns covers the whole test split
+    start = time.perf_counter()
+    trained_models = {}
+    for name, model, seconds in fitted:
+        if name == 'RandomForest':
+            # Serve single-threaded; web workers already run requests in parallel
+            model.set_params(n_jobs=None)
+        acc = accuracy_score(y_test, predict_labels(model, X_test), sample_weight=test_weights)
+        print(f"{name} Accuracy: {acc:.4f} (fit {seconds:.2f}s)")
         trained_models[name] = model
-        
-    # Save artifacts
-    if not os.path.exists('models'):
-        os.makedirs('models')
-        
-    joblib.dump(trained_models, 'models/disease_prediction_models.pkl')
-    joblib.dump(symptoms_list, 'models/symptoms_list.pkl')
-    print("Models and symptoms list saved to 'models/' directory.")
+    stage('evaluate', start)
+
+    smoke_rows = test_rows[:200]
+    # Save artifacts as a new model version; running backends pick it up without a restart
+    def write_artifacts(path):
+        joblib.dump(trained_models, os.path.join(path, MODELS_FILE))
+        joblib.dump(symptoms, os.path.join(path, SYMPTOMS_FILE))
+        save_kernels(trained_models, os.path.join(path, KERNELS_FILE), file_fingerprint(os.path.join(path, MODELS_FILE)))
+        # Held-out vectors the registry checks before activating this version
+        joblib.dump({
+            'symptom_sets': [[symptoms[i] for i in np.flatnonzero(row)] for row in densify(X[smoke_rows])],
+            'expected': list(disease_names[disease_ids[smoke_rows]]),
+            'min_accuracy': 0.7
+        }, os.path.join(path, SMOKE_TEST_FILE))
+
+    start = time.perf_counter()
+    version = publish_version('models', write_artifacts)
+    stage('save', start)
+    print(f"Models and symptoms list saved as version {version} in 'models/versions/'.")
+    print("Stage timings: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return trained_models
 
 if __name__ == "__main__":
-    train_models()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--svc-samples', type=int, default=20000, help="Max training rows for the SVC")
+    parser.add_argument('--dedupe', action='store_true', help="Fit on unique patterns weighted by their counts")
+    parser.add_argument('--sparse', action='store_true', help="Generate and fit on CSR matrices")
+    parser.add_argument('--vocabulary-size', type=int, help="Pad the symptom list with placeholder findings")
+    args = parser.parse_args()
+    train_models(args.samples, args.jobs, args.seed, args.svc_samples, args.dedupe,
+                 args.sparse, args.vocabulary_size)
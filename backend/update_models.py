@@ -0,0 +1,124 @@
+import argparse
+import os
+import shutil
+import time
+import joblib
+import numpy as np
+from app import app, db, Prediction
+from inference import DiseaseEnsemble, densify, file_fingerprint
+from model_registry import (
+    latest_version, version_path, publish_version,
+    MODELS_FILE, SYMPTOMS_FILE, KERNELS_FILE, SMOKE_TEST_FILE, CHECKPOINT_FILE
+)
+from numpy_scoring import save_kernels
+
+# Incremental update job: folds the Prediction rows stored since the last run into the
+# models that support partial_fit (GaussianNB) and publishes the result as a new model
+# version. RandomForest and SVC have no incremental fit and are carried over as-is.
+# Each run reads only rows with an id above the checkpoint saved in the parent version,
+# so the work follows the number of new rows, not the size of the history.
+# Run it periodically (cron, scheduler) from the backend directory.
+#
+# The labels are not ground truth: Prediction.disease is the ensemble's own answer, as
+# no user ever confirms a diagnosis. So this is self-training. It pulls GaussianNB
+# towards what the ensemble already answers for the symptom sets users really submit,
+# and it cannot correct the ensemble's mistakes; it reinforces them. Keep --weight low
+# against the synthetic training data, and retrain with train_models.py to reset.
+
+# Ids are assigned on INSERT but rows only become visible on COMMIT, so a row with an id
+# below the checkpoint can still appear after a run (a slow write-behind flush, another
+# transaction). Each run re-reads this many ids below the checkpoint and skips the ones
+# the checkpoint lists as already folded in.
+SAFETY_WINDOW = 10000
+
+def read_checkpoint(path):
+    # (last prediction id, ids within SAFETY_WINDOW below it that were already folded in).
+    # Checkpoints written before the window existed do not list those ids: None.
+    checkpoint_path = os.path.join(path, CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint_path):
+        return 0, set()
+    checkpoint = joblib.load(checkpoint_path)
+    recent = checkpoint.get('recent_ids')
+    return checkpoint['last_prediction_id'], set(recent) if recent is not None else None
+
+def stream_new_predictions(after_id, chunk_size, window=0, folded=()):
+    # Keyset pagination on the primary key: each chunk is one indexed range scan. Starts
+    # window ids below after_id and leaves out the ids in folded.
+    after_id = max(0, after_id - window)
+    while True:
+        rows = db.session.query(Prediction.id, Prediction.disease, Prediction.symptoms) \
+            .filter(Prediction.id > after_id).order_by(Prediction.id).limit(chunk_size).all()
+        if not rows:
+            return
+        after_id = rows[-1].id
+        rows = [row for row in rows if row.id not in folded]
+        if rows:
+            yield rows
+
+def recent_ids(last_id, ids, window):
+    # The ids the next run must skip when it re-reads the window below last_id
+    return sorted(i for i in ids if i > last_id - window)
+
+def update_models(parent_version=None, chunk_size=5000, weight=1.0):
+    parent_version = parent_version or latest_version('models')
+    parent_path = version_path('models', parent_version)
+    models = joblib.load(os.path.join(parent_path, MODELS_FILE))
+    symptoms_list = joblib.load(os.path.join(parent_path, SYMPTOMS_FILE))
+    ensemble = DiseaseEnsemble(models, symptoms_list)
+    incremental = {name: model for name, model in models.items() if hasattr(model, 'partial_fit')}
+    last_id, folded = read_checkpoint(parent_path)
+    # Without the list of folded ids the window would fold rows in twice
+    window = SAFETY_WINDOW if folded is not None else 0
+    folded = folded or set()
+    print(f"Updating {', '.join(incremental) or 'no models'} from version {parent_version}, "
+          f"predictions after id {last_id} (and late ones from the {window} before it)...")
+
+    start = time.perf_counter()
+    used, skipped = 0, 0
+    seen = []
+    with app.app_context():
+        for rows in stream_new_predictions(last_id, chunk_size, window, folded):
+            last_id = max(last_id, rows[-1].id)
+            seen = recent_ids(last_id, seen + [row.id for row in rows], SAFETY_WINDOW)
+            symptom_sets = [row.symptoms.split(',') if row.symptoms else [] for row in rows]
+            diseases = np.array([row.disease for row in rows], dtype=object)
+            X = densify(ensemble.vectorize(symptom_sets))
+            for model in incremental.values():
+                # partial_fit cannot add classes, so diseases the model never saw are skipped
+                known = np.isin(diseases, model.classes_)
+                if known.any():
+                    model.partial_fit(X[known], diseases[known], sample_weight=np.full(known.sum(), weight))
+            known = np.isin(diseases, ensemble.classes)
+            used += int(known.sum())
+            skipped += int((~known).sum())
+
+    if used == 0:
+        print("No new predictions to learn from, nothing published.")
+        return None
+    print(f"Folded in {used} predictions ({skipped} skipped) in {time.perf_counter() - start:.2f}s")
+
+    def write_artifacts(path):
+        joblib.dump(models, os.path.join(path, MODELS_FILE))
+        joblib.dump(symptoms_list, os.path.join(path, SYMPTOMS_FILE))
+        save_kernels(models, os.path.join(path, KERNELS_FILE), file_fingerprint(os.path.join(path, MODELS_FILE)))
+        smoke_path = os.path.join(parent_path, SMOKE_TEST_FILE)
+        if os.path.exists(smoke_path):
+            shutil.copy(smoke_path, os.path.join(path, SMOKE_TEST_FILE))
+        joblib.dump({'last_prediction_id': last_id, 'parent_version': parent_version, 'rows': used,
+                     'recent_ids': recent_ids(last_id, folded.union(seen), SAFETY_WINDOW)},
+                    os.path.join(path, CHECKPOINT_FILE))
+
+    version = publish_version('models', write_artifacts)
+    print(f"Published version {version} (checkpoint at prediction id {last_id}). "
+          f"Run build_lookup_table.py --version {version} to precompute its lookup table.")
+    return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--version', default=None, help="Parent model version (default: newest)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Prediction rows read per query")
+    parser.add_argument('--weight', type=float, default=1.0,
+                        help="Sample weight per stored prediction, relative to one synthetic training sample. "
+                             "Stored labels are the ensemble's own answers, not confirmed diagnoses")
+    args = parser.parse_args()
+    update_models(args.version, args.chunk_size, args.weight)
@@ -0,0 +1,173 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+# Write-behind buffer for audit-style inserts (predictions, skin analyses, diet plans):
+# requests hand over their row and respond without waiting for the database. A
+# background thread writes the buffered rows in one transaction when max_batch rows
+# are waiting or the oldest has waited max_delay seconds. close() (gunicorn worker_exit,
+# atexit) writes whatever is left, so only a hard kill loses up to max_delay of rows.
+# While the database is unavailable the writer keeps its batch and retries with backoff;
+# rows arriving meanwhile are buffered up to max_queue and shed (counted) beyond that,
+# so requests never wait for the database.
+# mode='sync' writes every row in the caller before returning, e.g. for tests that
+# read their own writes.
+
+
+class WriteBehindQueue:
+    def __init__(self, write_batch, max_batch=500, max_delay=0.2, max_queue=10000, mode='async',
+                 is_transient=lambda error: False, max_retries=5, backoff=0.1):
+        # write_batch(items) inserts all items in one transaction or raises.
+        # is_transient(error) tells a database outage (retry later) from a bad row.
+        # The writer thread retries transient errors until they stop; max_retries only
+        # bounds the retries of sync mode and of the final writes on close.
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.mode = mode
+        self.is_transient = is_transient
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._pid = None
+        self._thread = None
+        self._closing = False
+        # Counters for health reporting
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.shed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def _ensure_worker(self):
+        # One writer thread per (gunicorn) worker process, like MicroBatcher
+        with self._cond:
+            if self._pid != os.getpid():
+                self._items = deque()
+                self._closing = False
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def put(self, item):
+        if self.mode == 'sync':
+            self._write([item])
+            return
+        if self._pid != os.getpid():
+            self._ensure_worker()
+        with self._cond:
+            if not self._closing:
+                if len(self._items) >= self.max_queue:
+                    # Database slower than the request rate, or down: lose the row rather
+                    # than hold the request
+                    self.shed += 1
+                    if self.shed % 1000 == 1:
+                        print(f"Write-behind buffer full, {self.shed} rows shed so far")
+                    return
+                self._items.append((time.monotonic(), item))
+                if len(self._items) == 1 or len(self._items) >= self.max_batch:
+                    self._cond.notify()
+                return
+        # Shutting down: the writer thread is finishing, write in the caller
+        self._write([item])
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._items and not self._closing:
+                self._cond.wait()
+            if not self._closing:
+                flush_at = self._items[0][0] + self.max_delay
+                while len(self._items) < self.max_batch and not self._closing:
+                    remaining = flush_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            return [self._items.popleft()[1] for _ in range(min(len(self._items), self.max_batch))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+            elif self._closing:
+                return
+
+    def _write(self, batch):
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                self.failed_flushes += 1
+                if self.is_transient(e):
+                    # Database unavailable: the whole batch waits, it is not the rows' fault
+                    attempt += 1
+                    if attempt <= self.max_retries or (self.mode != 'sync' and not self._closing):
+                        print(f"Write-behind flush of {len(batch)} rows failed, retrying: {e}")
+                        time.sleep(min(self.backoff * 2 ** (attempt - 1), 5))
+                        continue
+                    self.dropped += len(batch)
+                    print(f"Write-behind dropped {len(batch)} rows after {attempt} attempts: {e}")
+                    return
+                if len(batch) > 1:
+                    # Isolate the bad row(s): write the rest one by one
+                    for item in batch:
+                        self._write([item])
+                    return
+                self.dropped += 1
+                print(f"Write-behind dropped a row: {e}")
+                return
+            elapsed = (time.perf_counter() - start) * 1000
+            self.written += len(batch)
+            self.flushes += 1
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self.total_flush_ms += elapsed
+            return
+
+    def flush(self):
+        # Write everything buffered so far in the caller's thread
+        while True:
+            with self._cond:
+                batch = [self._items.popleft()[1] for _ in range(min(len(self._items), self.max_batch))]
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout=10):
+        # Graceful shutdown: stop buffering, let the writer drain, then write any rest here
+        with self._cond:
+            if self._closing or self._pid != os.getpid():
+                return
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._items)
+            oldest = time.monotonic() - self._items[0][0] if self._items else 0.0
+        return {
+            'mode': self.mode,
+            'depth': depth,
+            'oldest_ms': round(oldest * 1000, 1),
+            'written': self.written,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'dropped': self.dropped,
+            'shed': self.shed,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'mean_flush_ms': round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            'max_flush_ms': round(self.max_flush_ms, 2)
+        }
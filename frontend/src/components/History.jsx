@@ -8,6 +8,9 @@ const History = () => {
     const [history, setHistory] = useState([]);
     const [dietHistory, setDietHistory] = useState([]);
     const [skinHistory, setSkinHistory] = useState([]);
+    // Id to pass as ?before= for the next page of each tab, null when there is none
+    const [nextBefore, setNextBefore] = useState({ symptoms: null, diet: null, skin: null });
+    const [loadingMore, setLoadingMore] = useState(false);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
 
@@ -28,6 +31,7 @@ const History = () => {
             setHistory(symptomData.history);
             setDietHistory(dietData.history);
             setSkinHistory(skinData.history);
+            setNextBefore({ symptoms: symptomData.next_before, diet: dietData.next_before, skin: skinData.next_before });
             setLoading(false);
         } catch (err) {
             console.error("Failed to fetch history", err);
@@ -40,6 +44,25 @@ const History = () => {
         fetchHistory();
     }, []);
 
+    const loadMore = async (type) => {
+        const endpoints = { symptoms: 'history', diet: 'diet-history', skin: 'skin-history' };
+        const setters = { symptoms: setHistory, diet: setDietHistory, skin: setSkinHistory };
+        const shown = { symptoms: history, diet: dietHistory, skin: skinHistory }[type];
+        // Continue after the oldest row still shown; next_before may have been deleted since
+        const before = shown.length ? shown[shown.length - 1].id : nextBefore[type];
+        setLoadingMore(true);
+        try {
+            const response = await fetch(`${config.API_URL}/${endpoints[type]}?before=${before}`, { credentials: 'include' });
+            if (!response.ok) throw new Error("Failed to fetch history");
+            const data = await response.json();
+            setters[type](items => [...items, ...data.history]);
+            setNextBefore(cursors => ({ ...cursors, [type]: data.next_before }));
+        } catch (err) {
+            console.error("Failed to fetch more history", err);
+        }
+        setLoadingMore(false);
+    };
+
     const handleDelete = async (id, type) => {
         if (!window.confirm("Are you sure you want to delete this record?")) return;
 
@@ -166,6 +189,16 @@ const History = () => {
                     </div>
                 )
             )}
+
+            {nextBefore[activeTab] && (
+                <button
+                    onClick={() => loadMore(activeTab)}
+                    disabled={loadingMore}
+                    className="w-full py-2 text-sm font-medium text-primary hover:text-primary/80 disabled:text-gray-400"
+                >
+                    {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+            )}
         </div>
     );
 };